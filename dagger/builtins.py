@@ -0,0 +1,34 @@
+"""declares served by every dagger server"""
+from dagger.declare import declare
+
+__all__ = ("fetch", "close_cursor", "put", "release", "subscribe", "unsubscribe")
+
+
+@declare(name="dagger.fetch")
+def fetch(cursor, n=0):
+    """fetch next ``n`` items of a server side cursor, return ``[items, done]``"""
+
+
+@declare(name="dagger.close_cursor")
+def close_cursor(cursor):
+    """release a server side cursor"""
+
+
+@declare(name="dagger.put")
+def put(handle, data):
+    """store packed object ``data`` in server with ``handle``"""
+
+
+@declare(name="dagger.release")
+def release(handle):
+    """remove stored object"""
+
+
+@declare(name="dagger.subscribe")
+def subscribe(topic):
+    """push messages published to ``topic`` through the connection"""
+
+
+@declare(name="dagger.unsubscribe")
+def unsubscribe(topic):
+    """stop pushing messages of ``topic`` through the connection"""
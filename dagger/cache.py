@@ -0,0 +1,212 @@
+import enum
+import time
+from collections import OrderedDict, defaultdict
+from typing import NamedTuple, Optional, Dict, Any, Hashable
+
+__all__ = ("CacheOptions", "CacheStats", "CacheState", "ResultCache", "make_cache_options")
+
+
+class CacheOptions(NamedTuple):
+    # seconds an entry stays fresh
+    ttl: float = 60
+    max_entries: int = 1024
+    # 0 means no limit
+    max_bytes: int = 0
+    # lru or lfu
+    eviction: str = "lru"
+    # seconds an expired entry is still served while it is refreshed in background
+    stale: float = 0
+    # share entries between server workers, ``max_entries``, ``max_bytes``, ``eviction`` and
+    # ``stale`` are decided by the shared cache then.
+    shared: bool = False
+
+
+def make_cache_options(cache) -> Optional[CacheOptions]:
+    """accept ``None``, ``bool``, ``dict`` or ``CacheOptions``"""
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return CacheOptions()
+    if isinstance(cache, dict):
+        cache = CacheOptions(**cache)
+    if not isinstance(cache, CacheOptions):
+        raise TypeError(f"invalid cache options: {cache!r}")
+    if cache.eviction not in _POLICIES:
+        raise ValueError(f"invalid eviction policy: {cache.eviction}")
+    return cache
+
+
+class CacheState(enum.IntEnum):
+    MISS = 0
+    FRESH = 1
+    STALE = 2
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "stale_hits", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.stale_hits + self.misses
+        if not total:
+            return 0.0
+        return (self.hits + self.stale_hits) / total
+
+    def __str__(self):
+        return (
+            f"<{self.__class__.__name__} hits={self.hits} stale-hits={self.stale_hits} "
+            f"misses={self.misses} evictions={self.evictions} hit-ratio={self.hit_ratio:.4f}>"
+        )
+
+    __repr__ = __str__
+
+
+class _LRU:
+    __slots__ = ("_keys",)
+
+    def __init__(self):
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        self._keys[key] = None
+
+    def touch(self, key):
+        self._keys.move_to_end(key)
+
+    def remove(self, key):
+        del self._keys[key]
+
+    def victim(self):
+        return next(iter(self._keys))
+
+
+class _LFU:
+    """O(1) least frequently used, ties are broken by least recently used"""
+
+    __slots__ = ("_freq", "_buckets", "_min")
+
+    def __init__(self):
+        self._freq: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, OrderedDict] = defaultdict(OrderedDict)
+        self._min = 0
+
+    def add(self, key):
+        self._freq[key] = 1
+        self._buckets[1][key] = None
+        self._min = 1
+
+    def touch(self, key):
+        freq = self._freq[key]
+        self._unlink(key, freq)
+        if self._min == freq and freq not in self._buckets:
+            self._min = freq + 1
+        self._freq[key] = freq + 1
+        self._buckets[freq + 1][key] = None
+
+    def remove(self, key):
+        self._unlink(key, self._freq.pop(key))
+
+    def _unlink(self, key, freq):
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+
+    def victim(self):
+        if self._min not in self._buckets:
+            self._min = min(self._buckets)
+        return next(iter(self._buckets[self._min]))
+
+
+_POLICIES = {"lru": _LRU, "lfu": _LFU}
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expire_at")
+
+    def __init__(self, value, size: int, expire_at: float):
+        self.value = value
+        self.size = size
+        self.expire_at = expire_at
+
+
+class ResultCache:
+    """Bounded cache with ttl, stale window and lru/lfu eviction. It is not thread safe."""
+
+    def __init__(self, options: CacheOptions, clock=time.monotonic):
+        self.options = options
+        self.stats = CacheStats()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._policy = _POLICIES[options.eviction]()
+        self._memory = 0
+        self._clock = clock
+        # keys being refreshed in background
+        self.refreshing = set()
+
+    @property
+    def memory(self) -> int:
+        return self._memory
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def lookup(self, key) -> (CacheState, Any):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return CacheState.MISS, None
+
+        now = self._clock()
+        if now < entry.expire_at:
+            self.stats.hits += 1
+            self._policy.touch(key)
+            return CacheState.FRESH, entry.value
+
+        if now < entry.expire_at + self.options.stale:
+            self.stats.stale_hits += 1
+            self._policy.touch(key)
+            return CacheState.STALE, entry.value
+
+        self.stats.misses += 1
+        self.discard(key)
+        return CacheState.MISS, None
+
+    def put(self, key, value, size: int = 0):
+        options = self.options
+        if options.max_bytes and size > options.max_bytes:
+            return
+        if key in self._entries:
+            self.discard(key)
+
+        # make room before insert, otherwise lfu always evicts the new entry
+        entries = self._entries
+        policy = self._policy
+        while entries and (
+            len(entries) >= options.max_entries
+            or (options.max_bytes and self._memory + size > options.max_bytes)
+        ):
+            self.discard(policy.victim())
+            self.stats.evictions += 1
+
+        entries[key] = _Entry(value, size, self._clock() + options.ttl)
+        policy.add(key)
+        self._memory += size
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._policy.remove(key)
+            self._memory -= entry.size
+
+    def clear(self):
+        for key in list(self._entries):
+            self.discard(key)
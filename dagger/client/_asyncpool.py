@@ -1,15 +1,23 @@
 import asyncio
-from collections import Counter, deque
+import weakref
+from collections import deque
 from functools import partial
-from typing import Optional, Dict, Tuple, NamedTuple, Any, Deque
+from typing import Optional, Dict, Tuple, NamedTuple, Any, Deque, List
 
+from dagger.client._balancer import Endpoint
 from dagger.client._syncpool import BasePool
 
 from dagger.client._configuration import ClientConfiguration
-from dagger.client._request import Request
+from dagger.client._cursor import AsyncCursor
+from dagger.client._hedge import Hedging
+from dagger.client._request import Request, make_put_request, make_release_request
+from dagger.client._request import next_sequence_id
+from dagger.client._subscription import AsyncSubscription
 from dagger.parser import Parser, ParserProtocol
-from dagger.codec import decode_header, Header, EventType, unpack_payload
-from dagger.exceptions import FrameError, get_exception_from_code
+from dagger.codec import decode_header, encode_header, Header, EventType, unpack_payload
+from dagger.codec import ObjectRef
+from dagger.exceptions import FrameError, ObjectNotFound, CircuitOpenError
+from dagger.flowcontrol import FlowControl
 from dagger.logger import logger
 
 __all__ = ("DefaultClientProtocol",)
@@ -27,6 +35,13 @@ class DefaultClientProtocol(asyncio.Protocol, ParserProtocol):
         "configuration",
         "_parser",
         "_waiters",
+        "_requests",
+        "_subscriptions",
+        "outstanding",
+        "endpoint",
+        "flow",
+        "last_active",
+        "rtt",
     )
     header_size = 8
     parser_class = Parser
@@ -38,36 +53,76 @@ class DefaultClientProtocol(asyncio.Protocol, ParserProtocol):
         self._parser = self.parser_class(self)
 
         self._waiters: Dict[int, asyncio.Future] = {}
+        # requests decode their own responses
+        self._requests: Dict[int, Request] = {}
+        self._subscriptions: Dict[str, List[AsyncSubscription]] = {}
+        # requests assigned by pool and not finished
+        self.outstanding = 0
+        self.endpoint: Optional[Endpoint] = None
+        self.flow: Optional[FlowControl] = None
+        self.last_active = 0.0
+        # moving average of ping round trip seconds
+        self.rtt = 0.0
 
     def closed(self):
         return self._transport.is_closing()
 
+    def close(self):
+        self._transport.close()
+
     @property
     def loop(self) -> asyncio.AbstractEventLoop:
         return self.configuration.loop
 
     # parser protocol
 
+    _accept_event_types = frozenset(
+        (
+            EventType.RESPONSE,
+            EventType.NOT_MODIFIED,
+            EventType.PUBLISH,
+            EventType.PONG,
+            EventType.FILE,
+        )
+    )
+
     def parse_header(self, data: bytes) -> (int, Header):
         header = decode_header(data)
-        if header.event_type != EventType.RESPONSE:
+        if header.event_type not in self._accept_event_types:
             raise FrameError("expect %s, got %d" % (EventType.RESPONSE, header.event_type))
 
         return header.payload_size, header
 
+    def spill_payload(self, header: Header) -> bool:
+        return header.event_type == EventType.FILE
+
     def parse_payload(self, header: Header, data: bytes):
-        body = unpack_payload(header.compress_flag, data)
+        if header.event_type == EventType.PUBLISH:
+            return Message(0, unpack_payload(header.compress_flag, data), 0)
+        if header.event_type == EventType.PONG:
+            return Message(header.sequence_number, None, 0)
 
-        if header.errno:
-            exc = get_exception_from_code(header.errno)
-            body = exc(body)
+        request = self._requests.pop(header.sequence_number, None)
+        if request is None:
+            # waiter has gone, skip decoding
+            return Message(header.sequence_number, None, header.errno)
 
+        body = request.unpack_response(header, data)
         return Message(header.sequence_number, body, header.errno)
 
     def on_message_complete(self, header: Header, message: Message):
+        if header.event_type == EventType.PUBLISH:
+            topic, ob = message.body
+            for subscription in self._subscriptions.get(topic, ()):
+                subscription.feed(ob)
+            return
+
         fut = self._waiters.get(message.sequence_number)
         if fut is None:
             return
+        if fut.done():
+            del self._waiters[message.sequence_number]
+            return
 
         if message.error:
             fut.set_exception(message.body)
@@ -80,9 +135,12 @@ class DefaultClientProtocol(asyncio.Protocol, ParserProtocol):
 
     def connection_made(self, transport: asyncio.Transport) -> None:
         self._transport = transport
+        self.flow = FlowControl(transport)
+        self.last_active = self.loop.time()
 
     def data_received(self, data: bytes) -> None:
         logger.debug("Connection recv data: %s, size=%d", self, len(data))
+        self.last_active = self.loop.time()
         self._parser.feed_data(data)
 
     def connection_lost(self, exc):
@@ -92,24 +150,127 @@ class DefaultClientProtocol(asyncio.Protocol, ParserProtocol):
         for fut in self._waiters.values():
             if not fut.done():
                 fut.set_exception(exc)
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.set_exception(exc)
 
+        # wake up stream writers waiting for drain
+        self.flow.resume_writing()
         logger.debug("Connection lost: %s, exc=%r", self.getpeername(), exc)
 
+    def pause_writing(self):
+        self.flow.pause_writing()
+
+    def resume_writing(self):
+        self.flow.resume_writing()
+
     # request sender
     async def dispatch_request(self, request: Request):
+        try:
+            return await self._dispatch_request(request)
+        except ObjectNotFound:
+            refs = request.object_refs()
+            if not refs:
+                raise
+        # objects are stored in the worker process which the connection is linked to.
+        for ref in refs:
+            await self._dispatch_request(make_put_request(ref))
+        return await self._dispatch_request(request)
+
+    async def ping(self) -> float:
+        """send a PING and return seconds until the PONG arrives"""
+        if self._transport.is_closing():
+            raise ConnectionError("connection lost")
+        loop = self.loop
+        seq = next_sequence_id()
+        fut = self._waiters[seq] = loop.create_future()
+        start = loop.time()
+        self._transport.write(encode_header(0, seq, 0, 0, EventType.PING.value))
+        try:
+            await fut
+        finally:
+            self._waiters.pop(seq, None)
+        rtt = loop.time() - start
+        self.rtt = rtt if not self.rtt else self.rtt * 0.8 + rtt * 0.2
+        return rtt
+
+    async def subscribe(self, subscription: AsyncSubscription):
+        # one subscription of a topic per connection in server
+        subscriptions = self._subscriptions.setdefault(subscription.topic, [])
+        subscriptions.append(subscription)
+        if len(subscriptions) > 1:
+            return
+        try:
+            await self._dispatch_request(subscription._subscribe_request())
+        except BaseException:
+            del self._subscriptions[subscription.topic]
+            raise
+
+    async def unsubscribe(self, subscription: AsyncSubscription):
+        subscriptions = self._subscriptions.get(subscription.topic)
+        if not subscriptions or subscription not in subscriptions:
+            return
+        subscriptions.remove(subscription)
+        if subscriptions:
+            return
+        del self._subscriptions[subscription.topic]
+        if not self._transport.is_closing():
+            await self._dispatch_request(subscription._unsubscribe_request())
+
+    async def _dispatch_request(self, request: Request):
+        if self.flow.write_paused:
+            # transport buffer is full, server is reading slowly
+            await self.flow.drain()
         fut = self._send_request(request)
+        if request.stream:
+            try:
+                await self._send_chunks(request, fut)
+            except BaseException:
+                self._waiters.pop(request.sequence_number, None)
+                self._requests.pop(request.sequence_number, None)
+                raise
         return await fut
 
+    async def _send_chunks(self, request, fut: asyncio.Future):
+        chunks = request.chunks
+        transport = self._transport
+        flow = self.flow
+        try:
+            if hasattr(chunks, "__aiter__"):
+                async for chunk in chunks:
+                    if fut.done() or transport.is_closing():
+                        break
+                    if flow.write_paused:
+                        await flow.drain()
+                    transport.write(request.pack_chunk(chunk))
+            else:
+                for chunk in chunks:
+                    if fut.done() or transport.is_closing():
+                        break
+                    if flow.write_paused:
+                        await flow.drain()
+                    transport.write(request.pack_chunk(chunk))
+        finally:
+            # server releases the stream only after end frame received.
+            if not transport.is_closing():
+                transport.write(request.pack_end())
+
     def _send_request(self, request: Request) -> asyncio.Future:
         if request.sequence_number in self._waiters:
             raise RuntimeError("sequence id is duplicated")
         if self._transport.is_closing():
             raise ConnectionError("connection lost")
 
-        payload = request.pack()
+        if self.endpoint is not None and self.endpoint.unix:
+            payload = request.pack(self.configuration.shm_threshold)
+        else:
+            payload = request.pack()
         self._transport.write(payload)
-        fut = self.loop.create_future()
+        loop = self.loop
+        self.last_active = loop.time()
+        fut = loop.create_future()
         self._waiters[request.sequence_number] = fut
+        self._requests[request.sequence_number] = request
         return fut
 
     def getpeername(self):
@@ -127,10 +288,27 @@ class DefaultClientProtocol(asyncio.Protocol, ParserProtocol):
 
 
 class AsyncPool(BasePool):
+    """Fixed number of multiplexed connections.
+
+    Request is sent through the connection with least outstanding requests, a new
+    connection is opened only for an empty or closed slot. Requests wait in arrival order
+    when every connection has ``connection_concurrency`` outstanding requests, or there are
+    ``max_inflight`` outstanding requests in total.
+    """
+
     def __init__(self, configuration: ClientConfiguration, protocol_factory=None):
         super().__init__(configuration)
-        self._counter = Counter()
-        self._conns: Deque[DefaultClientProtocol] = deque(maxlen=configuration.pool_size)
+        # connection slots of each endpoint
+        self._conns: Dict[Endpoint, List[Optional[DefaultClientProtocol]]] = {
+            endpoint: [None] * configuration.pool_size for endpoint in self.balancer.endpoints
+        }
+        self._connecting: Dict[Tuple[Endpoint, int], asyncio.Future] = {}
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.inflight = 0
+        self._refused = False
+        self._health_check: Optional[asyncio.Task] = None
+        self._keepalive: Optional[asyncio.Task] = None
+        self.hedging = Hedging(configuration)
         if protocol_factory:
             self._protocol_factory = protocol_factory
         else:
@@ -140,42 +318,338 @@ class AsyncPool(BasePool):
     def loop(self) -> asyncio.AbstractEventLoop:
         return self._configuration.loop
 
-    def is_busy(self):
-        if not self._conns:
-            return True
-        if len(self._conns) == self._conns.maxlen:
-            return False
-        for conn, count in self._counter.items():
-            if count > 8:
-                return True
-        return False
-
-    async def _make_new_connection(self):
-        host = self._configuration.host
-        port = self._configuration.port
+    @property
+    def size(self) -> int:
+        """number of open connections"""
+        return sum(
+            1
+            for slots in self._conns.values()
+            for conn in slots
+            if conn is not None and not conn.closed()
+        )
+
+    async def warm_up(self):
+        """open all connections, failed ones are opened again when they are needed"""
+        rv = await asyncio.gather(
+            *(
+                self._connect(endpoint, i)
+                for endpoint, slots in self._conns.items()
+                for i in range(len(slots))
+            ),
+            return_exceptions=True,
+        )
+        for exc in rv:
+            if isinstance(exc, Exception):
+                logger.warning("warm up connection failed: %r", exc)
+                break
         loop = self.loop
-        transport, protocol = await loop.create_connection(self._protocol_factory, host, port)
+        if self._health_check is None and self._health_check_needed():
+            self._health_check = loop.create_task(
+                _run_periodically(weakref.ref(self), "health_check_interval", "check_health")
+            )
+        if self._keepalive is None and self._configuration.keepalive_interval:
+            self._keepalive = loop.create_task(
+                _run_periodically(weakref.ref(self), "keepalive_interval", "keepalive")
+            )
+
+    async def check_health(self):
+        balancer = self.balancer
+        timeout = min(self._configuration.health_check_interval, 3)
+        for endpoint in balancer.endpoints:
+            try:
+                transport, _ = await asyncio.wait_for(
+                    _open_connection(self.loop, asyncio.Protocol, endpoint),
+                    timeout,
+                )
+            except (OSError, asyncio.TimeoutError):
+                balancer.set_health(endpoint, False)
+            else:
+                transport.close()
+                balancer.set_health(endpoint, True)
+        balancer.check_outliers()
+
+    async def keepalive(self):
+        """ping idle connections, dead ones are closed before requests are sent on them"""
+        interval = self._configuration.keepalive_interval
+        deadline = self.loop.time() - interval
+        await asyncio.gather(
+            *(
+                self._ping(conn, min(interval, 3))
+                for slots in self._conns.values()
+                for conn in slots
+                if conn is not None
+                and not conn.closed()
+                and not conn.outstanding
+                and conn.last_active <= deadline
+            )
+        )
+
+    async def _ping(self, conn: DefaultClientProtocol, timeout: float):
+        try:
+            rtt = await asyncio.wait_for(conn.ping(), timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            logger.warning("close dead connection %s: %r", conn, exc)
+            conn.close()
+            conn.endpoint.record(0.0, True)
+        else:
+            conn.endpoint.record_rtt(rtt)
+
+    async def _make_new_connection(self, endpoint: Endpoint):
+        loop = self.loop
+        transport, protocol = await asyncio.wait_for(
+            _open_connection(loop, self._protocol_factory, endpoint),
+            self._configuration.connect_timeout or None,
+        )
+        protocol.endpoint = endpoint
         return protocol
 
+    async def _connect(self, endpoint: Endpoint, index: int) -> DefaultClientProtocol:
+        # concurrent callers share one connecting of the slot
+        key = (endpoint, index)
+        fut = self._connecting.get(key)
+        if fut is None:
+            fut = self._connecting[key] = self.loop.create_task(
+                self._make_new_connection(endpoint)
+            )
+            fut.add_done_callback(partial(self._connected, key))
+        try:
+            return await asyncio.shield(fut)
+        except (OSError, asyncio.TimeoutError):
+            endpoint.record(0.0, True)
+            raise
+
+    def _connected(self, key: Tuple[Endpoint, int], fut: asyncio.Future):
+        del self._connecting[key]
+        if not fut.cancelled() and fut.exception() is None:
+            endpoint, index = key
+            self._conns[endpoint][index] = fut.result()
+
+    async def _try_acquire(
+        self, request: Request = None, exclude: DefaultClientProtocol = None, connect=True
+    ) -> Optional[DefaultClientProtocol]:
+        """``None`` if no connection is available, empty slots are not opened if not ``connect``"""
+        max_inflight = self._configuration.max_inflight
+        if max_inflight and self.inflight >= max_inflight:
+            self._refused = True
+            return None
+        # reserved before connecting, concurrent callers see it
+        self.inflight += 1
+        try:
+            conn = await self._select(request, exclude, connect)
+        except BaseException:
+            self._unreserve()
+            raise
+        if conn is None:
+            self._unreserve()
+        return conn
+
+    def _unreserve(self):
+        self.inflight -= 1
+        if self._refused:
+            # the caller may be refused by the reservation
+            self._refused = False
+            self._wakeup()
+
+    async def _select(
+        self, request: Request, exclude: Optional[DefaultClientProtocol], connect: bool
+    ) -> Optional[DefaultClientProtocol]:
+        endpoint = self.balancer.select(request)
+        slots = self._conns[endpoint]
+        concurrency = self._configuration.connection_concurrency
+        while True:
+            best = None
+            empty = None
+            for index, conn in enumerate(slots):
+                if conn is None or conn.closed():
+                    slots[index] = None
+                    if empty is None:
+                        empty = index
+                    continue
+                if conn is exclude:
+                    continue
+                if best is None or (conn.outstanding, conn.rtt) < (best.outstanding, best.rtt):
+                    best = conn
+            if empty is None or not connect or (best is not None and not best.outstanding):
+                break
+            # concurrent callers share the new connection, select again after it is open
+            try:
+                await self._connect(endpoint, empty)
+            except (OSError, asyncio.TimeoutError):
+                if best is None or best.closed() or best.outstanding >= concurrency:
+                    raise
+                # the open one still has room
+                break
+
+        if best is None or best.outstanding >= concurrency:
+            return None
+        best.outstanding += 1
+        endpoint.outstanding += 1
+        return best
+
+    async def _acquire(self, request: Request = None) -> DefaultClientProtocol:
+        if not self._waiters:
+            conn = await self._try_acquire(request)
+            if conn is not None:
+                return conn
+
+        waiter = self.loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            while True:
+                await waiter
+                conn = await self._try_acquire(request)
+                if conn is not None:
+                    return conn
+                # keep position
+                waiter = self.loop.create_future()
+                self._waiters.appendleft(waiter)
+        except BaseException:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+            elif not waiter.cancelled():
+                # pass the wakeup to the next one
+                self._wakeup()
+            raise
+
+    def _release(self, conn: DefaultClientProtocol):
+        conn.outstanding -= 1
+        conn.endpoint.outstanding -= 1
+        self.inflight -= 1
+        self._wakeup()
+
+    def _wakeup(self):
+        waiters = self._waiters
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def submit(self, request: Request) -> asyncio.Future:
+        return self.loop.create_task(self.dispatch_request(request))
+
+    async def subscribe(self, topic: str, maxsize: int = 0) -> AsyncSubscription:
+        conn = await self._acquire()
+        try:
+            subscription = AsyncSubscription(conn, topic, maxsize)
+            await conn.subscribe(subscription)
+        finally:
+            self._release(conn)
+        return subscription
+
+    async def release_object(self, ref: ObjectRef):
+        """release ``ref`` through every open connection, the object may be uploaded again
+        to the worker of any of them
+        """
+        conns = [
+            conn
+            for slots in self._conns.values()
+            for conn in slots
+            if conn is not None and not conn.closed()
+        ]
+        if not conns:
+            await self.dispatch_request(make_release_request(ref))
+            return
+        await asyncio.gather(*(conn.dispatch_request(make_release_request(ref)) for conn in conns))
+
     async def dispatch_request(self, request: Request):
         # args should be checking in declare
-        if self.is_busy():
-            conn = await self._make_new_connection()
+        hedging = self.hedging
+        delay = hedging.delay(request.method)
+        if delay is None:
+            start = self.loop.time()
+            conn = await self._acquire(request)
+            rv = await self._send(conn, request)
+            # p95 of a declare hedged by observed latency is not known yet
+            hedging.record(request.method, self.loop.time() - start)
         else:
-            conn = self._conns.popleft()
-            if conn.closed():
-                conn = await self._make_new_connection()
-
-        self._conns.append(conn)
-        fut = conn.dispatch_request(request)
-        self._counter.update((conn,))
+            conn, rv = await self._dispatch_hedged(request, delay)
+        if request.cursor:
+            handle, page, done = rv
+            page_size = self._configuration.cursor_page_size
+            return AsyncCursor(conn, handle, page, done, page_size)
+        return rv
+
+    async def _send(self, conn: DefaultClientProtocol, request: Request):
+        start = self.loop.time()
         try:
-            rv = await fut
-        except Exception:
-            if conn.closed():
-                self._conns.remove(conn)
-                self._counter.pop(conn, None)
+            rv = await conn.dispatch_request(request)
+        except asyncio.CancelledError:
+            # the losing hedge, its latency is unknown
+            raise
+        except BaseException as e:
+            conn.endpoint.record(self.loop.time() - start, isinstance(e, OSError))
             raise
         else:
-            self._counter.subtract((conn,))
-            return rv
+            conn.endpoint.record(self.loop.time() - start, False)
+        finally:
+            self._release(conn)
+        return rv
+
+    async def _dispatch_hedged(self, request: Request, delay: float):
+        hedging = self.hedging
+        hedging.earn()
+        loop = self.loop
+        start = loop.time()
+        conn = await self._acquire(request)
+        first = loop.create_task(self._send(conn, request))
+        tasks = {first: conn}
+        try:
+            done, _ = await asyncio.wait((first,), timeout=delay)
+            hedge_conn = None
+            if not done and hedging.acquire():
+                # a hedge never waits for a connection
+                try:
+                    hedge_conn = await self._try_acquire(request, exclude=conn, connect=False)
+                except (OSError, CircuitOpenError):
+                    pass
+            if hedge_conn is None:
+                rv = await first
+            else:
+                second = loop.create_task(self._send(hedge_conn, request))
+                tasks[second] = hedge_conn
+                pending = set(tasks)
+                winner = None
+                while winner is None:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        # the other one may still succeed
+                        if task.exception() is None or not pending:
+                            winner = task
+                            break
+                if winner is second:
+                    hedging.wins += 1
+                conn = tasks[winner]
+                rv = winner.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+        hedging.record(request.method, loop.time() - start)
+        return conn, rv
+
+
+def _open_connection(loop: asyncio.AbstractEventLoop, protocol_factory, endpoint: Endpoint):
+    if endpoint.unix:
+        return loop.create_unix_connection(protocol_factory, endpoint.host)
+    return loop.create_connection(protocol_factory, endpoint.host, endpoint.port)
+
+
+async def _run_periodically(ref: "weakref.ref[AsyncPool]", option: str, method: str):
+    """call ``method`` of pool every ``option`` seconds until the pool is collected"""
+    while True:
+        pool = ref()
+        if pool is None:
+            return
+        interval = getattr(pool._configuration, option)
+        del pool
+        await asyncio.sleep(interval)
+        pool = ref()
+        if pool is None:
+            return
+        try:
+            await getattr(pool, method)()
+        except Exception as exc:
+            logger.warning("%s failed: %r", method, exc)
+        del pool
@@ -0,0 +1,264 @@
+import bisect
+import hashlib
+import random
+import statistics
+import time
+from itertools import count
+from typing import List, Tuple, Dict
+
+from dagger.client._breaker import CircuitBreaker
+from dagger.codec import pack_object
+from dagger.exceptions import CircuitOpenError
+from dagger.logger import logger
+from dagger.netutils import resolve_uri
+
+__all__ = ("Endpoint", "Balancer", "parse_endpoints")
+
+
+def parse_endpoints(value) -> List[Tuple[str, int]]:
+    """Accept ``"host:port,host:port"`` or a sequence of ``"host:port"`` / ``(host, port)``.
+
+    Endpoints could also be URIs, ``tcp://host:port`` or ``unix:///path/to/socket``, a unix
+    socket is kept as ``(path, 0)``.
+    """
+    if isinstance(value, str):
+        value = [i for i in value.split(",") if i.strip()]
+    rv = []
+    for i in value:
+        if isinstance(i, str):
+            i = i.strip()
+            if "://" in i:
+                uri = resolve_uri(i)
+                if uri.scheme == "unix" and uri.path:
+                    rv.append((uri.path, 0))
+                    continue
+                if uri.scheme != "tcp":
+                    raise ValueError(f"invalid endpoint: {i}")
+                i = (uri.host, uri.port or 0)
+            else:
+                host, _, port = i.rpartition(":")
+                i = (host, port)
+        host, port = i
+        port = int(port)
+        if not host or not 0 < port <= 65535:
+            raise ValueError(f"invalid endpoint: {i}")
+        rv.append((host, port))
+    return rv
+
+
+class Endpoint:
+    """Server address with statistics used by balancer"""
+
+    __slots__ = (
+        "host",
+        "port",
+        "outstanding",
+        "latency",
+        "requests",
+        "errors",
+        "ejected_until",
+        "ejections",
+        "admitted_at",
+        "healthy",
+        "breaker",
+        "rtt",
+    )
+
+    def __init__(self, host: str, port: int, breaker: CircuitBreaker):
+        self.host = host
+        self.port = port
+        self.outstanding = 0
+        # moving average of seconds
+        self.latency = 0.0
+        # counters since last outlier check
+        self.requests = 0
+        self.errors = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.admitted_at = 0.0
+        self.healthy = True
+        self.breaker = breaker
+        # moving average of ping round trip seconds
+        self.rtt = 0.0
+
+    def record(self, latency: float, error: bool):
+        breaker = self.breaker
+        state = breaker.state
+        breaker.record(latency, error)
+        if breaker.state != state:
+            logger.warning("circuit breaker of %s is %s", self, breaker.state)
+        self.requests += 1
+        if error:
+            self.errors += 1
+        else:
+            self.latency = latency if not self.latency else self.latency * 0.8 + latency * 0.2
+
+    @property
+    def unix(self) -> bool:
+        """``host`` is path of an unix socket"""
+        return self.port == 0
+
+    @property
+    def name(self) -> str:
+        if self.unix:
+            return f"unix://{self.host}"
+        return f"{self.host}:{self.port}"
+
+    def record_rtt(self, rtt: float):
+        self.rtt = rtt if not self.rtt else self.rtt * 0.8 + rtt * 0.2
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def selectable(self, now: float) -> bool:
+        return self.available(now) and not self.breaker.blocked(now)
+
+    def weight(self, now: float, slow_start: float) -> float:
+        """traffic share ramps up after the endpoint is admitted again"""
+        if not slow_start or now - self.admitted_at >= slow_start:
+            return 1.0
+        return 0.1 + 0.9 * (now - self.admitted_at) / slow_start
+
+    def eject(self, now: float, eject_time: float):
+        self.ejections += 1
+        self.ejected_until = now + eject_time * self.ejections
+        self.admitted_at = self.ejected_until
+        self.latency = 0.0
+
+    def __str__(self):
+        return (
+            f"<{self.__class__.__name__} {self.name} healthy={self.healthy} "
+            f"outstanding={self.outstanding} latency={self.latency:.6f} "
+            f"rtt={self.rtt:.6f} breaker={self.breaker.state}>"
+        )
+
+    __repr__ = __str__
+
+
+class Balancer:
+    """Choose endpoint for requests.
+
+    Strategies are ``round_robin``, ``least_outstanding``, ``p2c`` (power of two choices)
+    and ``hash`` (consistent hashing on an argument of declare). Unavailable endpoints are
+    skipped, all endpoints are used if none is available.
+    """
+
+    replicas = 64
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.endpoints = [
+            Endpoint(host, port, CircuitBreaker(configuration))
+            for host, port in configuration.endpoint_list()
+        ]
+        self.strategy = configuration.balance
+        self._counter = count()
+        self._ring: List[int] = []
+        self._ring_endpoints: List[Endpoint] = []
+        if self.strategy == "hash":
+            self._build_ring()
+
+    def _build_ring(self):
+        points = []
+        for endpoint in self.endpoints:
+            name = endpoint.name
+            for i in range(self.replicas):
+                points.append((self._hash(f"{name}#{i}".encode()), endpoint))
+        points.sort(key=lambda x: x[0])
+        self._ring = [i[0] for i in points]
+        self._ring_endpoints = [i[1] for i in points]
+
+    @staticmethod
+    def _hash(data: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+    def _candidates(self, now: float) -> List[Endpoint]:
+        slow_start = self.configuration.slow_start
+        rv = [
+            i
+            for i in self.endpoints
+            if i.selectable(now) and random.random() < i.weight(now, slow_start)
+        ]
+        return rv or [i for i in self.endpoints if i.selectable(now)] or self.endpoints
+
+    def select(self, request=None) -> Endpoint:
+        """raise ``CircuitOpenError`` if circuit breaker of the chosen endpoint is open"""
+        now = time.monotonic()
+        endpoint = self._select(request, now)
+        if not endpoint.breaker.allow(now):
+            raise CircuitOpenError(endpoint.name)
+        return endpoint
+
+    def breaker_states(self) -> Dict[str, str]:
+        return {i.name: i.breaker.state for i in self.endpoints}
+
+    def _select(self, request, now: float) -> Endpoint:
+        endpoints = self.endpoints
+        if len(endpoints) == 1:
+            return endpoints[0]
+
+        strategy = self.strategy
+        if strategy == "hash" and request is not None:
+            return self._select_by_hash(request, now)
+
+        candidates = self._candidates(now)
+        if strategy == "round_robin":
+            return candidates[next(self._counter) % len(candidates)]
+        if strategy == "p2c" and len(candidates) > 2:
+            candidates = random.sample(candidates, 2)
+        # ping round trip breaks ties
+        return min(candidates, key=lambda i: (i.outstanding, i.rtt))
+
+    def _select_by_hash(self, request, now: float) -> Endpoint:
+        index = self.configuration.hash_keys.get(request.method, 0)
+        parameters = request.parameters
+        key = parameters[index] if index < len(parameters) else request.method
+        position = bisect.bisect(self._ring, self._hash(pack_object(key)))
+        ring = self._ring_endpoints
+        # next available endpoint clockwise
+        for i in range(len(ring)):
+            endpoint = ring[(position + i) % len(ring)]
+            if endpoint.selectable(now):
+                return endpoint
+        return ring[position % len(ring)]
+
+    def check_outliers(self):
+        """eject endpoints with high error rate or latency, called periodically"""
+        configuration = self.configuration
+        now = time.monotonic()
+        available = [i for i in self.endpoints if i.available(now)]
+        latencies = [i.latency for i in available if i.latency]
+        median = statistics.median(latencies) if len(latencies) > 2 else 0.0
+        # keep at least half of endpoints
+        budget = len(available) - (len(self.endpoints) + 1) // 2
+        for endpoint in available:
+            if budget <= 0:
+                break
+            reason = None
+            if endpoint.requests >= 5:
+                if endpoint.errors / endpoint.requests >= configuration.eject_error_rate:
+                    reason = "error rate"
+            if median and endpoint.latency > median * configuration.eject_latency_factor:
+                reason = "latency"
+            if reason:
+                budget -= 1
+                endpoint.eject(now, configuration.eject_time)
+                logger.warning("eject %s because of %s", endpoint, reason)
+
+        for endpoint in self.endpoints:
+            endpoint.requests = 0
+            endpoint.errors = 0
+            if endpoint.available(now) and endpoint.ejections and now > endpoint.admitted_at:
+                # back to normal after a full slow start period
+                if now - endpoint.admitted_at > configuration.slow_start:
+                    endpoint.ejections = 0
+
+    def set_health(self, endpoint: Endpoint, healthy: bool):
+        if healthy == endpoint.healthy:
+            return
+        endpoint.healthy = healthy
+        if healthy:
+            endpoint.admitted_at = time.monotonic()
+            logger.info("endpoint %s is healthy again", endpoint)
+        else:
+            logger.warning("endpoint %s is unhealthy", endpoint)
@@ -0,0 +1,107 @@
+import time
+from collections import deque
+from typing import Deque
+
+__all__ = ("CircuitBreaker",)
+
+
+class CircuitBreaker:
+    """Stop sending requests to an endpoint failing too often.
+
+    It is ``open`` when the ratio of failed calls in the recent ``window`` calls reaches
+    ``breaker_error_rate``, a call fails by an connection error or by being slower than
+    ``breaker_slow_call``. After ``breaker_open_time`` it is ``half_open`` and lets
+    ``trial_calls`` requests through, it is closed if all of them succeed.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    window = 20
+    min_calls = 10
+    trial_calls = 3
+
+    __slots__ = (
+        "configuration",
+        "state",
+        "opened_at",
+        "opens",
+        "_results",
+        "_failures",
+        "_trials",
+        "_trial_successes",
+    )
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.opens = 0
+        self._results: Deque[bool] = deque(maxlen=self.window)
+        self._failures = 0
+        self._trials = 0
+        self._trial_successes = 0
+
+    def blocked(self, now: float) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if now - self.opened_at < self.configuration.breaker_open_time:
+            return state == self.OPEN or self._trials >= self.trial_calls
+        # trials are lost if no result in time, let in new ones
+        return False
+
+    def allow(self, now: float) -> bool:
+        """check before sending a request, a trial is taken when it is half open"""
+        if self.state == self.CLOSED:
+            return True
+        if self.blocked(now):
+            return False
+        if now - self.opened_at >= self.configuration.breaker_open_time:
+            self.state = self.HALF_OPEN
+            self.opened_at = now
+            self._trials = 0
+            self._trial_successes = 0
+        self._trials += 1
+        return True
+
+    def record(self, latency: float, error: bool):
+        configuration = self.configuration
+        slow_call = configuration.breaker_slow_call
+        failed = error or bool(slow_call and latency > slow_call)
+        state = self.state
+        if state == self.HALF_OPEN:
+            if failed:
+                self._open()
+            else:
+                self._trial_successes += 1
+                if self._trial_successes >= self.trial_calls:
+                    self._close()
+            return
+        if state == self.OPEN or not configuration.breaker_error_rate:
+            return
+
+        results = self._results
+        if len(results) == results.maxlen:
+            self._failures -= results[0]
+        results.append(failed)
+        self._failures += failed
+        if len(results) >= self.min_calls:
+            if self._failures / len(results) >= configuration.breaker_error_rate:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.opens += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._results.clear()
+        self._failures = 0
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} {self.state} opens={self.opens}>"
+
+    __repr__ = __str__
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Dict
+
+from dagger.cache import CacheOptions, CacheState, ResultCache
+from dagger.codec import pack_object, make_etag
+
+__all__ = ("ClientCache",)
+
+
+class ClientCache:
+    """Results of one declare cached by client, identical calls in flight share one request.
+
+    Cached results are shared by callers, they should not be modified. ``stale`` of options
+    is not used, expired entries are fetched again.
+    """
+
+    # result of an inflight request whose leader is cancelled
+    _retry = object()
+
+    def __init__(self, options: CacheOptions):
+        self.options = options
+        self._cache = ResultCache(options)
+        self._mutex = threading.Lock()
+        self._inflight: Dict[bytes, Future] = {}
+        self._async_inflight: Dict[bytes, asyncio.Future] = {}
+        self.deduplicated = 0
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    @staticmethod
+    def make_key(args) -> bytes:
+        return make_etag(pack_object(args))
+
+    def _lookup(self, key: bytes):
+        state, value = self._cache.lookup(key)
+        if state == CacheState.FRESH:
+            return True, value
+        return False, None
+
+    def call(self, key: bytes, dispatch):
+        with self._mutex:
+            hit, value = self._lookup(key)
+            if hit:
+                return value
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.deduplicated += 1
+            else:
+                self._inflight[key] = Future()
+        if fut is not None:
+            return fut.result()
+
+        try:
+            rv = dispatch()
+        except BaseException as e:
+            with self._mutex:
+                self._inflight.pop(key).set_exception(e)
+            raise
+        with self._mutex:
+            self._cache.put(key, rv)
+            self._inflight.pop(key).set_result(rv)
+        return rv
+
+    async def async_call(self, key: bytes, dispatch):
+        while True:
+            hit, value = self._lookup(key)
+            if hit:
+                return value
+            fut = self._async_inflight.get(key)
+            if fut is None:
+                break
+            self.deduplicated += 1
+            rv = await asyncio.shield(fut)
+            if rv is not self._retry:
+                return rv
+            # the leader is cancelled, the first follower dispatches again
+
+        fut = self._async_inflight[key] = asyncio.get_event_loop().create_future()
+        try:
+            rv = await dispatch()
+        except asyncio.CancelledError:
+            # followers are not cancelled
+            fut.set_result(self._retry)
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            # do not warn if there is no follower
+            fut.exception()
+            raise
+        else:
+            self._cache.put(key, rv)
+            fut.set_result(rv)
+            return rv
+        finally:
+            del self._async_inflight[key]
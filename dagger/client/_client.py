@@ -1,48 +1,182 @@
-import socket
-from typing import Optional, List
+import asyncio
+import time
+from functools import partial
+from typing import Optional, List, Dict
 
+from dagger.codec import ObjectRef, pack_object
 from dagger.declare import Declare
+from dagger.client._cache import ClientCache
 from dagger.client._configuration import ClientConfiguration
+from dagger.client._retry import Retrying
 from dagger.client._syncpool import SyncPool, BasePool
-from dagger.client._request import Request
+from dagger.client._request import Request, StreamRequest, ConditionalRequest
+from dagger.client._request import make_put_request
 
 __all__ = ("Client",)
 
 
 class Client:
     request_class = Request
+    stream_request_class = StreamRequest
+    conditional_request_class = ConditionalRequest
 
     def __init__(self):
         self._configuration: Optional[ClientConfiguration] = None
         self._pool: Optional[BasePool] = None
         self._setdeclare: List[Declare] = []
+        # declare name -> client side cache
+        self.caches: Dict[str, ClientCache] = {}
+        self.retrying: Optional[Retrying] = None
 
-    def dispatch_request(self, method: str, args=()):
+    def dispatch_request(
+        self, method: str, args=(), stream=None, cursor=False, conditional=False, idempotent=False
+    ):
         if self._pool is None:
             raise RuntimeError("not initialized")
 
-        request = self.request_class(method, args)
-        max_retry_time = self._configuration.max_retry
-        if max_retry_time != 0:
-            while True:
-                try:
-                    return self._pool.dispatch_request(request)
-                except (ConnectionError, socket.error, TimeoutError, socket.timeout):
-                    max_retry_time -= 1
-                    if max_retry_time == 0:
-                        raise
-        else:
+        if stream is not None:
+            # chunks are consumed while sending, a stream request could not be retried.
+            request = self.stream_request_class(method, args, stream, cursor)
             return self._pool.dispatch_request(request)
 
+        cache = self.caches.get(method)
+        if cache is not None:
+            dispatch = partial(
+                self._dispatch_new_request, method, args, cursor, conditional, idempotent
+            )
+            key = cache.make_key(args)
+            if self._configuration.asynchronous:
+                return cache.async_call(key, dispatch)
+            return cache.call(key, dispatch)
+        return self._dispatch_new_request(method, args, cursor, conditional, idempotent)
+
+    def submit(self, method: str, args=(), cursor=False, conditional=False):
+        """Send request without waiting for it, return a ``concurrent.futures.Future``
+        (``asyncio.Future`` in asynchronous mode). Requests are sent concurrently only by
+        pools with an event loop, cache and retry are not applied.
+        """
+        if self._pool is None:
+            raise RuntimeError("not initialized")
+        return self._pool.submit(self._make_request(method, args, cursor, conditional))
+
+    def map(self, method: str, args_iterable, window=64, ordered=True, conditional=False):
+        """Yield results of calling ``method`` with each arguments of ``args_iterable``,
+        up to ``window`` requests are in flight. Results are yielded in order of arguments,
+        or as they complete if ``ordered`` is false.
+        """
+        if self._pool is None:
+            raise RuntimeError("not initialized")
+        if self._configuration.asynchronous:
+            raise RuntimeError("map is for synchronous mode, gather requests instead")
+        make_request = self._make_request
+        requests = (make_request(method, args, False, conditional) for args in args_iterable)
+        return self._pool.dispatch_many(requests, window, ordered)
+
+    def _make_request(self, method: str, args, cursor: bool, conditional: bool):
+        if conditional:
+            store = self._pool.conditional_store
+            request = self.conditional_request_class(method, args, store, cursor)
+        else:
+            request = self.request_class(method, args, cursor)
+        request.priority = self._configuration.priority or None
+        return request
+
+    def _dispatch_new_request(
+        self, method: str, args, cursor: bool, conditional: bool, idempotent: bool
+    ):
+        request = self._make_request(method, args, cursor, conditional)
+        self.retrying.earn()
+        if self._configuration.asynchronous:
+            return self._async_dispatch_new_request(request, idempotent)
+        attempt = 0
+        while True:
+            try:
+                return self._pool.dispatch_request(request)
+            except Exception as e:
+                attempt += 1
+                delay = self.retrying.backoff(method, e, idempotent, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def _async_dispatch_new_request(self, request: Request, idempotent: bool):
+        attempt = 0
+        while True:
+            try:
+                return await self._pool.dispatch_request(request)
+            except Exception as e:
+                attempt += 1
+                delay = self.retrying.backoff(request.method, e, idempotent, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def put(self, obj) -> ObjectRef:
+        """Upload object to server, the returned reference could be passed as argument of
+        declares instead of the object. Reference is uploaded again automatically when the
+        server handling the call does not have it.
+        """
+        if self._pool is None:
+            raise RuntimeError("not initialized")
+
+        data = pack_object(obj)
+        ref = ObjectRef(ObjectRef.digest(data), obj)
+        rv = self._pool.dispatch_request(make_put_request(ref, data))
+        if self._configuration.asynchronous:
+            return self._wait_put(rv, ref)
+        return ref
+
+    @staticmethod
+    async def _wait_put(fut, ref: ObjectRef) -> ObjectRef:
+        await fut
+        return ref
+
+    def subscribe(self, topic: str, maxsize: int = 0):
+        """Subscribe messages published to ``topic`` by server code.
+
+        Return a subscription iterating messages, it is an awaitable resolving to an
+        asynchronous iterator in asynchronous mode, where at most ``maxsize`` unread messages
+        are kept.
+        """
+        if self._pool is None:
+            raise RuntimeError("not initialized")
+        return self._pool.subscribe(topic, maxsize)
+
+    def breaker_states(self) -> Dict[str, str]:
+        """state of circuit breaker of each endpoint"""
+        if self._pool is None:
+            raise RuntimeError("not initialized")
+        return self._pool.balancer.breaker_states()
+
+    def release(self, ref: ObjectRef):
+        """Remove object stored by ``put`` from workers of all pooled connections, it is an
+        awaitable in asynchronous mode. Workers reached by no connection now evict it by
+        ``object_store_limit``.
+        """
+        if self._pool is None:
+            raise RuntimeError("not initialized")
+        return self._pool.release_object(ref)
+
     def setup(self, configuration: ClientConfiguration):
         self._configuration = configuration
         if configuration.asynchronous:
             from dagger.client._asyncpool import AsyncPool
 
             self._pool = AsyncPool(self._configuration)
+            loop = configuration.loop
+            if loop.is_running():
+                loop.create_task(self._pool.warm_up())
+            else:
+                loop.run_until_complete(self._pool.warm_up())
+        elif configuration.io_thread:
+            from dagger.client._threadedpool import ThreadedPool
+
+            self._pool = ThreadedPool(self._configuration)
         else:
             self._pool = SyncPool(self._configuration)
 
+        self.caches = {k: ClientCache(v) for k, v in configuration.cache_options.items()}
+        self.retrying = Retrying(configuration)
         for declare in configuration.declares:
             declare.setdefault_client(self)
             self._setdeclare.append(declare)
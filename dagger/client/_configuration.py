@@ -1,8 +1,12 @@
 import asyncio
 import importlib
-from typing import Set
+from typing import Set, Dict, List, Tuple, Optional
 
+from dagger.cache import CacheOptions, make_cache_options
+from dagger.client._balancer import parse_endpoints
+from dagger.client._retry import RetryPolicy
 from dagger.configuration import make_property, instance_checker, ConfigBase, int_format
+from dagger.configuration import float_format, choice_format
 from dagger.declare import Declare
 
 __all__ = ("ClientConfiguration",)
@@ -21,12 +25,124 @@ class ClientConfiguration(ConfigBase):
     )
     host: str = make_property("host", doc="remote host", default="127.0.0.1")
 
+    endpoints = make_property(
+        "endpoints",
+        doc="servers as host:port separated by comma, host and port are used if it is empty",
+        formatter=parse_endpoints,
+        default=(),
+    )
+
+    balance = make_property(
+        "balance",
+        doc="how requests are balanced between endpoints",
+        formatter=choice_format("round_robin", "least_outstanding", "p2c", "hash"),
+        default="least_outstanding",
+        parser_options={"choices": ("round_robin", "least_outstanding", "p2c", "hash")},
+    )
+
+    priority = make_property(
+        "priority",
+        doc="priority class of requests, server uses the lower of it and the class of declare, "
+        "empty means the class of declare",
+        formatter=choice_format("", *Declare.PRIORITIES),
+        default="",
+        parser_options={"choices": ("", *Declare.PRIORITIES)},
+    )
+
+    health_check_interval = make_property(
+        "health_check_interval",
+        doc="seconds between health checks and outlier detection of endpoints, 0 disables",
+        formatter=float_format(min=0),
+        default=5,
+    )
+
+    eject_error_rate = make_property(
+        "eject_error_rate",
+        doc="eject endpoint whose connection error rate in a check interval reaches it",
+        formatter=float_format(min=0, max=1),
+        default=0.5,
+    )
+
+    eject_latency_factor = make_property(
+        "eject_latency_factor",
+        doc="eject endpoint whose latency is this times of the median",
+        formatter=float_format(min=1),
+        default=3.0,
+    )
+
+    eject_time = make_property(
+        "eject_time",
+        doc="seconds an endpoint is ejected, multiplied by consecutive ejections",
+        formatter=float_format(min=0),
+        default=30,
+    )
+
+    slow_start = make_property(
+        "slow_start",
+        doc="seconds for traffic of an admitted endpoint to ramp up to its full share",
+        formatter=float_format(min=0),
+        default=30,
+    )
+
+    keepalive_interval = make_property(
+        "keepalive_interval",
+        doc="ping connections idle for this seconds to keep them open and measure round trip "
+        "time, it should be less than max_idle_time of server, 0 disables",
+        formatter=float_format(min=0),
+        default=20,
+    )
+
+    breaker_error_rate = make_property(
+        "breaker_error_rate",
+        doc="open circuit breaker of an endpoint when its ratio of failed calls reaches it, "
+        "0 disables",
+        formatter=float_format(min=0, max=1),
+        default=0.5,
+    )
+
+    breaker_slow_call = make_property(
+        "breaker_slow_call",
+        doc="calls slower than this seconds are failed for circuit breaker, 0 disables",
+        formatter=float_format(min=0),
+        default=0,
+    )
+
+    breaker_open_time = make_property(
+        "breaker_open_time",
+        doc="seconds calls to an endpoint fail immediately before trial calls",
+        formatter=float_format(min=0),
+        default=5,
+    )
+
+    hedge_budget = make_property(
+        "hedge_budget",
+        doc="max ratio of hedged requests to all requests",
+        formatter=float_format(min=0, max=1),
+        default=0.05,
+    )
+
     log_level = make_property("log_level", doc="logging level", default="INFO")
 
     pool_size = make_property(
         "pool_size", formatter=int_format(min=1), doc="max pool size", default=12
     )
 
+    connection_concurrency = make_property(
+        "connection_concurrency",
+        formatter=int_format(min=1),
+        doc="outstanding requests of one connection in asynchronous mode, requests wait "
+        "when every connection reaches it",
+        default=128,
+    )
+
+    max_inflight = make_property(
+        "max_inflight",
+        formatter=int_format(min=0),
+        doc="outstanding requests of the client in asynchronous mode or with io_thread, "
+        "more requests wait for a slot, 0 disables",
+        default=2048,
+    )
+
     asynchronous = make_property(
         "asynchronous",
         doc="use asynchronous mode",
@@ -34,8 +150,23 @@ class ClientConfiguration(ConfigBase):
         parser_options={"action": "store_true"},
     )
 
+    io_thread = make_property(
+        "io_thread",
+        doc="in synchronous mode, multiplex requests of all threads over pooled connections "
+        "driven by a background thread",
+        default=False,
+        parser_options={"action": "store_true"},
+    )
+
     timeout = make_property("timeout", doc="timeout", default=300, formatter=int_format(min=0))
 
+    connect_timeout = make_property(
+        "connect_timeout",
+        doc="seconds to wait for connecting to an endpoint",
+        default=30,
+        formatter=float_format(min=0),
+    )
+
     max_retry = make_property(
         "max_retry",
         doc="retry this times when connection error",
@@ -43,14 +174,110 @@ class ClientConfiguration(ConfigBase):
         formatter=int_format(min=0),
     )
 
+    retry_backoff = make_property(
+        "retry_backoff",
+        doc="seconds of the first retry backoff, doubled for each retry and jittered",
+        default=0.05,
+        formatter=float_format(min=0),
+    )
+
+    retry_max_backoff = make_property(
+        "retry_max_backoff",
+        doc="max seconds of retry backoff",
+        default=2.0,
+        formatter=float_format(min=0),
+    )
+
+    retry_budget = make_property(
+        "retry_budget",
+        doc="max ratio of retries to all requests",
+        default=0.1,
+        formatter=float_format(min=0, max=1),
+    )
+
+    shm_threshold = make_property(
+        "shm_threshold",
+        doc="numpy arrays of at least this bytes are passed through shared memory files to "
+        "endpoints on unix sockets, 0 disables",
+        default=0,
+        formatter=int_format(min=0),
+    )
+
+    cursor_page_size = make_property(
+        "cursor_page_size",
+        doc="number of items fetched once from a server side cursor",
+        default=1000,
+        formatter=int_format(min=1),
+    )
+
+    conditional_cache_size = make_property(
+        "conditional_cache_size",
+        doc="max number of local copies kept for conditional declares",
+        default=1024,
+        formatter=int_format(min=1),
+    )
+
     def __init__(self):
         self.declares: Set[Declare] = set()
+        # declare name -> options of client side cache
+        self.cache_options: Dict[str, CacheOptions] = {}
+        # declare name -> index of argument hashed by ``hash`` balance
+        self.hash_keys: Dict[str, int] = {}
+        # declare name -> hedge delay, ``None`` means observed p95 latency
+        self.hedges: Dict[str, Optional[float]] = {}
+        # declare name -> retry settings overriding the client ones
+        self.retries: Dict[str, RetryPolicy] = {}
+
+    def endpoint_list(self) -> List[Tuple[str, int]]:
+        return list(self.endpoints) or [(self.host, self.port)]
+
+    def set_hash_key(self, declare: Declare, index: int = 0):
+        """requests of ``declare`` with the same argument at ``index`` go to one endpoint"""
+        assert isinstance(declare, Declare)
+        self.hash_keys[declare.name] = index
 
     def register_declares(self, *declares: Declare):
         for declare in declares:
             assert isinstance(declare, Declare)
             self.declares.add(declare)
 
+    def set_cache(self, declare: Declare, cache=True):
+        """cache results of ``declare`` in client, ``cache`` accepts the same values as
+        ``Declare.set_server_impl``, ``None`` or ``False`` disables it.
+        """
+        assert isinstance(declare, Declare)
+        options = make_cache_options(cache)
+        if options is None:
+            self.cache_options.pop(declare.name, None)
+            return
+        if declare.stream or declare.cursor:
+            raise TypeError(f"Result of declare({declare.name}) could not be shared.")
+        self.cache_options[declare.name] = options
+        self.declares.add(declare)
+
+    def set_hedge(self, declare: Declare, delay: Optional[float] = None):
+        """Send request of ``declare`` again through another connection if no response
+        arrives in ``delay`` seconds, or the observed p95 latency if it is ``None``. The first
+        response is used. It only works in asynchronous mode or with ``io_thread``.
+        """
+        assert isinstance(declare, Declare)
+        if not declare.idempotent or declare.stream or declare.cursor:
+            raise TypeError(f"Declare({declare.name}) could not be hedged.")
+        self.hedges[declare.name] = delay
+        self.declares.add(declare)
+
+    def set_retry(
+        self,
+        declare: Declare,
+        max_retry: Optional[int] = None,
+        backoff: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+    ):
+        """override ``max_retry``, ``retry_backoff`` and ``retry_max_backoff`` for ``declare``"""
+        assert isinstance(declare, Declare)
+        self.retries[declare.name] = RetryPolicy(max_retry, backoff, max_backoff)
+        self.declares.add(declare)
+
     def register_declares_from_module(self, module):
         if isinstance(module, str):
             module = importlib.import_module(module)
@@ -62,6 +289,10 @@ class ClientConfiguration(ConfigBase):
 
     def __del__(self):
         self.declares = None
+        self.cache_options = None
+        self.hash_keys = None
+        self.hedges = None
+        self.retries = None
         for i in dir(self):
             v = getattr(self, i)
             if isinstance(v, property):
@@ -0,0 +1,144 @@
+from dagger import builtins
+from dagger.client._request import Request
+
+__all__ = ("Cursor", "AsyncCursor")
+
+
+class _BaseCursor:
+    request_class = Request
+
+    def __init__(self, conn, handle: bytes, page, done: bool, page_size: int):
+        self._conn = conn
+        self._handle = handle
+        self._page = page
+        self._page_size = page_size
+        self.done = done
+
+    def _fetch_request(self, n: int):
+        return self.request_class(builtins.fetch.name, [self._handle, n or self._page_size])
+
+    def _close_request(self):
+        return self.request_class(builtins.close_cursor.name, [self._handle])
+
+    def _take_page(self):
+        page, self._page = self._page, None
+        return page
+
+    def __str__(self):
+        handle = self._handle.hex() if self._handle else None
+        return f"<{self.__class__.__name__} cursor={handle} done={self.done}>"
+
+    __repr__ = __str__
+
+
+class Cursor(_BaseCursor):
+    """Lazy iterator over a server side cursor.
+
+    The connection is held by the cursor until it is exhausted or closed, because the
+    result only lives in the server process which the connection is linked to.
+    """
+
+    def __init__(self, pool, conn, handle: bytes, page, done: bool, page_size: int):
+        super().__init__(conn, handle, page, done, page_size)
+        self._pool = pool
+        if done:
+            self._release()
+
+    def fetch(self, n: int = 0):
+        """return next page, ``None`` if cursor exhausted"""
+        if self._page is not None:
+            return self._take_page()
+        if self.done:
+            return None
+
+        try:
+            page, done = self._pool.dispatch_on(self._conn, self._fetch_request(n))
+        except Exception:
+            self.done = True
+            self._release()
+            raise
+        if done:
+            self.done = True
+            self._release()
+        return page
+
+    def pages(self):
+        while True:
+            page = self.fetch()
+            if page is None:
+                return
+            yield page
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+    def close(self):
+        if not self.done:
+            self.done = True
+            self._page = None
+            try:
+                self._pool.dispatch_on(self._conn, self._close_request())
+            finally:
+                self._release()
+            return
+        self._release()
+
+    def _release(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release_connection(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # server releases the cursor after ttl.
+        self._release()
+
+
+class AsyncCursor(_BaseCursor):
+    """Lazy asynchronous iterator over a server side cursor."""
+
+    async def fetch(self, n: int = 0):
+        """return next page, ``None`` if cursor exhausted"""
+        if self._page is not None:
+            return self._take_page()
+        if self.done:
+            return None
+
+        try:
+            page, done = await self._conn.dispatch_request(self._fetch_request(n))
+        except Exception:
+            self.done = True
+            raise
+        if done:
+            self.done = True
+        return page
+
+    async def pages(self):
+        while True:
+            page = await self.fetch()
+            if page is None:
+                return
+            yield page
+
+    async def __aiter__(self):
+        async for page in self.pages():
+            for item in page:
+                yield item
+
+    async def close(self):
+        if not self.done:
+            self.done = True
+            self._page = None
+            await self._conn.dispatch_request(self._close_request())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -0,0 +1,59 @@
+from collections import deque
+from typing import Dict, Deque, Optional
+
+__all__ = ("Hedging",)
+
+
+class Hedging:
+    """Decide when a request of an idempotent declare is sent again to another connection.
+
+    Delay is fixed or the observed p95 latency of the declare. Every request earns
+    ``hedge_budget`` token and a hedge costs one, so hedges are at most that ratio of
+    requests.
+    """
+
+    samples = 256
+    min_samples = 20
+    max_tokens = 10.0
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._p95: Dict[str, float] = {}
+        self._recorded: Dict[str, int] = {}
+        self._tokens = 0.0
+        self.hedged = 0
+        # hedges answered before the original request
+        self.wins = 0
+
+    def delay(self, method: str) -> Optional[float]:
+        hedges = self.configuration.hedges
+        if method not in hedges:
+            return None
+        delay = hedges[method]
+        if delay is None:
+            return self._p95.get(method)
+        return delay
+
+    def record(self, method: str, latency: float):
+        if method not in self.configuration.hedges:
+            return
+        latencies = self._latencies.get(method)
+        if latencies is None:
+            latencies = self._latencies[method] = deque(maxlen=self.samples)
+        latencies.append(latency)
+        recorded = self._recorded[method] = self._recorded.get(method, 0) + 1
+        # refresh every 16 samples
+        n = len(latencies)
+        if n >= self.min_samples and recorded % 16 == 0:
+            self._p95[method] = sorted(latencies)[int(n * 0.95)]
+
+    def earn(self):
+        self._tokens = min(self._tokens + self.configuration.hedge_budget, self.max_tokens)
+
+    def acquire(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        self.hedged += 1
+        return True
@@ -1,44 +1,69 @@
-from threading import local
-from typing import Sequence
-
-from dagger.codec import pack_message, EventType, MAX_SEQUENCE_ID
-
-__all__ = ("Request",)
-
-
-def _seq_gen_func():
-    while True:
-        for i in range(MAX_SEQUENCE_ID):
-            yield i
-
-
-_local = local()
+from itertools import count
+from threading import Lock
+from typing import Any, Sequence, Optional, Tuple
+
+from dagger import builtins
+from dagger.cache import CacheOptions, CacheState, ResultCache
+from dagger.codec import pack_message, encode_header, EventType, MAX_SEQUENCE_ID, Header
+from dagger.codec import ObjectRef, pack_object, unpack_payload, make_etag
+from dagger.codec import compress_payload, decompress_payload
+from dagger.exceptions import FrameError, make_remote_exception
+
+__all__ = (
+    "Request",
+    "StreamRequest",
+    "ConditionalRequest",
+    "ConditionalStore",
+    "make_put_request",
+    "make_release_request",
+)
+
+# shared by all threads, requests of threads could be multiplexed over one connection
+_sequence = count()
 
 
 def next_sequence_id():
-    seq_gen = getattr(_local, "seq_gen", None)
-    if seq_gen is None:
-        seq_gen = _local.seq_gen = _seq_gen_func()
-
-    return seq_gen.send(None)
+    return next(_sequence) % MAX_SEQUENCE_ID
 
 
 class Request:
     _missing = object()
     _event_type = EventType.REQUEST.value
+    stream = False
 
-    __slots__ = ("_method", "_parameters", "_sequence_number")
+    __slots__ = ("_method", "_parameters", "_sequence_number", "cursor", "priority")
 
-    def __init__(self, method: str, parameters: Sequence):
+    def __init__(self, method: str, parameters: Sequence, cursor=False):
         # parameters should be checked before
         self._method = method
         self._parameters = parameters
         self._sequence_number = next_sequence_id()
-
-    def pack(self):
-        return pack_message(
-            self._sequence_number, self._event_type, [self._method, self._parameters]
-        )
+        # response is the first page of a server side cursor
+        self.cursor = cursor
+        # priority class asked by client
+        self.priority = None
+
+    def pack(self, shm_threshold: int = 0):
+        body = [self._method, self._parameters]
+        if self.priority is not None:
+            body.append({"priority": self.priority})
+        return pack_message(self._sequence_number, self._event_type, body, shm_threshold)
+
+    def unpack_response(self, header: Header, data: bytes):
+        """remote exception is returned instead of raised"""
+        if header.event_type == EventType.FILE:
+            # memory map of the received content
+            return data
+        body = unpack_payload(header.compress_flag, data)
+        if header.errno:
+            body = make_remote_exception(body)
+        return body
+
+    def object_refs(self):
+        """object references could be uploaded again if server has evicted them"""
+        if self.stream:
+            return []
+        return [i for i in self._parameters if isinstance(i, ObjectRef)]
 
     @property
     def sequence_number(self):
@@ -59,3 +84,112 @@ class Request:
             f"parameters={self.parameters} "
             f"sequence-number={self.sequence_number}>"
         )
+
+
+def make_put_request(ref: ObjectRef, data: bytes = None) -> Request:
+    if data is None:
+        data = pack_object(ref.obj)
+    return Request(builtins.put.name, [ref.handle, data])
+
+
+def make_release_request(ref: ObjectRef) -> Request:
+    return Request(builtins.release.name, [ref.handle])
+
+
+class StreamRequest(Request):
+    """request followed by chunk frames which are sent while iterating ``chunks``"""
+
+    stream = True
+
+    __slots__ = ("_chunks",)
+
+    def __init__(self, method: str, parameters: Sequence, chunks, cursor=False):
+        super().__init__(method, parameters, cursor)
+        self._chunks = chunks
+
+    @property
+    def chunks(self):
+        return self._chunks
+
+    def pack_chunk(self, chunk) -> bytes:
+        return pack_message(self._sequence_number, EventType.STREAM.value, chunk)
+
+    def pack_end(self) -> bytes:
+        return encode_header(0, self._sequence_number, 0, 0, EventType.STREAM_END.value)
+
+    def iter_frames(self):
+        for chunk in self._chunks:
+            yield self.pack_chunk(chunk)
+        yield self.pack_end()
+
+
+class ConditionalStore:
+    """Local copies of conditional results shared by all connections of a pool.
+
+    Entry is ``(etag, result)``, keyed by digest of the packed request. Results are shared
+    by callers, they should not be modified.
+    """
+
+    def __init__(self, max_entries: int):
+        self._cache = ResultCache(CacheOptions(ttl=float("inf"), max_entries=max_entries))
+        self._mutex = Lock()
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    def get(self, key: bytes) -> Optional[Tuple[bytes, Any]]:
+        with self._mutex:
+            state, value = self._cache.lookup(key)
+        if state == CacheState.MISS:
+            return None
+        return value
+
+    def put(self, key: bytes, etag: bytes, result):
+        with self._mutex:
+            self._cache.put(key, (etag, result))
+
+
+class ConditionalRequest(Request):
+    """Request sends etag of the local copy, server answers ``NOT_MODIFIED`` without payload
+    if the result is unchanged, and the local copy is returned without unpacking.
+    """
+
+    __slots__ = ("_store", "_key", "_local")
+
+    def __init__(self, method: str, parameters: Sequence, store: ConditionalStore, cursor=False):
+        super().__init__(method, parameters, cursor)
+        self._store = store
+        self._key = None
+        self._local = None
+
+    def pack(self, shm_threshold: int = 0):
+        """``shm_threshold`` is unused, names of shared memory files change every time"""
+        data = pack_object([self._method, self._parameters])
+        self._key = make_etag(data)
+        self._local = self._store.get(self._key)
+        options = {}
+        if self._local is not None:
+            options["etag"] = self._local[0]
+        if self.priority is not None:
+            options["priority"] = self.priority
+        if options:
+            # the packed array of two items is extended by options
+            data = b"".join((b"\x93", memoryview(data)[1:], pack_object(options)))
+        compress_flag, _, data = compress_payload(data)
+        header = encode_header(
+            len(data), self._sequence_number, compress_flag, 0, self._event_type
+        )
+        return header + data
+
+    def unpack_response(self, header: Header, data: bytes):
+        if header.event_type == EventType.NOT_MODIFIED:
+            if self._local is None:
+                raise FrameError(f"unexpected not modified response of {self._method}")
+            return self._local[1]
+        if not header.errno and header.event_type == EventType.RESPONSE:
+            data = decompress_payload(header.compress_flag, bytes(data))
+            rv = unpack_payload(0, data)
+            self._store.put(self._key, make_etag(data), rv)
+            return rv
+        return super().unpack_response(header, data)
@@ -0,0 +1,101 @@
+import asyncio
+import random
+import threading
+from typing import Dict, Optional
+
+__all__ = ("RetryPolicy", "RetryStats", "Retrying")
+
+
+class RetryPolicy:
+    """retry settings of one declare, ``None`` means the setting of client"""
+
+    __slots__ = ("max_retry", "backoff", "max_backoff")
+
+    def __init__(
+        self,
+        max_retry: Optional[int] = None,
+        backoff: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+    ):
+        self.max_retry = max_retry
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+
+class RetryStats:
+    __slots__ = ("retried", "exhausted", "throttled")
+
+    def __init__(self):
+        self.retried = 0
+        # failed after the last attempt
+        self.exhausted = 0
+        # not retried because the budget is used up
+        self.throttled = 0
+
+    def __str__(self):
+        return (
+            f"<{self.__class__.__name__} retried={self.retried} exhausted={self.exhausted} "
+            f"throttled={self.throttled}>"
+        )
+
+    __repr__ = __str__
+
+
+class Retrying:
+    """Decide whether and when a failed request is sent again.
+
+    Only failures of connecting are retried for all declares, any connection or timeout
+    error is retried for idempotent declares. Delays grow exponentially with full jitter.
+    Every request earns ``retry_budget`` token and a retry costs one, so retries could not
+    multiply the load of an overloaded server.
+    """
+
+    max_tokens = 10.0
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self._tokens = self.max_tokens
+        self._mutex = threading.Lock()
+        self.stats: Dict[str, RetryStats] = {}
+
+    @staticmethod
+    def retryable(exc: BaseException, idempotent: bool) -> bool:
+        if isinstance(exc, ConnectionRefusedError):
+            # nothing has been sent
+            return True
+        return idempotent and isinstance(exc, (OSError, asyncio.TimeoutError))
+
+    def _policy_value(self, method: str, name: str, default):
+        policy = self.configuration.retries.get(method)
+        value = None if policy is None else getattr(policy, name)
+        return default if value is None else value
+
+    def max_retry(self, method: str) -> int:
+        return self._policy_value(method, "max_retry", self.configuration.max_retry)
+
+    def earn(self):
+        with self._mutex:
+            self._tokens = min(self._tokens + self.configuration.retry_budget, self.max_tokens)
+
+    def backoff(self, method: str, exc: BaseException, idempotent: bool, attempt: int):
+        """Return seconds to wait before the ``attempt``th retry, ``None`` if the request
+        should fail with ``exc``.
+        """
+        if not self.retryable(exc, idempotent):
+            return None
+        stats = self.stats.get(method)
+        if stats is None:
+            stats = self.stats.setdefault(method, RetryStats())
+        if attempt > self.max_retry(method):
+            stats.exhausted += 1
+            return None
+        with self._mutex:
+            if self._tokens < 1:
+                stats.throttled += 1
+                return None
+            self._tokens -= 1
+        stats.retried += 1
+        configuration = self.configuration
+        backoff = self._policy_value(method, "backoff", configuration.retry_backoff)
+        max_backoff = self._policy_value(method, "max_backoff", configuration.retry_max_backoff)
+        return random.uniform(0, min(max_backoff, backoff * 2 ** (attempt - 1)))
@@ -0,0 +1,140 @@
+import asyncio
+from collections import deque
+from typing import Optional
+
+from dagger import builtins
+from dagger.client._request import Request
+
+__all__ = ("Subscription", "AsyncSubscription")
+
+
+class _BaseSubscription:
+    request_class = Request
+
+    def __init__(self, conn, topic: str):
+        self._conn = conn
+        self.topic = topic
+        self.closed = False
+
+    def _subscribe_request(self):
+        return self.request_class(builtins.subscribe.name, [self.topic])
+
+    def _unsubscribe_request(self):
+        return self.request_class(builtins.unsubscribe.name, [self.topic])
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} topic={self.topic} closed={self.closed}>"
+
+    __repr__ = __str__
+
+
+class Subscription(_BaseSubscription):
+    """Messages of a topic pushed by server.
+
+    The connection is held by the subscription until it is closed, reading is blocked by
+    the socket, so a slow reader slows down the server writing to it.
+    """
+
+    def __init__(self, pool, conn, topic: str):
+        super().__init__(conn, topic)
+        self._pool = pool
+
+    def get(self):
+        """block until next message arrives"""
+        if self.closed:
+            raise RuntimeError("subscription closed")
+        return self._pool.read_published(self._conn)
+
+    def __iter__(self):
+        while not self.closed:
+            yield self.get()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        conn, self._conn = self._conn, None
+        self._pool.end_subscription(conn, self._unsubscribe_request())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # connection is dropped, server unsubscribes when it is lost.
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.buffer.close()
+            conn.socket.close()
+
+
+class AsyncSubscription(_BaseSubscription):
+    """Asynchronous iterator of messages of a topic pushed by server.
+
+    Messages are buffered until they are consumed, the oldest ones are dropped if
+    ``maxsize`` is reached.
+    """
+
+    def __init__(self, conn, topic: str, maxsize: int = 0):
+        super().__init__(conn, topic)
+        self._messages = deque(maxlen=maxsize or None)
+        self._waiter: Optional[asyncio.Future] = None
+        self._exception = None
+        self.dropped = 0
+
+    def feed(self, ob):
+        messages = self._messages
+        if len(messages) == messages.maxlen:
+            self.dropped += 1
+        messages.append(ob)
+        self._wakeup()
+
+    def set_exception(self, exc):
+        self._exception = exc
+        self._wakeup()
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def get(self):
+        """wait until next message arrives"""
+        while not self._messages:
+            if self.closed:
+                raise RuntimeError("subscription closed")
+            if self._exception is not None:
+                raise self._exception
+            self._waiter = self._conn.loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._messages.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except RuntimeError:
+            if self.closed:
+                raise StopAsyncIteration
+            raise
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._messages.clear()
+        self._wakeup()
+        await self._conn.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -1,13 +1,27 @@
 import io
 import socket
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 from queue import Queue, Empty, Full
-from typing import NamedTuple
+from typing import NamedTuple, Iterable, Dict
 
-from dagger.netutils import create_default_connection
+from dagger.netutils import create_default_connection, create_unix_connection
+from dagger.netutils import readable_when_idle
+from dagger.client._balancer import Balancer, Endpoint
 from dagger.client._configuration import ClientConfiguration
-from dagger.client._request import Request
-from dagger.codec import decode_header, EventType, unpack_payload
-from dagger.exceptions import FrameError, get_exception_from_code
+from dagger.client._request import Request, ConditionalStore, make_put_request
+from dagger.client._request import make_release_request
+from dagger.client._request import next_sequence_id
+from dagger.client._cursor import Cursor
+from dagger.client._subscription import Subscription
+from dagger.codec import decode_header, encode_header, EventType, Header, unpack_payload
+from dagger.codec import ObjectRef
+from dagger.exceptions import FrameError, ObjectNotFound
+from dagger.parser import SpillBuffer
+from dagger.logger import logger
 
 
 class BasePool:
@@ -15,77 +29,386 @@ class BasePool:
 
     def __init__(self, configuration: ClientConfiguration):
         self._configuration = configuration
+        self.conditional_store = ConditionalStore(configuration.conditional_cache_size)
+        self.balancer = Balancer(configuration)
+
+    def _health_check_needed(self) -> bool:
+        return len(self.balancer.endpoints) > 1 and self._configuration.health_check_interval > 0
 
     def dispatch_request(self, request: Request):
         raise NotImplementedError
 
+    def submit(self, request: Request) -> Future:
+        """request is dispatched at once, the returned future is done"""
+        fut = Future()
+        try:
+            fut.set_result(self.dispatch_request(request))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def dispatch_many(self, requests: Iterable[Request], window: int, ordered: bool = True):
+        """yield results of requests, at most ``window`` requests are in flight"""
+        pending = deque()
+        requests = iter(requests)
+        while True:
+            for request in requests:
+                pending.append(self.submit(request))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            if ordered:
+                yield pending.popleft().result()
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pending.remove(fut)
+                yield fut.result()
+
+    def subscribe(self, topic: str, maxsize: int = 0):
+        raise NotImplementedError
+
+    def release_object(self, ref: ObjectRef):
+        raise NotImplementedError
+
+
+def _connect(endpoint: Endpoint, connect_timeout, timeout) -> socket.socket:
+    if endpoint.unix:
+        return create_unix_connection(endpoint.host, connect_timeout, timeout)
+    return create_default_connection(endpoint.host, endpoint.port, connect_timeout, timeout)
+
 
 class _BufferSocket(NamedTuple):
     buffer: io.BufferedRWPair
     socket: socket.socket
+    endpoint: Endpoint
 
 
 class SyncPool(BasePool):
     def __init__(self, configuration: ClientConfiguration):
         super().__init__(configuration)
-        self._conns = Queue(configuration.pool_size)
-        conn = self._make_new_connection()
-        self._conns.put(conn)
+        endpoints = self.balancer.endpoints
+        self._conns: Dict[Endpoint, Queue] = {i: Queue(configuration.pool_size) for i in endpoints}
+        for i, endpoint in enumerate(endpoints):
+            try:
+                conn = self._make_new_connection(endpoint)
+            except OSError:
+                # fail only if no endpoint could be connected
+                if i == len(endpoints) - 1 and not any(q.qsize() for q in self._conns.values()):
+                    raise
+                if self._health_check_needed():
+                    self.balancer.set_health(endpoint, False)
+            else:
+                self._conns[endpoint].put(conn)
+        if self._health_check_needed():
+            self._run_periodically("health_check_interval", "check_health", "DaggerHealthCheck")
+        if configuration.keepalive_interval:
+            self._run_periodically("keepalive_interval", "keepalive", "DaggerKeepalive")
+
+    def _run_periodically(self, option: str, method: str, name: str):
+        ref = weakref.ref(self)
+        interval = getattr(self._configuration, option)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                pool = ref()
+                if pool is None:
+                    return
+                try:
+                    getattr(pool, method)()
+                except Exception as exc:
+                    logger.warning("%s failed: %r", method, exc)
+                del pool
+
+        threading.Thread(target=run, name=name, daemon=True).start()
+
+    def keepalive(self):
+        """Ping pooled connections one by one, dead ones are closed before requests are sent
+        on them. The others stay in the pool for requests meanwhile.
+        """
+        timeout = min(self._configuration.keepalive_interval, 3)
+        for endpoint, conns in self._conns.items():
+            for _ in range(conns.qsize()):
+                try:
+                    conn = conns.get_nowait()
+                except Empty:
+                    break
+                if conn.buffer.closed:
+                    continue
+                try:
+                    endpoint.record_rtt(self._ping(conn, timeout))
+                except (OSError, FrameError) as exc:
+                    logger.warning("close dead connection %s: %r", conn.socket, exc)
+                    conn.buffer.close()
+                    conn.socket.close()
+                    endpoint.record(0.0, True)
+                else:
+                    self.release_connection(conn)
+
+    def _ping(self, conn: _BufferSocket, timeout: float) -> float:
+        seq = next_sequence_id()
+        start = time.monotonic()
+        conn.socket.settimeout(timeout)
+        try:
+            conn.buffer.write(encode_header(0, seq, 0, 0, EventType.PING.value))
+            conn.buffer.flush()
+            header, _ = self._read_frame(conn)
+        finally:
+            conn.socket.settimeout(self._configuration.timeout)
+        if header.event_type != EventType.PONG or header.sequence_number != seq:
+            raise FrameError("expect %s, got %d" % (EventType.PONG, header.event_type))
+        return time.monotonic() - start
+
+    def check_health(self):
+        balancer = self.balancer
+        timeout = min(self._configuration.health_check_interval, 3)
+        for endpoint in balancer.endpoints:
+            try:
+                sock = _connect(endpoint, timeout, timeout)
+            except OSError:
+                balancer.set_health(endpoint, False)
+            else:
+                sock.close()
+                balancer.set_health(endpoint, True)
+        balancer.check_outliers()
 
     def dispatch_request(self, request: Request):
         #  parameters should be checking in declare
+        conn = self._acquire_connection(request)
+        endpoint = conn.endpoint
+        endpoint.outstanding += 1
+        start = time.monotonic()
         try:
-            conn = self._conns.get_nowait()
-        except Empty:
-            conn = self._make_new_connection()
-        else:
-            if conn.buffer.closed:
-                conn = self._make_new_connection()
+            rv = self.dispatch_on(conn, request)
+        except BaseException as e:
+            endpoint.outstanding -= 1
+            endpoint.record(time.monotonic() - start, isinstance(e, OSError))
+            self.release_connection(conn)
+            raise
+        endpoint.outstanding -= 1
+        endpoint.record(time.monotonic() - start, False)
+        if request.cursor:
+            handle, page, done = rv
+            page_size = self._configuration.cursor_page_size
+            # connection is released by cursor
+            return Cursor(self, conn, handle, page, done, page_size)
+
+        self.release_connection(conn)
+        return rv
 
+    def dispatch_on(self, conn: _BufferSocket, request: Request):
         try:
             rv = self._dispatch_request(conn, request)
-        except (ConnectionError, socket.error, TimeoutError, socket.timeout):
+            if isinstance(rv, ObjectNotFound):
+                rv = self._upload_and_retry(conn, request, rv)
+        except BaseException:
+            # stream is broken
             conn.buffer.close()
             conn.socket.close()
             raise
-        else:
-            try:
-                self._conns.put_nowait(conn)
-            except Full:
-                conn.buffer.close()
-                conn.socket.close()
         if isinstance(rv, Exception):
             raise rv
         return rv
 
-    def _make_new_connection(self):
-        host = self._configuration.host
-        port = self._configuration.port
-        timeout = self._configuration.timeout
-        sock = create_default_connection(host, port, timeout=timeout)
+    def _upload_and_retry(self, conn: _BufferSocket, request: Request, exc: ObjectNotFound):
+        # objects are stored in the worker process which the connection is linked to.
+        refs = request.object_refs()
+        if not refs:
+            return exc
+        for ref in refs:
+            rv = self._dispatch_request(conn, make_put_request(ref))
+            if isinstance(rv, Exception):
+                return rv
+        return self._dispatch_request(conn, request)
+
+    def dispatch_many(self, requests: Iterable[Request], window: int, ordered: bool = True):
+        """Pipeline requests on one connection, up to ``window`` requests are written before
+        responses are read. Requests not answered are at most the send buffer of socket, so
+        writing never blocks while the server waits for responses to be read.
+        """
+        conn = self._acquire_connection()
+        buffer = conn.buffer
+        limit = conn.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        requests = iter(requests)
+        # sequence number -> request, in sending order
+        pending: Dict[int, Request] = {}
+        # sequence number -> bytes of request not answered
+        sizes: Dict[int, int] = {}
+        written = 0
+        held = None
+        results = {}
+        try:
+            while True:
+                while len(pending) < window:
+                    if held is None:
+                        request = next(requests, None)
+                        if request is None:
+                            break
+                        held = request, self._pack(conn, request)
+                    request, data = held
+                    if sizes and written + len(data) > limit:
+                        break
+                    held = None
+                    buffer.write(data)
+                    pending[request.sequence_number] = request
+                    sizes[request.sequence_number] = len(data)
+                    written += len(data)
+                if not pending:
+                    break
+                buffer.flush()
+
+                header, payload = self._read_frame(conn)
+                request = pending.get(header.sequence_number)
+                if request is None or header.sequence_number in results:
+                    raise FrameError(f"unexpected response: {header.sequence_number}")
+                written -= sizes.pop(header.sequence_number)
+                results[header.sequence_number] = request.unpack_response(header, payload)
+                if ordered:
+                    ready = []
+                    for seq in pending:
+                        if seq not in results:
+                            break
+                        ready.append(seq)
+                else:
+                    ready = [header.sequence_number]
+                for seq in ready:
+                    del pending[seq]
+                    rv = results.pop(seq)
+                    if isinstance(rv, Exception):
+                        raise rv
+                    yield rv
+        finally:
+            if sizes:
+                # responses in flight are abandoned
+                conn.buffer.close()
+                conn.socket.close()
+            self.release_connection(conn)
+
+    def release_object(self, ref: ObjectRef):
+        """Release ``ref`` through every pooled connection, the object may be uploaded again
+        to the worker of any of them. Connections in use are skipped.
+        """
+        released = False
+        for conns in self._conns.values():
+            for _ in range(conns.qsize()):
+                try:
+                    conn = conns.get_nowait()
+                except Empty:
+                    break
+                if conn.buffer.closed:
+                    continue
+                try:
+                    self.dispatch_on(conn, make_release_request(ref))
+                finally:
+                    self.release_connection(conn)
+                released = True
+        if not released:
+            self.dispatch_request(make_release_request(ref))
+
+    def subscribe(self, topic: str, maxsize: int = 0) -> Subscription:
+        """``maxsize`` is unused, unread messages are kept in socket buffers"""
+        conn = self._acquire_connection()
+        subscription = Subscription(self, conn, topic)
+        try:
+            self.dispatch_on(conn, subscription._subscribe_request())
+        except BaseException:
+            self.release_connection(conn)
+            raise
+        # messages may not be published for a long time
+        conn.socket.settimeout(None)
+        return subscription
+
+    def end_subscription(self, conn: _BufferSocket, request: Request):
+        try:
+            self.dispatch_on(conn, request)
+        finally:
+            if not conn.buffer.closed:
+                conn.socket.settimeout(self._configuration.timeout)
+            self.release_connection(conn)
+
+    def read_published(self, conn: _BufferSocket):
+        try:
+            header, payload = self._read_frame(conn)
+            if header.event_type != EventType.PUBLISH:
+                raise FrameError("expect %s, got %d" % (EventType.PUBLISH, header.event_type))
+            _, ob = unpack_payload(header.compress_flag, payload)
+        except BaseException:
+            conn.buffer.close()
+            conn.socket.close()
+            raise
+        return ob
+
+    def _acquire_connection(self, request: Request = None) -> _BufferSocket:
+        endpoint = self.balancer.select(request)
+        try:
+            conn = self._conns[endpoint].get_nowait()
+        except Empty:
+            conn = None
+        if conn is not None and not conn.buffer.closed and readable_when_idle(conn.socket):
+            # closed by server when it is idle
+            conn.buffer.close()
+            conn.socket.close()
+        if conn is None or conn.buffer.closed:
+            try:
+                conn = self._make_new_connection(endpoint)
+            except OSError:
+                endpoint.record(0.0, True)
+                raise
+        return conn
+
+    def release_connection(self, conn: _BufferSocket):
+        if conn.buffer.closed:
+            return
+        try:
+            self._conns[conn.endpoint].put_nowait(conn)
+        except Full:
+            conn.buffer.close()
+            conn.socket.close()
+
+    def _make_new_connection(self, endpoint: Endpoint):
+        configuration = self._configuration
+        sock = _connect(endpoint, configuration.connect_timeout or None, configuration.timeout)
         buffer = sock.makefile("rwb", 4096)
-        buffersocket = _BufferSocket(buffer, sock)
+        buffersocket = _BufferSocket(buffer, sock, endpoint)
         return buffersocket
 
-    @staticmethod
-    def _dispatch_request(conn: _BufferSocket, request: Request):
-        conn.buffer.write(request.pack())
+    def _pack(self, conn: _BufferSocket, request: Request) -> bytes:
+        if conn.endpoint.unix:
+            return request.pack(self._configuration.shm_threshold)
+        return request.pack()
+
+    def _dispatch_request(self, conn: _BufferSocket, request: Request):
+        conn.buffer.write(self._pack(conn, request))
+        if request.stream:
+            for frame in request.iter_frames():
+                conn.buffer.write(frame)
         conn.buffer.flush()
+        header, payload = SyncPool._read_frame(conn)
+        while header.event_type == EventType.PUBLISH:
+            # pushed before the subscription is ended
+            header, payload = SyncPool._read_frame(conn)
+        if header.event_type not in (EventType.RESPONSE, EventType.NOT_MODIFIED, EventType.FILE):
+            raise FrameError("expect %s, got %d" % (EventType.RESPONSE, header.event_type))
+
+        return request.unpack_response(header, payload)
+
+    @staticmethod
+    def _read_frame(conn: _BufferSocket) -> (Header, bytes):
         headerbytes = conn.buffer.read(8)
-        if not headerbytes:
+        if len(headerbytes) != 8:
             raise ConnectionError(f"{conn.socket} lost")
         header = decode_header(headerbytes)
-        if header.event_type != EventType.RESPONSE:
-            raise FrameError("expect %s, got %d" % (EventType.RESPONSE, header.event_type))
+
+        if header.event_type == EventType.FILE and header.payload_size:
+            spill = SpillBuffer(header.payload_size)
+            while spill.remaining:
+                if not spill.readinto(conn.buffer):
+                    raise ConnectionError(f"{conn.socket} lost")
+            return header, spill.getvalue()
 
         payload = conn.buffer.read(header.payload_size)
-        if not headerbytes:
+        if len(payload) != header.payload_size:
             raise ConnectionError(f"{conn.socket} lost")
-
-        body = unpack_payload(header.compress_flag, payload)
-
-        if header.errno:
-            exc = get_exception_from_code(header.errno)
-            body = exc(body)
-
-        return body
+        return header, payload
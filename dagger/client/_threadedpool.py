@@ -0,0 +1,164 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from dagger.client._asyncpool import AsyncPool
+from dagger.client._configuration import ClientConfiguration
+from dagger.client._cursor import AsyncCursor
+from dagger.client._request import Request
+from dagger.client._subscription import AsyncSubscription
+from dagger.client._syncpool import BasePool
+from dagger.codec import ObjectRef
+
+__all__ = ("ThreadedPool", "io_loop")
+
+_io_lock = threading.Lock()
+_io_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def io_loop() -> asyncio.AbstractEventLoop:
+    """event loop of the background thread shared by all threaded pools"""
+    global _io_loop
+    with _io_lock:
+        if _io_loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="DaggerIOThread", daemon=True
+            )
+            thread.start()
+            _io_loop = loop
+        return _io_loop
+
+
+class ThreadedPool(BasePool):
+    """Requests of calling threads are multiplexed over connections of an ``AsyncPool``
+    which is driven by the background IO thread, a caller blocks only on its own future.
+
+    ``configuration.loop`` is replaced by the loop of IO thread. Calling threads are blocked
+    when ``max_inflight`` requests are submitted and not finished.
+    """
+
+    def __init__(self, configuration: ClientConfiguration):
+        super().__init__(configuration)
+        self._loop = configuration.loop = io_loop()
+        self._pool = AsyncPool(configuration)
+        self.balancer = self._pool.balancer
+        max_inflight = configuration.max_inflight
+        self._slots = threading.BoundedSemaphore(max_inflight) if max_inflight else None
+        self._run(self._pool.warm_up())
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _dispatch(self, request: Request):
+        rv = await self._pool.dispatch_request(request)
+        if isinstance(rv, AsyncCursor):
+            return _BlockingCursor(self, rv)
+        return rv
+
+    def submit(self, request: Request) -> Future:
+        slots = self._slots
+        if slots is None:
+            return asyncio.run_coroutine_threadsafe(self._dispatch(request), self._loop)
+        if not slots.acquire(timeout=self._configuration.timeout or None):
+            raise TimeoutError("no slot for request")
+        try:
+            fut = asyncio.run_coroutine_threadsafe(self._dispatch(request), self._loop)
+        except BaseException:
+            slots.release()
+            raise
+        fut.add_done_callback(lambda _: slots.release())
+        return fut
+
+    def dispatch_request(self, request: Request):
+        fut = self.submit(request)
+        try:
+            return fut.result(self._configuration.timeout or None)
+        except FutureTimeoutError:
+            # the coroutine is cancelled and its slot is released
+            fut.cancel()
+            raise
+
+    def release_object(self, ref: ObjectRef):
+        self._run(self._pool.release_object(ref))
+
+    def subscribe(self, topic: str, maxsize: int = 0):
+        return _BlockingSubscription(self, self._run(self._pool.subscribe(topic, maxsize)))
+
+
+class _BlockingCursor:
+    """``AsyncCursor`` used from calling threads"""
+
+    def __init__(self, pool: ThreadedPool, cursor: AsyncCursor):
+        self._pool = pool
+        self._cursor = cursor
+
+    @property
+    def done(self):
+        return self._cursor.done
+
+    def fetch(self, n: int = 0):
+        return self._pool._run(self._cursor.fetch(n))
+
+    def pages(self):
+        while True:
+            page = self.fetch()
+            if page is None:
+                return
+            yield page
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+    def close(self):
+        self._pool._run(self._cursor.close())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __str__(self):
+        return str(self._cursor)
+
+    __repr__ = __str__
+
+
+class _BlockingSubscription:
+    """``AsyncSubscription`` used from calling threads"""
+
+    def __init__(self, pool: ThreadedPool, subscription: AsyncSubscription):
+        self._pool = pool
+        self._subscription = subscription
+
+    @property
+    def topic(self):
+        return self._subscription.topic
+
+    @property
+    def closed(self):
+        return self._subscription.closed
+
+    def get(self):
+        return self._pool._run(self._subscription.get())
+
+    def __iter__(self):
+        while not self.closed:
+            yield self.get()
+
+    def close(self):
+        self._pool._run(self._subscription.close())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __str__(self):
+        return str(self._subscription)
+
+    __repr__ = __str__
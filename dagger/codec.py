@@ -7,15 +7,20 @@ error number        (3bit)
 magic               (8bit)  72
 """
 import enum
+import hashlib
 import io
+import mmap
+import tempfile
 from datetime import datetime, date
+from functools import partial
 from typing import NamedTuple, ByteString
 
-from brotli import compress, decompress
-from msgpack import loads, dumps, ExtType
+from brotli import compress, decompress, Decompressor
+from msgpack import loads, dumps, ExtType, Unpacker
 
 from dagger.exceptions import FrameError, PackUnpackError
 from dagger.datetimeutils import date2int8, datetime2int14, int8_to_date, int14_to_datetime
+from dagger.shmutils import write_shm, read_shm
 
 try:
     import pandas as pd
@@ -36,9 +41,17 @@ __all__ = (
     "decode_header",
     "encode_header",
     "pack_message",
+    "pack_payload",
     "unpack_payload",
+    "compress_payload",
+    "decompress_payload",
+    "request_identity",
     "Header",
     "MAX_SEQUENCE_ID",
+    "ObjectRef",
+    "pack_object",
+    "unpack_object",
+    "make_etag",
 )
 
 MAX_SEQUENCE_ID = 2 ** 16 - 1
@@ -48,6 +61,18 @@ class EventType(enum.IntEnum):
     REQUEST = 1
     RESPONSE = 2
     AUTH = 3
+    STREAM = 4
+    STREAM_END = 5
+    # response of conditional request whose result equals the etag sent, it has no payload
+    NOT_MODIFIED = 6
+    # message of subscribed topic pushed by server, sequence number is unused
+    PUBLISH = 7
+    # keepalive sent by client, server answers with a PONG of the same sequence number at
+    # once, both have no payload
+    PING = 8
+    PONG = 9
+    # response whose payload is the raw content of a file or a buffer
+    FILE = 10
 
 
 class Header(NamedTuple):
@@ -85,47 +110,195 @@ def encode_header(
     return rv.to_bytes(8, "big", signed=False)
 
 
+_LOAD_OPTIONS = dict(
+    use_list=True,
+    raw=False,
+    max_str_len=2147483647,  # 2**32-1
+    max_bin_len=2147483647,
+    max_array_len=2147483647,
+    max_map_len=2147483647,
+    max_ext_len=2147483647,
+)
+
+
 def unpack_payload(compress_flag: int, data: bytes) -> object:
     try:
+        if isinstance(data, mmap.mmap):
+            return _unpack_mapped(compress_flag, data)
         if compress_flag:
             data = decompress(data)
 
-        return loads(
-            data,
-            use_list=True,
-            raw=False,
-            ext_hook=_ext_hook,
-            max_str_len=2147483647,  # 2**32-1
-            max_bin_len=2147483647,
-            max_array_len=2147483647,
-            max_map_len=2147483647,
-            max_ext_len=2147483647,
-        )
+        return loads(data, ext_hook=_ext_hook, **_LOAD_OPTIONS)
     except Exception as e:
         raise PackUnpackError(e)
 
 
-def pack_message(seq_id: int, event_type: int, ob) -> bytes:
-    """pack up on message, set errno by default"""
+def _unpack_mapped(compress_flag: int, data: mmap.mmap):
+    """Unpack payload spilled to a file, numpy arrays in the top two levels of arrays are made
+    on the map instead of copied.
+    """
+    if compress_flag:
+        data = _decompress_to_map(data)
+    rv, _ = _unpack_from(memoryview(data), 0, 2)
+    return rv
+
+
+def _decompress_to_map(data: mmap.mmap, chunk_size: int = 64 * 1024) -> mmap.mmap:
+    decompressor = Decompressor()
+    view = memoryview(data)
+    with tempfile.TemporaryFile() as f:
+        for start in range(0, len(view), chunk_size):
+            f.write(decompressor.process(view[start : start + chunk_size]))
+        if not decompressor.is_finished():
+            raise ValueError("compressed payload is incomplete")
+        f.flush()
+        return mmap.mmap(f.fileno(), f.tell())
+
+
+class _ViewReader:
+    __slots__ = ("_view", "_pos")
+
+    def __init__(self, view: memoryview, pos: int):
+        self._view = view
+        self._pos = pos
+
+    def read(self, n: int) -> bytes:
+        data = bytes(self._view[self._pos : self._pos + n])
+        self._pos += len(data)
+        return data
+
+
+def _unpack_from(view: memoryview, pos: int, depth: int):
+    """unpack the object at ``pos``, return it and the position after it"""
+    code = view[pos]
+    if depth and ((code & 0xF0) == 0x90 or code in (0xDC, 0xDD)):
+        if code == 0xDC:
+            n, pos = int.from_bytes(view[pos + 1 : pos + 3], "big"), pos + 3
+        elif code == 0xDD:
+            n, pos = int.from_bytes(view[pos + 1 : pos + 5], "big"), pos + 5
+        else:
+            n, pos = code & 0x0F, pos + 1
+        items = []
+        for _ in range(n):
+            item, pos = _unpack_from(view, pos, depth - 1)
+            items.append(item)
+        return items, pos
+    if numpy_support and code in (0xC7, 0xC8, 0xC9):
+        # ext 8, ext 16 and ext 32
+        width = 1 << (code - 0xC7)
+        start = pos + 2 + width
+        if view[start - 1] == EXT_TYPES.numpy_array:
+            end = start + int.from_bytes(view[pos + 1 : pos + 1 + width], "big")
+            return bytes2array(view[start:end]), end
+    unpacker = Unpacker(
+        _ViewReader(view, pos), ext_hook=_ext_hook, max_buffer_size=2147483647, **_LOAD_OPTIONS
+    )
+    return unpacker.unpack(), pos + unpacker.tell()
+
+
+def pack_payload(ob, shm_threshold: int = 0) -> (int, int, bytes):
+    """Pack up object, return compress flag, errno and payload.
+
+    Numpy arrays of at least ``shm_threshold`` bytes are packed into shared memory files,
+    only the file names are in payload. It is for connections to the same host, 0 disables.
+    """
     try:
         if isinstance(ob, Exception):
-            error_no = getattr(ob, "code", 500)  # 500 -> RemoteIntervalError
-            ob = str(ob)
+            # error number has only 3 bits, the exact code is sent in body.
+            error_no = 1
+            ob = [getattr(ob, "code", 500), str(ob)]  # 500 -> RemoteInternalError
         else:
             error_no = 0
 
-        data = dumps(ob, use_bin_type=True, default=_default)
-        if len(data) > 1024:
-            data = compress(data)
-            compress_flag = 1
-        else:
-            compress_flag = 0
-        header = encode_header(len(data), seq_id, compress_flag, error_no, event_type)
-        return header + data
+        data = dumps(ob, use_bin_type=True, default=_make_default(shm_threshold))
+        return compress_payload(data, error_no)
+    except Exception as e:
+        raise PackUnpackError(e)
+
+
+def compress_payload(data: bytes, error_no: int = 0) -> (int, int, bytes):
+    """compress packed object larger than 1KB, return compress flag, errno and payload"""
+    if len(data) > 1024:
+        return 1, error_no, compress(data)
+    return 0, error_no, data
+
+
+def decompress_payload(compress_flag: int, data: bytes) -> bytes:
+    try:
+        return decompress(data) if compress_flag else data
+    except Exception as e:
+        raise PackUnpackError(e)
+
+
+def request_identity(data: bytes, options: bool) -> memoryview:
+    """Bytes of method and arguments in packed request ``[method, args, options]``, requests
+    differing only in options have the same identity. ``data`` is not compressed.
+    """
+    view = memoryview(data)
+    if not options:
+        # skip the array header of one byte
+        return view[1:]
+    unpacker = Unpacker(_ViewReader(view, 1), max_buffer_size=2147483647, **_LOAD_OPTIONS)
+    unpacker.skip()
+    unpacker.skip()
+    return view[1 : 1 + unpacker.tell()]
+
+
+def pack_message(seq_id: int, event_type: int, ob, shm_threshold: int = 0) -> bytes:
+    """pack up on message, set errno by default"""
+    compress_flag, error_no, data = pack_payload(ob, shm_threshold)
+    header = encode_header(len(data), seq_id, compress_flag, error_no, event_type)
+    return header + data
+
+
+def make_etag(data: bytes) -> bytes:
+    """content hash of a packed result before compressing, both sides compute it"""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def pack_object(ob, shm_threshold: int = 0) -> bytes:
+    """pack object without compressing, the result is stable for equal objects"""
+    try:
+        return dumps(ob, use_bin_type=True, default=_make_default(shm_threshold))
     except Exception as e:
         raise PackUnpackError(e)
 
 
+def unpack_object(data: bytes) -> object:
+    return unpack_payload(0, data)
+
+
+class ObjectRef:
+    """Reference to an object stored in server.
+
+    Handle is the digest of packed object, so the same object gets the same handle in every
+    server worker. Server side reference only has the handle.
+    """
+
+    __slots__ = ("handle", "obj")
+
+    def __init__(self, handle: bytes, obj=None):
+        self.handle = handle
+        self.obj = obj
+
+    @staticmethod
+    def digest(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def __eq__(self, other):
+        if not isinstance(other, ObjectRef):
+            return NotImplemented
+        return self.handle == other.handle
+
+    def __hash__(self):
+        return hash(self.handle)
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} handle={self.handle.hex()}>"
+
+    __repr__ = __str__
+
+
 _EPOCH = datetime(1970, 1, 1)
 
 
@@ -134,6 +307,9 @@ class _ExtDefine(NamedTuple):
     numpy_array: int = 3
     date: int = 5
     datetime: int = 6
+    object_ref: int = 7
+    # name of a shared memory file holding a numpy array
+    shm_numpy_array: int = 8
 
 
 EXT_TYPES = _ExtDefine()
@@ -144,28 +320,45 @@ def _ext_hook(code: int, data: bytes):
         return int14_to_datetime(int.from_bytes(data, "big", signed=True))
     elif code == EXT_TYPES.date:
         return int8_to_date(int.from_bytes(data, "big", signed=True))
+    elif code == EXT_TYPES.object_ref:
+        return ObjectRef(data)
     elif pandas_support and code == EXT_TYPES.pandas_dataframe:
         return bytes2dataframe(data)
     if numpy_support and code == EXT_TYPES.numpy_array:
         return bytes2array(data)
+    if numpy_support and code == EXT_TYPES.shm_numpy_array:
+        return bytes2array(read_shm(data))
     else:
         return ExtType(code, data)
 
 
-def _default(obj):
+def _make_default(shm_threshold: int):
+    return partial(_default, shm_threshold=shm_threshold) if shm_threshold else _default
+
+
+def _default(obj, shm_threshold: int = 0):
     if isinstance(obj, datetime):
         return ExtType(EXT_TYPES.datetime, datetime2int14(obj).to_bytes(6, "big", signed=True))
     elif isinstance(obj, date):
         return ExtType(EXT_TYPES.date, date2int8(obj).to_bytes(4, "big", signed=True))
+    elif isinstance(obj, ObjectRef):
+        return ExtType(EXT_TYPES.object_ref, obj.handle)
     elif pandas_support and isinstance(obj, pd.DataFrame):
         return ExtType(EXT_TYPES.pandas_dataframe, dataframe2bytes(obj))
     elif numpy_support and isinstance(obj, np.ndarray):
+        if shm_threshold and obj.nbytes >= shm_threshold:
+            obj = np.ascontiguousarray(obj)
+            return ExtType(EXT_TYPES.shm_numpy_array, write_shm(_array_header(obj), obj.data))
         return ExtType(EXT_TYPES.numpy_array, array2bytes(obj))
     else:
         raise TypeError(f"Unknown type: {type(obj)}")
 
 
 def array2bytes(array) -> bytes:
+    return _array_header(array) + array.tobytes()
+
+
+def _array_header(array) -> bytes:
     header = bytearray()
     header.extend(b"#type:ndarray\n")
     sp = ",".join(str(i) for i in array.shape)
@@ -185,7 +378,7 @@ def array2bytes(array) -> bytes:
     else:
         header.extend(dtype.name.encode())
     header.extend(b"\n")
-    return bytes(header) + array.tobytes()
+    return bytes(header)
 
 
 def dataframe2bytes(array) -> bytes:
@@ -228,13 +421,28 @@ def _zipme(it, n=2):
             tp.clear()
 
 
-def bytes2array(data: bytes) -> "np.ndarray":
-    buffer = io.BytesIO(data)
-    type_ = buffer.readline()[6:-1].decode()
+def _read_lines(data, n: int):
+    """read ``n`` lines from a buffer without copying the rest"""
+    view = memoryview(data)
+    size = 1024
+    while True:
+        parts = bytes(view[:size]).split(b"\n", n)
+        if len(parts) > n:
+            lines = parts[:n]
+            return lines, sum(len(i) + 1 for i in lines)
+        if size >= len(view):
+            raise TypeError("invalid header")
+        size *= 4
+
+
+def bytes2array(data) -> "np.ndarray":
+    """``data`` is a buffer such as bytes or a memory map, the array is backed by it"""
+    (type_, shape, dtype), offset = _read_lines(data, 3)
+    type_ = type_[6:].decode()
     if type_ != "ndarray":
         raise TypeError(f"invalid type string: {type_}")
-    shape = buffer.readline()[7:-1].decode()
-    dtype = buffer.readline()[7:-1].decode()
+    shape = shape[7:].decode()
+    dtype = dtype[7:].decode()
     dtype = dtype.split(",")
     if len(dtype) == 1:
         dtype = np.dtype(dtype[0])
@@ -242,7 +450,7 @@ def bytes2array(data: bytes) -> "np.ndarray":
         dtype = list(_zipme(dtype, 2))
         dtype = np.dtype(dtype)
     shape = tuple(int(i) for i in shape.split(","))
-    array = np.frombuffer(memoryview(data)[buffer.tell() :], dtype=dtype)
+    array = np.frombuffer(memoryview(data)[offset:], dtype=dtype)
     array.shape = shape
     return array
 
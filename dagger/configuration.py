@@ -1,7 +1,14 @@
 import argparse
 from typing import Tuple, Iterable, Mapping
 
-__all__ = ("ConfigBase", "make_property", "int_format", "instance_checker", "float_format")
+__all__ = (
+    "ConfigBase",
+    "make_property",
+    "int_format",
+    "instance_checker",
+    "float_format",
+    "choice_format",
+)
 
 
 class ConfigurableProperty(property):
@@ -104,6 +111,15 @@ def float_format(max=None, min=None):
     return _format
 
 
+def choice_format(*choices):
+    def _format(v):
+        if v not in choices:
+            raise ValueError(f"{v} not in {choices}")
+        return v
+
+    return _format
+
+
 def instance_checker(*cls):
     def _format(v):
         if not isinstance(v, cls):
@@ -2,6 +2,7 @@ import inspect
 import enum
 from functools import partial
 
+from dagger.cache import make_cache_options
 from dagger.exceptions import FunctionNotImplementedError, ContentVerifyFailed
 
 __all__ = ("Declare", "declare")
@@ -24,9 +25,21 @@ class Declare:
     THREAD_RUN = RunMode.THREAD_RUN
     ASYNC_RUN = RunMode.ASYNC_RUN
     SYNC_RUN = RunMode.SYNC_RUN
+    # priority classes of requests from the highest
+    PRIORITIES = ("interactive", "default", "batch")
     _DUMMY = False
 
-    def __init__(self, name: str, module: str, doc: str, signature: inspect.Signature):
+    def __init__(
+        self,
+        name: str,
+        module: str,
+        doc: str,
+        signature: inspect.Signature,
+        stream=False,
+        cursor=False,
+        conditional=False,
+        idempotent=False,
+    ):
         self.name = name
         self.__name__ = name
         self.__module__ = module
@@ -37,11 +50,38 @@ class Declare:
         self._signature = signature
         self.runmode = self.THREAD_RUN
         self._parameter_check = None
+        # the last parameter receives an iterator of uploaded chunks.
+        self.stream = stream
+        # result is kept in server and client get a cursor to fetch it lazily.
+        self.cursor = cursor
+        # client keeps the last result and server skips sending it again if unchanged.
+        self.conditional = conditional
+        # calling it more than once has the same effect, it could be hedged or retried
+        self.idempotent = idempotent
+        # packed response is cached by server when it is set
+        self.cache_options = None
+        # identical requests in flight share one execution
+        self.coalesce = False
+        # order of running in server when requests wait for the worker
+        self.priority = "default"
+        # server connection of the request is passed to server impl before the arguments
+        self.pass_connection = False
         if not self._DUMMY:
             self._check_args()
 
-    def set_server_impl(self, func, thread=None, asynchronous=None):
+    def set_server_impl(
+        self,
+        func,
+        thread=None,
+        asynchronous=None,
+        cache=None,
+        coalesce=False,
+        priority="default",
+        pass_connection=False,
+    ):
         assert not all((thread, asynchronous))
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"priority of declare({self.name}) should be in {self.PRIORITIES}")
         if thread is None and asynchronous is None:
             thread = True
             asynchronous = False
@@ -51,13 +91,39 @@ class Declare:
             self.runmode = self.ASYNC_RUN
         else:
             self.runmode = self.SYNC_RUN
+        if self.stream and self.runmode == self.SYNC_RUN:
+            raise TypeError(f"Stream declare({self.name}) could not run in sync mode.")
+
+        cache = make_cache_options(cache)
+        if (cache is not None or coalesce) and (self.stream or self.cursor):
+            raise TypeError(f"Result of declare({self.name}) could not be shared.")
+        self.cache_options = cache
+        self.coalesce = coalesce
+        self.priority = priority
+        self.pass_connection = pass_connection
 
         self._server_impl = func
 
-    def server_impl(self, func=None, *, thread=None, asynchronous=None):
+    def server_impl(
+        self,
+        func=None,
+        *,
+        thread=None,
+        asynchronous=None,
+        cache=None,
+        coalesce=False,
+        priority="default",
+    ):
         if func is None:
-            return partial(self.server_impl, thread=thread, asynchronous=asynchronous)
-        self.set_server_impl(func, thread, asynchronous)
+            return partial(
+                self.server_impl,
+                thread=thread,
+                asynchronous=asynchronous,
+                cache=cache,
+                coalesce=coalesce,
+                priority=priority,
+            )
+        self.set_server_impl(func, thread, asynchronous, cache, coalesce, priority)
         return func
 
     def assured_parameters(self, *args, **kwargs):
@@ -78,15 +144,51 @@ class Declare:
         else:
             args = self.assured_parameters(*args)
 
-        return client.dispatch_request(self.name, args)
-
-    def server_call(self, *args):
+        if self.stream:
+            return client.dispatch_request(
+                self.name, args[:-1], stream=args[-1], cursor=self.cursor
+            )
+        return client.dispatch_request(
+            self.name,
+            args,
+            cursor=self.cursor,
+            conditional=self.conditional,
+            idempotent=self.idempotent,
+        )
+
+    def submit(self, *args, **kwargs):
+        """dispatch without waiting, return a future of the result"""
+        if self._client is None:
+            raise RuntimeError("client is not set")
+        if self.stream:
+            raise TypeError(f"Stream declare({self.name}) could not be submitted.")
+        args = self.assured_parameters(*args, **kwargs)
+        return self._client.submit(
+            self.name, args, cursor=self.cursor, conditional=self.conditional
+        )
+
+    def remote_map(self, iterable, window=64, ordered=True):
+        """call with each item of ``iterable`` as positional arguments, requests are pipelined,
+        see ``Client.map``.
+        """
+        if self._client is None:
+            raise RuntimeError("client is not set")
+        if self.stream or self.cursor:
+            raise TypeError(f"Declare({self.name}) could not be mapped.")
+        args_iterable = (self.assured_parameters(*args) for args in iterable)
+        return self._client.map(
+            self.name, args_iterable, window, ordered, conditional=self.conditional
+        )
+
+    def server_call(self, *args, connection=None):
         try:
             bond_args: inspect.BoundArguments = self._signature.bind(*args)
             bond_args.apply_defaults()
         except TypeError as e:
             raise ContentVerifyFailed(e)
         else:
+            if self.pass_connection:
+                return self._server_impl(connection, *bond_args.args)
             return self._server_impl(*bond_args.args)
 
     def setdefault_client(self, client):
@@ -117,23 +219,49 @@ class Declare:
     )
 
     def _check_args(self):
-        for k, v in self._signature.parameters.items():
+        parameters = self._signature.parameters
+        for k, v in parameters.items():
             if v.kind in self._DISALLOW_KIND:
                 raise TypeError(
                     f"Declared function({self.name}) could only accept positional parameter."
                 )
+        if self.stream and not parameters:
+            raise TypeError(f"Stream declare({self.name}) need a parameter to receive chunks.")
+        if self.conditional and (self.stream or self.cursor):
+            raise TypeError(f"Result of declare({self.name}) could not be conditional.")
 
 
 class _DummyDeclare(Declare):
     _DUMMY = True
 
 
-def declare(func) -> Declare:
-    name = func.__name__
+def declare(
+    func=None, *, name=None, stream=False, cursor=False, conditional=False, idempotent=False
+) -> Declare:
+    if func is None:
+        return partial(
+            declare,
+            name=name,
+            stream=stream,
+            cursor=cursor,
+            conditional=conditional,
+            idempotent=idempotent,
+        )
+    if name is None:
+        name = func.__name__
     signature = inspect.signature(func)
     module = func.__module__
     doc = func.__doc__
-    return Declare(name, module, doc, signature)
+    return Declare(
+        name,
+        module,
+        doc,
+        signature,
+        stream=stream,
+        cursor=cursor,
+        conditional=conditional,
+        idempotent=idempotent,
+    )
 
 
 del RunMode
@@ -30,11 +30,31 @@ class FunctionNotImplementedError(DaggerError):
     code = 404
 
 
+class CursorNotFound(DaggerError):
+    message_format = "cursor not found or expired: %s"
+    code = 410
+
+
+class ObjectNotFound(DaggerError):
+    message_format = "object not found or evicted: %s"
+    code = 411
+
+
+class PayloadTooLarge(DaggerError):
+    message_format = "payload too large: %s"
+    code = 413
+
+
 class RemoteInternalError(DaggerError):
     message_format = "Internal Error: %s"
     code = 500
 
 
+class CircuitOpenError(DaggerError):
+    message_format = "circuit breaker of endpoint is open: %s"
+    code = 503
+
+
 class FrameError(DaggerError):
     message_format = "Invalid Frame: %s"
     code = 509
@@ -52,7 +72,7 @@ _code_err_map = {}
 def _setup_code_map(d):
     rv = {}
     for k, v in d.items():
-        if isinstance(v, DaggerError):
+        if isinstance(v, type) and issubclass(v, DaggerError):
             rv[v.code] = v
 
     _code_err_map.update(rv)
@@ -63,4 +83,15 @@ del _setup_code_map
 
 
 def get_exception_from_code(code, default=DaggerError) -> Type[DaggerError]:
-    return _code_err_map.get(code, default=default)
+    return _code_err_map.get(code, default)
+
+
+def make_remote_exception(body) -> DaggerError:
+    """rebuild exception from a error response body ``[code, message]``"""
+    code, message = body
+    cls = get_exception_from_code(code)
+    # message is formatted by remote already.
+    exc = cls.__new__(cls)
+    Exception.__init__(exc, message)
+    exc.caught_by = None
+    return exc
@@ -0,0 +1,80 @@
+import asyncio
+
+__all__ = ("FlowControl",)
+
+
+class FlowControl:
+    __slots__ = (
+        "_transport",
+        "read_paused",
+        "read_held",
+        "streams_paused",
+        "write_paused",
+        "_is_writable_event",
+    )
+
+    def __init__(self, transport):
+        self._transport = transport
+        self.read_paused = False
+        # paused from outside of connection, resume_reading does not take effect until released
+        self.read_held = False
+        # number of streams whose buffers are full, each one is resumed by itself
+        self.streams_paused = 0
+        self.write_paused = False
+        self._is_writable_event = asyncio.Event()
+        self._is_writable_event.set()
+
+    async def drain(self):
+        await self._is_writable_event.wait()
+
+    @property
+    def reading_paused(self) -> bool:
+        return self.read_paused or self.read_held or self.streams_paused > 0
+
+    def _update_reading(self, was_paused: bool):
+        paused = self.reading_paused
+        if paused and not was_paused:
+            self._transport.pause_reading()
+        elif was_paused and not paused:
+            self._transport.resume_reading()
+
+    def pause_reading(self):
+        paused = self.reading_paused
+        self.read_paused = True
+        self._update_reading(paused)
+
+    def resume_reading(self):
+        paused = self.reading_paused
+        self.read_paused = False
+        self._update_reading(paused)
+
+    def hold_reading(self):
+        paused = self.reading_paused
+        self.read_held = True
+        self._update_reading(paused)
+
+    def release_reading(self):
+        paused = self.reading_paused
+        self.read_held = False
+        self._update_reading(paused)
+
+    def pause_stream(self):
+        """a stream pauses reading until it calls ``resume_stream``"""
+        paused = self.reading_paused
+        self.streams_paused += 1
+        self._update_reading(paused)
+
+    def resume_stream(self):
+        paused = self.reading_paused
+        self.streams_paused -= 1
+        self._update_reading(paused)
+
+    def pause_writing(self):
+        if not self.write_paused:
+            self.write_paused = True
+            self._is_writable_event.clear()
+
+    def resume_writing(self):
+        if self.write_paused:
+            self.write_paused = False
+            self._is_writable_event.set()
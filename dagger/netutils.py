@@ -1,4 +1,6 @@
+import select
 import socket
+import stat
 import fcntl
 import os
 import logging
@@ -6,7 +8,14 @@ from urllib.parse import urlparse, parse_qsl
 from typing import NamedTuple
 from argparse import Namespace as _Namespace
 
-__all__ = ("resolve_uri", "resolve_query", "create_default_connection", "create_default_listener")
+__all__ = (
+    "resolve_uri",
+    "resolve_query",
+    "create_default_connection",
+    "create_default_listener",
+    "create_unix_connection",
+    "create_unix_listener",
+)
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +74,30 @@ def create_default_connection(
     return sock
 
 
+def create_unix_connection(
+    path: str, connect_timeout: int = 30, timeout: int = 30
+) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(connect_timeout)
+        sock.connect(path)
+    except BaseException:
+        sock.close()
+        raise
+    sock.settimeout(timeout)
+    return sock
+
+
+def readable_when_idle(sock: socket.socket) -> bool:
+    """an idle connection is readable only when it is closed by peer or broken"""
+    try:
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        return bool(poller.poll(0))
+    except (OSError, ValueError):
+        return True
+
+
 def create_default_listener(
     host: str, port: int, timeout: int = 30, blocking=True
 ) -> socket.socket:
@@ -91,3 +124,20 @@ def create_default_listener(
 
     sock.bind((host, port))
     return sock
+
+
+def create_unix_listener(path: str) -> socket.socket:
+    """bind a non-blocking unix socket, a stale socket file of ``path`` is removed"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+    except BaseException:
+        sock.close()
+        raise
+    sock.setblocking(False)
+    return sock
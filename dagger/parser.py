@@ -1,6 +1,8 @@
+import mmap
+import tempfile
 from typing import Any
 
-__all__ = ("Parser", "ParserProtocol")
+__all__ = ("Parser", "ParserProtocol", "SpillBuffer")
 
 
 class ParserProtocol:
@@ -9,6 +11,10 @@ class ParserProtocol:
     def parse_header(self, data: bytes) -> (int, Any):
         raise NotImplementedError
 
+    def spill_payload(self, header) -> bool:
+        """payload of the header is received into a ``SpillBuffer`` instead of memory"""
+        return False
+
     def parse_payload(self, header, data: bytes):
         raise NotImplementedError
 
@@ -16,8 +22,50 @@ class ParserProtocol:
         raise NotImplementedError
 
 
+class SpillBuffer:
+    """Payload received into a temporary file mapped in memory, its pages are backed by the
+    file instead of growing the memory of process.
+    """
+
+    __slots__ = ("_map", "_view", "filled")
+
+    def __init__(self, size: int):
+        with tempfile.TemporaryFile() as f:
+            f.truncate(size)
+            self._map = mmap.mmap(f.fileno(), size)
+        self._view = memoryview(self._map)
+        self.filled = 0
+
+    @property
+    def remaining(self) -> int:
+        return len(self._map) - self.filled
+
+    def write(self, data) -> int:
+        """copy data as much as the rest of buffer, return the size copied"""
+        n = min(len(data), self.remaining)
+        self._view[self.filled : self.filled + n] = data[:n]
+        self.filled += n
+        return n
+
+    def readinto(self, reader) -> int:
+        n = reader.readinto(self._view[self.filled :])
+        self.filled += n
+        return n
+
+    def getvalue(self) -> mmap.mmap:
+        self._view.release()
+        return self._map
+
+
 class Parser:
-    __slots__ = ("_protocol", "_buffer", "_exception", "_next_read_size", "_current_header")
+    __slots__ = (
+        "_protocol",
+        "_buffer",
+        "_exception",
+        "_next_read_size",
+        "_current_header",
+        "_spill",
+    )
 
     def __init__(self, protocol: ParserProtocol):
         self._protocol = protocol
@@ -25,37 +73,63 @@ class Parser:
         self._exception = None
         self._next_read_size = protocol.header_size
         self._current_header = None
+        self._spill = None
+
+    @property
+    def buffered(self) -> int:
+        """bytes received and kept in memory"""
+        return len(self._buffer) if self._buffer is not None else 0
 
     def feed_data(self, data: bytes):
         if self._exception:
             raise self._exception
 
+        try:
+            if self._spill is not None:
+                data = memoryview(data)
+                n = self._spill.write(data)
+                if self._spill.remaining:
+                    return
+                self._complete(self._spill.getvalue())
+                data = data[n:]
+            self._feed_buffer(data)
+        except Exception as exc:
+            # clean buffer
+            self._buffer = None
+            self._spill = None
+            self._exception = exc
+            raise
+
+    def _feed_buffer(self, data):
         buffer = self._buffer
         buffer.extend(data)
         next_read = self._next_read_size
         if next_read > len(buffer):
             return
-        current_header = self._current_header
         protocol = self._protocol
         read = self._read_from_buffer
-        try:
-            while not (len(buffer) < next_read):
-                data = read(next_read)
-                if current_header is None:
-                    next_read, current_header = protocol.parse_header(data)
-                else:
-                    body = protocol.parse_payload(current_header, data)
-                    protocol.on_message_complete(current_header, body)
-                    next_read = protocol.header_size
-                    current_header = None
-        except Exception as exc:
-            # clean buffer
-            self._buffer = None
-            self._exception = exc
-            raise
-        else:
-            self._next_read_size = next_read
-            self._current_header = current_header
+        while not (len(buffer) < next_read):
+            data = read(next_read)
+            if self._current_header is None:
+                next_read, header = protocol.parse_header(data)
+                self._next_read_size, self._current_header = next_read, header
+                if next_read and protocol.spill_payload(header):
+                    self._spill = SpillBuffer(next_read)
+                    rest = bytes(buffer)
+                    buffer.clear()
+                    self.feed_data(rest)
+                    return
+            else:
+                self._complete(data)
+                next_read = self._next_read_size
+
+    def _complete(self, data):
+        header = self._current_header
+        self._spill = None
+        self._next_read_size = self._protocol.header_size
+        self._current_header = None
+        body = self._protocol.parse_payload(header, data)
+        self._protocol.on_message_complete(header, body)
 
     def _read_from_buffer(self, n: int) -> bytes:
         if n <= 0:
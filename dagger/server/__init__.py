@@ -1,2 +1,3 @@
 from dagger.server._configuration import ServerConfiguration
+from dagger.server._file import FileResponse
 from dagger.server.__main__ import start_from_console
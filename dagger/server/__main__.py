@@ -48,6 +48,8 @@ def start_from_console(configuration: ServerConfiguration = None, argv=None):
     host = configuration.host
     port = configuration.port
     print_(f"start server on {host}:{port}")
+    if configuration.unix_socket:
+        print_(f"start server on unix socket {configuration.unix_socket}")
     module = importlib.import_module(args.module)
     print_("load module:", f"'{args.module}'", "at path", f"'{module.__file__}'")
     declares = []
@@ -66,6 +68,7 @@ def start_from_console(configuration: ServerConfiguration = None, argv=None):
 
     def target():
         configuration.loop = asyncio.get_event_loop()
+        configuration.worker_index = manager.worker_index
         server = configuration.make_server()
         server.server_forever()
 
@@ -77,8 +80,15 @@ def start_from_console(configuration: ServerConfiguration = None, argv=None):
     else:
         name = None
 
+    shared_cache = configuration.create_shared_cache()
+    configuration.create_unix_listener()
     manager = Supervisor(target, name=name, worker_memory_limit=configuration.worker_memory_limit)
-    manager.start(configuration.process)
+    try:
+        manager.start(configuration.process)
+    finally:
+        if shared_cache is not None:
+            shared_cache.unlink()
+        configuration.remove_unix_sockets()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
 import asyncio
-import time
+import copy
+import os
+import socket
 from typing import Optional, Dict
 
 from dagger.configuration import (
@@ -8,9 +10,20 @@ from dagger.configuration import (
     ConfigBase,
     int_format,
     float_format,
+    choice_format,
 )
+from dagger import builtins
+from dagger.cache import ResultCache
 from dagger.declare import Declare
 from dagger.logger import logger
+from dagger.netutils import create_unix_listener
+from dagger.server._cursor import CursorTable
+from dagger.server._idle import IdleTracker
+from dagger.server._memory import MemoryGuard
+from dagger.server._objectstore import ObjectStore
+from dagger.server._pubsub import PubSub
+from dagger.server._scheduler import Scheduler
+from dagger.server._sharedcache import SharedResultCache
 
 __all__ = ("ServerConfiguration",)
 
@@ -28,6 +41,27 @@ class ServerConfiguration(ConfigBase):
     )
     host: str = make_property("host", doc="server listen host", default="0.0.0.0")
 
+    unix_socket: str = make_property(
+        "unix_socket",
+        doc="also listen on this unix socket path for callers on the same host, empty disables",
+        default="",
+    )
+
+    unix_socket_per_worker = make_property(
+        "unix_socket_per_worker",
+        doc="every worker listens on its own unix socket, the path is suffixed by .<worker index>",
+        default=False,
+        parser_options={"action": "store_true"},
+    )
+
+    shm_threshold = make_property(
+        "shm_threshold",
+        doc="numpy arrays of at least this bytes in results are passed through shared memory "
+        "files to callers on unix sockets, 0 disables",
+        formatter=int_format(min=0),
+        default=0,
+    )
+
     backlog: int = make_property(
         "backlog", formatter=int_format(min=1), doc="listen backlog", default=50
     )
@@ -39,6 +73,81 @@ class ServerConfiguration(ConfigBase):
         default=5,
     )
 
+    worker_concurrency = make_property(
+        "worker_concurrency",
+        doc="requests of all connections running at once in a worker, waiting requests are "
+        "ordered by priority classes and connections, 0 disables",
+        formatter=int_format(min=0),
+        default=0,
+    )
+
+    stream_buffer_limit = make_property(
+        "stream_buffer_limit",
+        doc="pause reading after this number of stream chunks buffered, 0 means no limit",
+        formatter=int_format(min=0),
+        default=16,
+    )
+
+    max_frame_size = make_property(
+        "max_frame_size",
+        doc="connection sending a frame larger than this bytes is closed before its payload is "
+        "read, 0 means no limit",
+        formatter=int_format(min=0),
+        default=0,
+    )
+
+    spill_threshold = make_property(
+        "spill_threshold",
+        doc="request and stream frames of at least this bytes are received into memory mapped "
+        "temporary files, 0 disables",
+        formatter=int_format(min=0),
+        default=64 * 1024 * 1024,
+    )
+
+    cursor_page_size = make_property(
+        "cursor_page_size",
+        doc="default number of items in one page of cursor",
+        formatter=int_format(min=1),
+        default=1000,
+    )
+
+    cursor_ttl = make_property(
+        "cursor_ttl",
+        doc="cursor idled longer than this seconds would be released, 0 means never",
+        formatter=int_format(min=0),
+        default=60,
+    )
+
+    cursor_memory_limit = make_property(
+        "cursor_memory_limit",
+        doc="release least recently used cursors when estimated memory touch this bytes",
+        formatter=int_format(min=0),
+        default=512 * 1024 * 1024,
+    )
+
+    object_store_limit = make_property(
+        "object_store_limit",
+        doc="evict least recently used stored objects when their size touch this bytes",
+        formatter=int_format(min=0),
+        default=1024 * 1024 * 1024,
+    )
+
+    shared_cache_size = make_property(
+        "shared_cache_size",
+        doc="bytes of result cache shared by all workers, 0 means disabled",
+        formatter=int_format(min=0),
+        default=0,
+    )
+
+    publish_policy = make_property(
+        "publish_policy",
+        doc="messages to subscriber which can not keep up are dropped, or conflated to the "
+        "latest one of each topic",
+        formatter=choice_format("drop", "conflate"),
+        default="conflate",
+        parser_options={"choices": ("drop", "conflate")},
+    )
+
     max_idle_time: int = make_property(
         "max_idle_time",
         doc="after this time flowed, idled connection would be closed",
@@ -56,11 +165,32 @@ class ServerConfiguration(ConfigBase):
         "worker_memory_limit", formatter=int_format(min=0), doc="reload after worker memory touch roof", default=0
     )
 
+    memory_soft_limit = make_property(
+        "memory_soft_limit",
+        doc="pause reading and accepting connections when bytes buffered by connections of a "
+        "worker touch this, 0 disables",
+        formatter=int_format(min=0),
+        default=0,
+    )
+
+    memory_rss_limit = make_property(
+        "memory_rss_limit",
+        doc="pause reading and accepting connections when worker memory touch this bytes, it "
+        "should be lower than worker_memory_limit, 0 disables",
+        formatter=int_format(min=0),
+        default=0,
+    )
+
     log_level = make_property("log_level", doc="logging level", default="INFO")
 
     def __init__(self):
         self._declares: Dict[str, Declare] = {}
         self._server_state = None
+        self.shared_cache: Optional[SharedResultCache] = None
+        # unix socket shared by workers, created in master process
+        self.unix_listener: Optional[socket.socket] = None
+        # set in worker processes
+        self.worker_index = 0
 
     def register_declares(self, *declares: Declare):
         for declare in declares:
@@ -72,6 +202,40 @@ class ServerConfiguration(ConfigBase):
             return self._declares[name]
         return Declare.make_dummy(name)
 
+    def create_shared_cache(self) -> Optional[SharedResultCache]:
+        """create shared cache in master process, workers inherit it by fork"""
+        if self.shared_cache_size and self.shared_cache is None:
+            self.shared_cache = SharedResultCache.create(self.shared_cache_size)
+        return self.shared_cache
+
+    def unix_socket_path(self) -> str:
+        if self.unix_socket_per_worker:
+            return f"{self.unix_socket}.{self.worker_index}"
+        return self.unix_socket
+
+    def create_unix_listener(self) -> Optional[socket.socket]:
+        """create the shared unix socket in master process, workers inherit it by fork"""
+        if self.unix_socket and not self.unix_socket_per_worker and self.unix_listener is None:
+            self.unix_listener = create_unix_listener(self.unix_socket)
+            self.unix_listener.set_inheritable(True)
+        return self.unix_listener
+
+    def remove_unix_sockets(self):
+        if not self.unix_socket:
+            return
+        if self.unix_socket_per_worker:
+            paths = [f"{self.unix_socket}.{i}" for i in range(self.process)]
+        else:
+            paths = [self.unix_socket]
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        if self.unix_listener is not None:
+            self.unix_listener.close()
+            self.unix_listener = None
+
     def make_server(self):
         from dagger.server._server import Server
 
@@ -86,8 +250,10 @@ class ServerConfiguration(ConfigBase):
     def __del__(self):
         self._server_state = None
         self._declares = None
+        self.shared_cache = None
         for i in dir(self):
-            v = getattr(self, i)
+            # do not touch lazy properties like server_state
+            v = getattr(type(self), i, None)
             if isinstance(v, property):
                 try:
                     object.__delattr__(self, i)
@@ -95,66 +261,77 @@ class ServerConfiguration(ConfigBase):
                     pass
 
 
+def _bind(declare: Declare, func, **options) -> Declare:
+    """copy of ``declare`` served by ``func``"""
+    declare = copy.copy(declare)
+    declare.set_server_impl(func, **options)
+    return declare
+
+
 class ServerState:
     def __init__(self, configuration: ServerConfiguration):
-        self._connections = {}
         self.configuration = configuration
-        self._handle: Optional[asyncio.Handle] = None
+        self.idle = IdleTracker(configuration)
+        self.memory = MemoryGuard(configuration)
+        self.scheduler = Scheduler(configuration)
+        self.cursors = CursorTable(configuration)
+        self.objects = ObjectStore(configuration)
+        self.caches: Dict[str, ResultCache] = {}
+        # packed response futures of coalesced requests in flight
+        self.inflight: Dict[bytes, asyncio.Future] = {}
+        self.coalesced = 0
+        self.pubsub = PubSub(configuration)
+
+        # builtins are copied for every configuration, the module level ones are never bound
+        configuration.register_declares(
+            _bind(builtins.fetch, self.cursors.fetch, thread=True),
+            _bind(builtins.close_cursor, self.cursors.close, thread=False),
+            _bind(builtins.put, self.objects.put, thread=True),
+            _bind(builtins.release, self.objects.release, thread=False),
+            _bind(builtins.subscribe, self.pubsub.subscribe, thread=False, pass_connection=True),
+            _bind(
+                builtins.unsubscribe, self.pubsub.unsubscribe, thread=False, pass_connection=True
+            ),
+        )
 
     @property
     def connections(self):
-        return self._connections
+        return self.idle.connections
+
+    def publish(self, topic: str, ob):
+        """push ``ob`` to connections of this worker which subscribed ``topic``"""
+        self.pubsub.publish(topic, ob)
+
+    def get_cache(self, declare: Declare) -> ResultCache:
+        cache = self.caches.get(declare.name)
+        if cache is None:
+            options = declare.cache_options
+            shared_cache = self.configuration.shared_cache
+            if options.shared and shared_cache is not None:
+                cache = shared_cache.view(options)
+            else:
+                cache = ResultCache(options)
+            self.caches[declare.name] = cache
+        return cache
 
     def connection_lost(self, conn):
-        self._connections.pop(conn, None)
+        self.idle.remove(conn)
+        self.cursors.release(conn)
+        self.pubsub.release(conn)
+        self.scheduler.release(conn)
 
     def connection_made(self, conn):
-        self._connections[conn] = time.time()
+        self.idle.add(conn)
+        if self.memory.paused:
+            conn.flow.hold_reading()
 
     def connection_active(self, conn):
-        self._connections[conn] = time.time()
-
-    def _check_inactive(self):
-        logger.debug("check inactive transport track-size=%d", len(self._connections))
-        max_inactive_time = self.configuration.max_idle_time
-
-        active = {}
-        pending_close = []
-        now = time.time()
-        for transport, last_active_time in self._connections.items():
-            if transport.is_closing():
-                continue
-            if now - last_active_time > max_inactive_time:
-                pending_close.append(transport)
-            else:
-                active[transport] = last_active_time
-
-        for v in pending_close:
-            logger.info(
-                "transport %s inactivate after %d seconds, close it now", v, max_inactive_time
-            )
-            v.close()
-
-        self._connections = active
-        self._schedule()
-
-    def _schedule(self):
-        configuration = self.configuration
-        if self._handle:
-            self._handle.cancel()
-
-        self._handle = configuration.loop.call_later(
-            configuration.max_idle_time, self._check_inactive
-        )
+        conn.active_tick = self.idle.current
 
     def start_monitor(self):
         configuration = self.configuration
-        logger.info(
-            "start remove idle(%s s) transport schedule every %d seconds",
-            configuration.max_idle_time,
-            configuration.max_idle_time,
-        )
-        self._schedule()
+        logger.info("start remove idle(%s s) transport", configuration.max_idle_time)
+        self.idle.start()
 
     def current_size(self):
-        return len(self._connections)
+        return len(self.idle)
@@ -0,0 +1,167 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from itertools import islice
+
+from dagger.codec import pandas_support, numpy_support
+from dagger.exceptions import CursorNotFound
+from dagger.logger import logger
+from dagger.utils import get_unique_id
+
+if pandas_support:
+    import pandas as pd
+
+if numpy_support:
+    import numpy as np
+
+__all__ = ("CursorTable",)
+
+
+def _estimate_size(ob) -> int:
+    if numpy_support and isinstance(ob, np.ndarray):
+        return ob.nbytes
+    if pandas_support and isinstance(ob, pd.DataFrame):
+        return int(ob.memory_usage(index=True).sum())
+    if isinstance(ob, (bytes, bytearray, str)):
+        return len(ob)
+    if isinstance(ob, (list, tuple)):
+        sample = ob[:64]
+        if not sample:
+            return sys.getsizeof(ob)
+        each = sum(sys.getsizeof(i) for i in sample) / len(sample)
+        return sys.getsizeof(ob) + int(each * len(ob))
+    return sys.getsizeof(ob)
+
+
+def _is_sliceable(ob) -> bool:
+    if isinstance(ob, Sequence):
+        return True
+    if numpy_support and isinstance(ob, np.ndarray):
+        return True
+    return pandas_support and isinstance(ob, pd.DataFrame)
+
+
+class _Cursor:
+    __slots__ = ("owner", "result", "iterator", "offset", "size", "last_active", "lock")
+
+    def __init__(self, owner, result):
+        self.owner = owner
+        self.offset = 0
+        self.size = _estimate_size(result)
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+        if _is_sliceable(result):
+            self.result = result
+            self.iterator = None
+        else:
+            self.result = None
+            self.iterator = iter(result)
+
+    def next_page(self, n: int):
+        self.last_active = time.monotonic()
+        if self.iterator is not None:
+            page = list(islice(self.iterator, n))
+            return page, len(page) < n
+
+        result = self.result
+        start = self.offset
+        stop = start + n
+        if pandas_support and isinstance(result, pd.DataFrame):
+            page = result.iloc[start:stop]
+        else:
+            page = result[start:stop]
+        self.offset = stop
+        return page, stop >= len(result)
+
+
+class CursorTable:
+    """Results kept in server which are fetched by client page by page.
+
+    A cursor is released when it is exhausted, closed by client, idle for longer than
+    ``cursor_ttl``, evicted by ``cursor_memory_limit`` or the owner connection lost.
+    """
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self._cursors: "OrderedDict[bytes, _Cursor]" = OrderedDict()
+        self._memory = 0
+        self._mutex = threading.Lock()
+        self._handle = None
+
+    @property
+    def memory(self) -> int:
+        return self._memory
+
+    def __len__(self):
+        return len(self._cursors)
+
+    def open(self, owner, result):
+        """register result, return ``[cursor, first page, done]``"""
+        cursor = _Cursor(owner, result)
+        page, done = cursor.next_page(self.configuration.cursor_page_size)
+        if done:
+            return [None, page, True]
+
+        handle = get_unique_id()
+        with self._mutex:
+            self._cursors[handle] = cursor
+            self._memory += cursor.size
+            self._evict()
+        # open may be called in executor thread
+        self.configuration.loop.call_soon_threadsafe(self._schedule)
+        return [handle, page, False]
+
+    def fetch(self, handle: bytes, n: int = 0):
+        if n <= 0:
+            n = self.configuration.cursor_page_size
+        with self._mutex:
+            cursor = self._cursors.get(handle)
+            if cursor is None:
+                raise CursorNotFound(handle.hex() if handle else handle)
+            self._cursors.move_to_end(handle)
+
+        with cursor.lock:
+            page, done = cursor.next_page(n)
+        if done:
+            self.close(handle)
+        return [page, done]
+
+    def close(self, handle: bytes):
+        with self._mutex:
+            cursor = self._cursors.pop(handle, None)
+            if cursor is not None:
+                self._memory -= cursor.size
+
+    def release(self, owner):
+        with self._mutex:
+            handles = [k for k, v in self._cursors.items() if v.owner is owner]
+            for handle in handles:
+                self._memory -= self._cursors.pop(handle).size
+
+    def _evict(self):
+        limit = self.configuration.cursor_memory_limit
+        cursors = self._cursors
+        while limit and self._memory > limit and len(cursors) > 1:
+            handle, cursor = cursors.popitem(last=False)
+            self._memory -= cursor.size
+            logger.warning("cursor %s evicted because memory limit %d", handle.hex(), limit)
+
+    def _check_expired(self):
+        self._handle = None
+        ttl = self.configuration.cursor_ttl
+        deadline = time.monotonic() - ttl
+        with self._mutex:
+            expired = [k for k, v in self._cursors.items() if v.last_active < deadline]
+            for handle in expired:
+                self._memory -= self._cursors.pop(handle).size
+        if expired:
+            logger.info("%d cursors expired after %d seconds", len(expired), ttl)
+        self._schedule()
+
+    def _schedule(self):
+        ttl = self.configuration.cursor_ttl
+        if self._handle is not None or not ttl or not self._cursors:
+            return
+        self._handle = self.configuration.loop.call_later(ttl, self._check_expired)
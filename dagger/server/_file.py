@@ -0,0 +1,57 @@
+import os
+from typing import BinaryIO, Optional, Tuple
+
+__all__ = ("FileResponse",)
+
+
+class FileResponse:
+    """Result of declare sent as the raw content of a file or a buffer.
+
+    ``source`` is a path or a buffer such as ``mmap``, ``count`` bytes from ``offset`` are
+    sent, to the end if ``count`` is ``None``. A file is sent by ``loop.sendfile`` without
+    being read into the worker. Client receives the content as a memory map of a temporary
+    file. It is never stored in the result cache of declare.
+    """
+
+    __slots__ = ("source", "offset", "count")
+
+    # payload size of frame has 32 bits
+    max_size = 2 ** 32 - 1
+
+    def __init__(self, source, offset: int = 0, count: Optional[int] = None):
+        if offset < 0 or (count is not None and count < 0):
+            raise ValueError("offset and count should not be negative")
+        self.source = source
+        self.offset = offset
+        self.count = count
+
+    @property
+    def is_path(self) -> bool:
+        return isinstance(self.source, (str, os.PathLike))
+
+    def open(self) -> Tuple[Optional[BinaryIO], int]:
+        """return the opened file of path and the size to send"""
+        if self.is_path:
+            file = open(self.source, "rb")
+            try:
+                total = os.fstat(file.fileno()).st_size
+            except BaseException:
+                file.close()
+                raise
+        else:
+            file = None
+            total = memoryview(self.source).nbytes
+        size = max(total - self.offset, 0)
+        if self.count is not None:
+            size = min(size, self.count)
+        if size > self.max_size:
+            if file is not None:
+                file.close()
+            raise ValueError(f"{size} bytes exceed the max size of frame")
+        return file, size
+
+    def __str__(self):
+        source = self.source if self.is_path else type(self.source).__name__
+        return f"<{self.__class__.__name__} {source} offset={self.offset} count={self.count}>"
+
+    __repr__ = __str__
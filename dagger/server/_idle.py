@@ -0,0 +1,101 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from dagger.logger import logger
+
+__all__ = ("IdleTracker",)
+
+
+class IdleTracker:
+    """Close connections idle for ``max_idle_time`` seconds.
+
+    Time is counted in coarse ticks, ``resolution`` ticks per ``max_idle_time``. Activity of
+    a connection only stores the current tick to ``conn.active_tick``. Connections are kept
+    in the slot of a timing wheel where their idle deadline falls, a due slot is checked when
+    the wheel turns and its active connections are moved to the slot of their new deadline,
+    so the cost does not grow with the number of idle connections. A busy connection, which
+    has requests not finished or subscriptions, is never closed.
+    """
+
+    resolution = 8
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.current = 0
+        self._wheel: List[Set] = [set() for _ in range(self.resolution + 1)]
+        # connection -> slot of wheel
+        self._slots: Dict[object, int] = {}
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self.closed = 0
+
+    @property
+    def connections(self):
+        return self._slots.keys()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, conn):
+        conn.active_tick = self.current
+        self._put(conn, self.current + self.resolution)
+
+    def remove(self, conn):
+        slot = self._slots.pop(conn, None)
+        if slot is not None:
+            self._wheel[slot].discard(conn)
+
+    def _put(self, conn, deadline: int):
+        slot = deadline % len(self._wheel)
+        self._wheel[slot].add(conn)
+        self._slots[conn] = slot
+
+    def start(self):
+        if self._handle is None:
+            self._schedule()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self):
+        configuration = self.configuration
+        self._handle = configuration.loop.call_later(
+            configuration.max_idle_time / self.resolution, self.turn
+        )
+
+    def turn(self):
+        """advance one tick and close connections whose deadline passed"""
+        self.current += 1
+        current = self.current
+        resolution = self.resolution
+        wheel = self._wheel
+        slots = self._slots
+        size = len(wheel)
+        slot = current % size
+        due = wheel[slot]
+        wheel[slot] = set()
+        closed = 0
+        for conn in due:
+            deadline = conn.active_tick + resolution
+            if deadline <= current and conn.is_busy():
+                deadline = current + resolution
+            if deadline > current:
+                # active since it was put, move it to the slot of new deadline
+                slot = deadline % size
+                wheel[slot].add(conn)
+                slots[conn] = slot
+                continue
+            del slots[conn]
+            if not conn.is_closing():
+                closed += 1
+                conn.close()
+        if closed:
+            self.closed += closed
+            logger.info(
+                "close %d connections inactivate after %s seconds",
+                closed,
+                self.configuration.max_idle_time,
+            )
+        if self._handle is not None:
+            self._schedule()
@@ -0,0 +1,104 @@
+import asyncio
+from typing import Optional
+
+import psutil
+
+from dagger.logger import logger
+
+__all__ = ("MemoryGuard",)
+
+
+class MemoryGuard:
+    """Pause reading of connections and accepting of new connections before the worker runs
+    out of memory.
+
+    Bytes buffered by connections are received data not handled yet, payloads of pending and
+    running requests, chunks of streams not read and responses held by transports which
+    paused writing. Connections report the change of them with ``add``, so checking does not
+    scan connections. The worker is paused when they touch ``memory_soft_limit`` or its RSS
+    touches ``memory_rss_limit``, and resumed when both fall below ``resume_ratio`` of the
+    limits. Killing by ``worker_memory_limit`` is the last resort.
+    """
+
+    interval = 0.5
+    resume_ratio = 0.8
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.paused = False
+        self.pauses = 0
+        self.buffered = 0
+        self.rss = 0
+        self._server = None
+        self._process: Optional[psutil.Process] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def enabled(self) -> bool:
+        configuration = self.configuration
+        return bool(configuration.memory_soft_limit or configuration.memory_rss_limit)
+
+    def start(self, server):
+        """``server`` is paused with ``pause_serving`` and resumed with ``resume_serving``"""
+        self._server = server
+        if self._handle is None:
+            self._schedule()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self):
+        self._handle = self.configuration.loop.call_later(self.interval, self.check)
+
+    def add(self, n: int):
+        """bytes buffered by connections grow by ``n``, it is negative when they are released"""
+        self.buffered += n
+
+    def _over(self, ratio: float) -> bool:
+        configuration = self.configuration
+        soft_limit = configuration.memory_soft_limit
+        rss_limit = configuration.memory_rss_limit
+        if soft_limit and self.buffered >= soft_limit * ratio:
+            return True
+        return bool(rss_limit) and self.rss >= rss_limit * ratio
+
+    def check(self):
+        if self.configuration.memory_rss_limit:
+            if self._process is None:
+                self._process = psutil.Process()
+            self.rss = self._process.memory_info().rss
+        if not self.paused and self._over(1):
+            self._pause(self.configuration.server_state.connections)
+        elif self.paused and not self._over(self.resume_ratio):
+            self._resume(self.configuration.server_state.connections)
+        if self._handle is not None:
+            self._schedule()
+
+    def _pause(self, connections):
+        self.paused = True
+        self.pauses += 1
+        for conn in connections:
+            conn.flow.hold_reading()
+        if self._server is not None:
+            self._server.pause_serving()
+        logger.warning(
+            "pause reading of %d connections, buffered %d bytes, rss %d bytes",
+            len(connections),
+            self.buffered,
+            self.rss,
+        )
+
+    def _resume(self, connections):
+        self.paused = False
+        for conn in connections:
+            conn.flow.release_reading()
+        if self._server is not None:
+            self._server.resume_serving()
+        logger.info(
+            "resume reading of %d connections, buffered %d bytes, rss %d bytes",
+            len(connections),
+            self.buffered,
+            self.rss,
+        )
@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+from dagger.codec import ObjectRef, unpack_object
+from dagger.exceptions import ObjectNotFound, ContentVerifyFailed
+from dagger.logger import logger
+
+__all__ = ("ObjectStore",)
+
+
+class ObjectStore:
+    """Objects uploaded by client, which are referred by ``ObjectRef`` in request arguments.
+
+    Least recently used objects are evicted when total packed size exceeds
+    ``object_store_limit``.
+    """
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self._objects: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._memory = 0
+        self._mutex = threading.Lock()
+
+    @property
+    def memory(self) -> int:
+        return self._memory
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, handle: bytes):
+        return handle in self._objects
+
+    def put(self, handle: bytes, data: bytes):
+        if ObjectRef.digest(data) != handle:
+            raise ContentVerifyFailed("object digest mismatched")
+        ob = unpack_object(data)
+        size = len(data)
+        with self._mutex:
+            old = self._objects.pop(handle, None)
+            if old is not None:
+                self._memory -= old[1]
+            self._objects[handle] = (ob, size)
+            self._memory += size
+            self._evict()
+
+    def release(self, handle: bytes):
+        with self._mutex:
+            item = self._objects.pop(handle, None)
+            if item is not None:
+                self._memory -= item[1]
+
+    def get(self, handle: bytes):
+        with self._mutex:
+            try:
+                ob, _ = self._objects[handle]
+            except KeyError:
+                raise ObjectNotFound(handle.hex()) from None
+            self._objects.move_to_end(handle)
+        return ob
+
+    def resolve(self, args: list) -> list:
+        """replace object references in arguments with stored objects"""
+        for i, arg in enumerate(args):
+            if isinstance(arg, ObjectRef):
+                args[i] = self.get(arg.handle)
+        return args
+
+    def _evict(self):
+        limit = self.configuration.object_store_limit
+        objects = self._objects
+        while limit and self._memory > limit and len(objects) > 1:
+            handle, (_, size) = objects.popitem(last=False)
+            self._memory -= size
+            logger.info("object %s evicted because memory limit %d", handle.hex(), limit)
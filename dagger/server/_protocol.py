@@ -1,13 +1,25 @@
 import asyncio
+import hashlib
+import mmap
+import socket
 from concurrent.futures import ThreadPoolExecutor
 from collections import deque
-from typing import Optional, Set, Deque
+from functools import partial
+from typing import Optional, Set, Deque, Dict
 
 from dagger.exceptions import FrameError, PackUnpackError, ContentVerifyFailed
-from dagger.codec import pack_message, EventType, unpack_payload, decode_header, Header
+from dagger.exceptions import RemoteInternalError, PayloadTooLarge
+from dagger.cache import CacheState, ResultCache
+from dagger.codec import pack_payload, encode_header, EventType, unpack_payload, decode_header
+from dagger.codec import pack_message, pack_object, compress_payload, decompress_payload
+from dagger.codec import Header, make_etag, request_identity
+from dagger.flowcontrol import FlowControl
 from dagger.parser import ParserProtocol, Parser
 from dagger.logger import logger
 from dagger.server._configuration import ServerConfiguration
+from dagger.server._file import FileResponse
+from dagger.server._scheduler import Scheduler
+from dagger.server._stream import StreamReader
 
 __all__ = ("DefaultServerProtocol",)
 
@@ -15,46 +27,24 @@ _ManagerPool = ThreadPoolExecutor(32, "ManagerThread-")
 
 
 class Message:
-    __slots__ = ("sequence_number", "method", "args")
+    __slots__ = ("sequence_number", "method", "args", "digest", "etag", "size", "priority")
 
     def __init__(self, sequence_number: int, method: str, args: list):
         self.sequence_number = sequence_number
         self.method = method
         self.args = args
+        self.digest = None
+        # etag of the result client already has
+        self.etag = None
+        # bytes of payload in memory
+        self.size = 0
+        # priority class asked by client
+        self.priority = None
 
 
-class FlowControl:
-    __slots__ = ("_transport", "read_paused", "write_paused", "_is_writable_event")
-
-    def __init__(self, transport):
-        self._transport = transport
-        self.read_paused = False
-        self.write_paused = False
-        self._is_writable_event = asyncio.Event()
-        self._is_writable_event.set()
-
-    async def drain(self):
-        await self._is_writable_event.wait()
-
-    def pause_reading(self):
-        if not self.read_paused:
-            self.read_paused = True
-            self._transport.pause_reading()
-
-    def resume_reading(self):
-        if self.read_paused:
-            self.read_paused = False
-            self._transport.resume_reading()
-
-    def pause_writing(self):
-        if not self.write_paused:
-            self.write_paused = True
-            self._is_writable_event.clear()
-
-    def resume_writing(self):
-        if self.write_paused:
-            self.write_paused = False
-            self._is_writable_event.set()
+def request_digest(data: bytes) -> bytes:
+    """requests with the same method and arguments have the same digest"""
+    return hashlib.blake2b(data, digest_size=16).digest()
 
 
 class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
@@ -64,9 +54,17 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
         "_parser",
         "_pending_message",
         "_running_tasks",
+        "_streams",
+        "_conflated",
         "should_close",
         "count",
         "flow",
+        "active_tick",
+        "unix",
+        "_writing_file",
+        "_write_buffered",
+        "_accounted",
+        "_lost",
     )
     parser_class = Parser
     header_size = 8
@@ -77,34 +75,129 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
         self._parser = self.parser_class(self)
         self._pending_message: Deque[Message] = deque()
         self._running_tasks: Set[asyncio.Task] = set()
+        self._streams: Dict[int, StreamReader] = {}
+        # latest published message of each topic while writing paused
+        self._conflated: Dict[str, bytes] = {}
 
         self.should_close = None
         self._transport: Optional[asyncio.Transport] = None
         self.flow: Optional[FlowControl] = None
 
         self.count = 0
+        # tick of idle tracker when the connection was active
+        self.active_tick = 0
+        # connected through an unix socket, the client is on the same host
+        self.unix = False
+        # done when the content of a FileResponse is written, other writes wait for it
+        self._writing_file: Optional[asyncio.Future] = None
+        # size of transport write buffer counted while writing is paused
+        self._write_buffered = 0
+        # bytes counted by memory guard of the worker, released once connection is lost
+        self._accounted = 0
+        self._lost = False
 
     # parser protocol
 
+    _accept_event_types = frozenset(
+        (EventType.REQUEST, EventType.STREAM, EventType.STREAM_END, EventType.PING)
+    )
+
     def parse_header(self, data: bytes) -> (int, Header):
         header = decode_header(data)
-        if header.event_type != EventType.REQUEST:
+        if header.event_type not in self._accept_event_types:
             raise FrameError(f"Invalid event type: {header.event_type}")
+        max_frame_size = self.configuration.max_frame_size
+        if max_frame_size and header.payload_size > max_frame_size:
+            exc = PayloadTooLarge(f"{header.payload_size} bytes, max {max_frame_size}")
+            if header.event_type == EventType.REQUEST and self._writing_file is None:
+                # the payload is not read, the connection could not be used any more
+                rv = pack_message(header.sequence_number, EventType.RESPONSE.value, exc)
+                self._transport.write(rv)
+            raise exc
 
         return header.payload_size, header
 
+    def spill_payload(self, header: Header) -> bool:
+        threshold = self.configuration.spill_threshold
+        return bool(threshold) and header.payload_size >= threshold
+
     def parse_payload(self, header: Header, data: bytes):
-        body = unpack_payload(header.compress_flag, data)
-        if not isinstance(body, list) or len(body) != 2:
+        if header.event_type in (EventType.STREAM_END, EventType.PING):
+            return None
+        if isinstance(data, mmap.mmap):
+            raw = None
+            body = unpack_payload(header.compress_flag, data)
+        else:
+            # decompressed once, the digest of request is made on it
+            raw = decompress_payload(header.compress_flag, data)
+            body = unpack_payload(0, raw)
+        if header.event_type == EventType.STREAM:
+            return body
+
+        if not isinstance(body, list) or len(body) not in (2, 3):
             raise ContentVerifyFailed(f"invalid request: {body}")
 
-        method, args = body
+        method, args, *extra = body
         if not isinstance(args, list) or not isinstance(method, str):
             raise ContentVerifyFailed(f"invalid request: {body}")
-        return Message(header.sequence_number, method, args)
+        message = Message(header.sequence_number, method, args)
+        if not isinstance(data, mmap.mmap):
+            message.size = len(data)
+            self._account(message.size)
+        if extra:
+            # request options
+            options = extra[0]
+            if not isinstance(options, dict):
+                raise ContentVerifyFailed(f"invalid request options: {options}")
+            message.etag = options.get("etag")
+            message.priority = options.get("priority")
+            if message.priority is not None and message.priority not in Scheduler.classes:
+                raise ContentVerifyFailed(f"invalid priority: {message.priority}")
+        declare = self.configuration.get_declare(method)
+        if declare.cache_options is not None or declare.coalesce:
+            if raw is None:
+                # spilled payload is decompressed into another map
+                raw = pack_object([method, args])
+                extra = None
+            message.digest = request_digest(request_identity(raw, bool(extra)))
+        return message
 
     def on_message_complete(self, header: Header, message: Message):
+        event_type = header.event_type
+        if event_type == EventType.PING:
+            pong = encode_header(0, header.sequence_number, 0, 0, EventType.PONG.value)
+            if self._writing_file is None:
+                self._transport.write(pong)
+            else:
+                self.loop.create_task(self._write_after_file(pong))
+            return
+        if event_type == EventType.STREAM:
+            self._get_stream(header.sequence_number).feed_chunk(message, header.payload_size)
+            return
+        if event_type == EventType.STREAM_END:
+            self._get_stream(header.sequence_number).feed_eof()
+            del self._streams[header.sequence_number]
+            return
+
+        declare = self.configuration.get_declare(message.method)
+        if declare.stream:
+            # stream request is always consumed at once, otherwise chunks would be blocked
+            # by pending requests.
+            self._open_stream(message)
+            self._consume_one_message(message)
+            return
+
         concurrency_limit = self.configuration.concurrency_limit
+        scheduler = self.configuration.server_state.scheduler
+        if scheduler.enabled:
+            priority = declare.priority
+            if message.priority is not None:
+                priority = scheduler.lower(priority, message.priority)
+            scheduler.push(self, message, priority)
+            if scheduler.queued(self) > concurrency_limit:
+                self.flow.pause_reading()
+            return
+
         running_events = self._running_tasks
         if concurrency_limit != 0 and len(running_events) > concurrency_limit:
             logger.debug(self, "offend flow control")
@@ -113,11 +206,28 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
         else:
             self._consume_one_message(message)
 
+    def _open_stream(self, message: Message):
+        if message.sequence_number in self._streams:
+            raise FrameError(f"duplicated stream sequence: {message.sequence_number}")
+        reader = StreamReader(
+            self.loop, self.flow, self.configuration.stream_buffer_limit, self._account
+        )
+        self._streams[message.sequence_number] = reader
+        message.args.append(reader)
+
+    def _get_stream(self, sequence_number: int) -> StreamReader:
+        try:
+            return self._streams[sequence_number]
+        except KeyError:
+            raise FrameError(f"no stream for sequence: {sequence_number}")
+
     # async Protocol
 
     def connection_made(self, transport: asyncio.Transport) -> None:
         self._transport = transport
         self.flow = FlowControl(transport)
+        sock = transport.get_extra_info("socket")
+        self.unix = sock is not None and sock.family == socket.AF_UNIX
         self.configuration.server_state.connection_made(self)
         logger.info(
             "Connection made: %s, monitored=%d",
@@ -129,13 +239,24 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
         self.configuration.server_state.connection_active(self)
         if logger.isEnabledFor(10):  # debug log level
             logger.debug("Connection recv data: %s, size=%d", self, len(data))
+        parser = self._parser
+        buffered = parser.buffered
         try:
-            self._parser.feed_data(data)
+            parser.feed_data(data)
         except Exception as exc:
             self._fatal(exc)
+        self._account(parser.buffered - buffered)
 
     def connection_lost(self, exc):
         self.configuration.server_state.connection_lost(self)
+        self.configuration.server_state.memory.add(-self._accounted)
+        self._accounted = 0
+        self._lost = True
+        if self._streams:
+            stream_exc = ConnectionError("connection lost")
+            for reader in self._streams.values():
+                reader.set_exception(stream_exc)
+            self._streams.clear()
         logger.info(
             "Connection lost: %s, consumed-event=%d, monitored=%d exc=%r",
             self.getpeername(),
@@ -147,13 +268,65 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
     def pause_writing(self):
         """Called by the transport when the write buffer exceeds the high water mark."""
         self.flow.pause_writing()
+        self._account_writes()
 
     def resume_writing(self):
         """Called by the transport when the write buffer drops below the low water mark."""
         self.flow.resume_writing()
+        if self._writing_file is None:
+            self._flush_conflated()
+        self._account_writes()
+
+    def _flush_conflated(self):
+        if self._conflated:
+            conflated = self._conflated
+            self._conflated = {}
+            self._transport.writelines(conflated.values())
+            self._account_writes()
+
+    def push(self, topic: str, data: bytes) -> bool:
+        """write published message, return ``False`` if it is dropped"""
+        if self._transport.is_closing():
+            return False
+        if not self.flow.write_paused and self._writing_file is None:
+            self._transport.write(data)
+            self._account_writes()
+            return True
+        if self.configuration.publish_policy == "drop":
+            return False
+        replaced = topic in self._conflated
+        self._conflated[topic] = data
+        return not replaced
 
     # message about inner method
 
+    def is_busy(self) -> bool:
+        """requests are not finished or topics are subscribed"""
+        if self._running_tasks or self._pending_message or self._writing_file is not None:
+            return True
+        state = self.configuration.server_state
+        return bool(state.scheduler.queued(self)) or state.pubsub.subscribed(self)
+
+    def buffered_size(self) -> int:
+        """bytes received but not handled and of responses not written"""
+        return self._accounted
+
+    def _account(self, n: int):
+        """buffered bytes change by ``n``, the change is reported to memory guard of worker"""
+        if n and not self._lost:
+            self._accounted += n
+            self.configuration.server_state.memory.add(n)
+
+    def _account_writes(self):
+        """Transport drains its write buffer silently until the low water mark, where it resumes
+        writing. The buffer is counted only while writing is paused, so bytes already sent
+        are not kept counted.
+        """
+        size = self._transport.get_write_buffer_size() if self.flow.write_paused else 0
+        if size != self._write_buffered:
+            self._account(size - self._write_buffered)
+            self._write_buffered = size
+
     def _consume_one_message(self, msg: Message):
         task = self.loop.create_task(self._response_handler(msg))
         if not task.done():
@@ -161,6 +334,20 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
             task.add_done_callback(self._message_done_cb)
         self.count += 1
 
+    def run_scheduled(self, msg: Message):
+        """run request when it is its turn in the scheduler of worker"""
+        task = self.loop.create_task(self._response_handler(msg))
+        self._running_tasks.add(task)
+        task.add_done_callback(self._scheduled_done_cb)
+        self.count += 1
+        scheduler = self.configuration.server_state.scheduler
+        if scheduler.queued(self) <= self.configuration.concurrency_limit:
+            self.flow.resume_reading()
+
+    def _scheduled_done_cb(self, task):
+        self._running_tasks.discard(task)
+        self.configuration.server_state.scheduler.done()
+
     def _message_done_cb(self, task):
         self._running_tasks.discard(task)
         if self._transport.is_closing():
@@ -180,41 +367,101 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
         self.flow.resume_reading()
 
     async def _response_handler(self, msg: Message):
-        transport = self._transport
+        try:
+            await self._handle_message(msg)
+        finally:
+            self._account(-msg.size)
+
+    async def _handle_message(self, msg: Message):
         configuration = self.configuration
         peername = self.getpeername()
         loop = self.loop
 
         logger.debug("Connection %s prepare consume request seq=%d", peername, msg.sequence_number)
         declare = configuration.get_declare(msg.method)
-        args = msg.args
-        if declare.runmode == declare.SYNC_RUN:
+        cache: Optional[ResultCache] = None
+        if declare.cache_options is not None:
+            cache = configuration.server_state.get_cache(declare)
+            cache_state, cached = cache.lookup(msg.digest)
+            if cache_state != CacheState.MISS:
+                if cache_state == CacheState.STALE:
+                    self._refresh_cache(cache, declare, msg)
+                await self._write_response(msg, *cached)
+                logger.debug("Connection %s hit cache seq=%d", peername, msg.sequence_number)
+                return
+
+        if declare.coalesce:
+            state = configuration.server_state
+            leader = state.inflight.get(msg.digest)
+            if leader is not None:
+                state.coalesced += 1
+                payload = await asyncio.shield(leader)
+                if isinstance(payload, FileResponse):
+                    await self._write_file(msg, payload)
+                else:
+                    await self._write_response(msg, *payload)
+                logger.debug("Connection %s coalesced seq=%d", peername, msg.sequence_number)
+                return
+            state.inflight[msg.digest] = loop.create_future()
             try:
-                rv = declare.server_call(*args)
-            except Exception as e:
-                rv = e
+                await self._execute_and_respond(declare, msg, cache)
+            finally:
+                fut = state.inflight.pop(msg.digest)
+                if not fut.done():
+                    fut.set_result(pack_payload(RemoteInternalError("leader request cancelled")))
+            return
+
+        await self._execute_and_respond(declare, msg, cache)
 
-        elif declare.runmode == declare.ASYNC_RUN:
+    async def _execute_and_respond(self, declare, msg: Message, cache: Optional[ResultCache]):
+        configuration = self.configuration
+        peername = self.getpeername()
+        loop = self.loop
+
+        args = msg.args
+        rv = await self._execute(declare, args)
+        if declare.stream:
+            args[-1].close()
+        if declare.cursor and not isinstance(rv, Exception):
+            cursors = configuration.server_state.cursors
             try:
-                rv = await declare.server_call(*args)
+                rv = await loop.run_in_executor(_ManagerPool, cursors.open, self, rv)
             except Exception as e:
                 rv = e
+        if isinstance(rv, FileResponse):
+            if declare.coalesce:
+                configuration.server_state.inflight[msg.digest].set_result(rv)
+            await self._write_file(msg, rv)
+            logger.debug("Connection %s finish write file %d", peername, msg.sequence_number)
+            return
+        # shared memory files could be received only once, names of them break etags
+        shared = cache is not None or declare.coalesce
+        if shared or declare.conditional or not self.unix:
+            threshold = 0
         else:
-            try:
-                rv = await loop.run_in_executor(_ManagerPool, declare.server_call, *args)
-            except Exception as e:
-                rv = e
+            threshold = configuration.shm_threshold
+        not_modified = False
         try:
-            payload = pack_message(msg.sequence_number, EventType.RESPONSE.value, rv)
+            if msg.etag is not None and not isinstance(rv, Exception):
+                # hashed before compressing, an unchanged result is compressed only to share
+                data = pack_object(rv)
+                not_modified = make_etag(data) == msg.etag
+                payload = (0, 0, None) if not_modified and not shared else compress_payload(data)
+            else:
+                payload = pack_payload(rv, threshold)
         except PackUnpackError as exc:
-            payload = pack_message(msg.sequence_number, EventType.RESPONSE.value, exc)
-
-        if not self._transport.is_closing():
-            if self.flow.write_paused:
-                await self.flow.drain()
-            transport.write(payload)
-            self.configuration.server_state.connection_active(self)
-            self.flow.resume_reading()
+            payload = pack_payload(exc)
+        if cache is not None and not payload[1]:
+            cache.put(msg.digest, payload, len(payload[2]))
+        if declare.coalesce:
+            # followers would write it to their own connections
+            configuration.server_state.inflight[msg.digest].set_result(payload)
+
+        # etag is compared already, the payload is not decompressed again
+        if not_modified:
+            await self._write_response(msg, 0, 0, None, compare=False)
+        else:
+            await self._write_response(msg, *payload, compare=False)
 
         if isinstance(rv, Exception):
             logger.exception(
@@ -229,6 +476,137 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
             )
         return
 
+    async def _write_response(
+        self, msg: Message, compress_flag, errno, data: Optional[bytes], compare=True
+    ):
+        """``data`` of ``None``, or equal to the etag of request if ``compare``, is answered by
+        NOT_MODIFIED. Payloads from cache or other requests are compared.
+        """
+        transport = self._transport
+        if transport.is_closing():
+            return
+        if self.flow.write_paused or self._writing_file is not None:
+            await self._wait_writable()
+        if data is None or (
+            compare
+            and msg.etag is not None
+            and not errno
+            and make_etag(decompress_payload(compress_flag, data)) == msg.etag
+        ):
+            header = encode_header(0, msg.sequence_number, 0, 0, EventType.NOT_MODIFIED.value)
+            transport.write(header)
+        else:
+            header = encode_header(
+                len(data), msg.sequence_number, compress_flag, errno, EventType.RESPONSE.value
+            )
+            transport.writelines((header, data))
+        self._account_writes()
+        self.configuration.server_state.connection_active(self)
+        self.flow.resume_reading()
+
+    async def _wait_writable(self):
+        if self.flow.write_paused:
+            await self.flow.drain()
+        while self._writing_file is not None:
+            await asyncio.shield(self._writing_file)
+
+    async def _write_after_file(self, data: bytes):
+        await self._wait_writable()
+        if not self._transport.is_closing():
+            self._transport.write(data)
+
+    async def _write_file(self, msg: Message, response: FileResponse):
+        try:
+            file, size = await self.loop.run_in_executor(_ManagerPool, response.open)
+        except Exception as exc:
+            logger.warning("open %s failed: %r", response, exc)
+            await self._write_response(msg, *pack_payload(exc))
+            return
+        try:
+            await self._wait_writable()
+            transport = self._transport
+            if transport.is_closing():
+                return
+            header = encode_header(size, msg.sequence_number, 0, 0, EventType.FILE.value)
+            transport.write(header)
+            if size:
+                await self._send_content(response, file, size)
+        finally:
+            if file is not None:
+                file.close()
+        self._account_writes()
+        self.configuration.server_state.connection_active(self)
+        self.flow.resume_reading()
+
+    async def _send_content(self, response: FileResponse, file, size: int):
+        loop = self.loop
+        self._writing_file = writing = loop.create_future()
+        self.configuration.server_state.connection_active(self)
+        try:
+            if file is not None and hasattr(loop, "sendfile"):
+                await loop.sendfile(self._transport, file, response.offset, size)
+            else:
+                source = response.source
+                if file is not None:
+                    # event loop without sendfile writes the mapped file
+                    source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(source)[response.offset : response.offset + size]
+                await self._write_buffer(view)
+        except Exception as exc:
+            # the frame is incomplete, connection could not be used any more
+            self._fatal(exc)
+        finally:
+            self._writing_file = None
+            writing.set_result(None)
+        if not self.flow.write_paused and not self._transport.is_closing():
+            self._flush_conflated()
+
+    async def _write_buffer(self, view: memoryview, chunk_size: int = 256 * 1024):
+        transport = self._transport
+        flow = self.flow
+        for start in range(0, len(view), chunk_size):
+            if transport.is_closing():
+                raise ConnectionError("connection lost")
+            if flow.write_paused:
+                await flow.drain()
+            transport.write(view[start : start + chunk_size])
+
+    def _refresh_cache(self, cache: ResultCache, declare, msg: Message):
+        key = msg.digest
+        if key in cache.refreshing:
+            return
+        cache.refreshing.add(key)
+
+        async def refresh():
+            try:
+                rv = await self._execute(declare, msg.args)
+                if isinstance(rv, Exception):
+                    raise rv
+                payload = pack_payload(rv)
+                cache.put(key, payload, len(payload[2]))
+            except Exception as exc:
+                logger.warning("refresh cache of %s failed: %r", declare.name, exc)
+            finally:
+                cache.refreshing.discard(key)
+
+        self.loop.create_task(refresh())
+
+    async def _execute(self, declare, args: list):
+        """call declare, exception is returned instead of raised"""
+        try:
+            args = self.configuration.server_state.objects.resolve(args)
+            call = declare.server_call
+            if declare.pass_connection:
+                call = partial(call, connection=self)
+            if declare.runmode == declare.SYNC_RUN:
+                return call(*args)
+            elif declare.runmode == declare.ASYNC_RUN:
+                return await call(*args)
+            else:
+                return await self.loop.run_in_executor(_ManagerPool, call, *args)
+        except Exception as e:
+            return e
+
     # close handler
 
     def _fatal(self, exc):
@@ -237,11 +615,19 @@ class DefaultServerProtocol(asyncio.Protocol, ParserProtocol):
         self._transport.close()
         logger.error("transport %s error: ", self.getpeername(), exc_info=exc)
 
+    def is_closing(self) -> bool:
+        return self._transport.is_closing()
+
+    def close(self):
+        self.should_close = True
+        self._transport.close()
+
     def graceful_close(self):
         self._transport.pause_reading()
         self.should_close = True
 
     async def wait_closed(self):
+        self.configuration.server_state.scheduler.flush(self)
         tasks = self._running_tasks
         pending = self._pending_message
         if pending:
@@ -0,0 +1,71 @@
+from collections import defaultdict
+from typing import Dict, Set
+
+from dagger.codec import pack_message, EventType
+
+__all__ = ("PubSub",)
+
+
+class PubSub:
+    """Topics subscribed by connections of this worker.
+
+    Published object is packed once and the same frame is written to every subscriber.
+    A subscriber whose transport paused writing gets nothing (``drop``) or only the latest
+    message of each topic after it resumes (``conflate``), see ``publish_policy``.
+    """
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self._topics: Dict[str, Set] = defaultdict(set)
+        # connection -> topics subscribed
+        self._subscriptions: Dict[object, Set[str]] = defaultdict(set)
+        self.published = 0
+        self.dropped = 0
+
+    def subscribers(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def subscribed(self, conn) -> bool:
+        return conn in self._subscriptions
+
+    def subscribe(self, conn, topic: str):
+        if conn is None:
+            raise RuntimeError("subscribe out of connection")
+        self._topics[topic].add(conn)
+        self._subscriptions[conn].add(topic)
+        return True
+
+    def unsubscribe(self, conn, topic: str):
+        subscribers = self._topics.get(topic)
+        if subscribers is None:
+            return False
+        subscribers.discard(conn)
+        if not subscribers:
+            del self._topics[topic]
+        topics = self._subscriptions.get(conn)
+        if topics is not None:
+            topics.discard(topic)
+            if not topics:
+                del self._subscriptions[conn]
+        return True
+
+    def release(self, conn):
+        for topic in self._subscriptions.pop(conn, ()):
+            subscribers = self._topics[topic]
+            subscribers.discard(conn)
+            if not subscribers:
+                del self._topics[topic]
+
+    def publish(self, topic: str, ob):
+        """thread safe, object is packed in caller thread and delivered in event loop"""
+        data = pack_message(0, EventType.PUBLISH.value, [topic, ob])
+        self.configuration.loop.call_soon_threadsafe(self._deliver, topic, data)
+
+    def _deliver(self, topic: str, data: bytes):
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return
+        self.published += 1
+        for conn in subscribers:
+            if not conn.push(topic, data):
+                self.dropped += 1
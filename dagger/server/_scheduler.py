@@ -0,0 +1,136 @@
+import heapq
+from itertools import count
+from typing import Dict, List, Tuple
+
+from dagger.declare import Declare
+
+__all__ = ("Scheduler",)
+
+
+class _FairQueue:
+    """Self clocked fair queuing, a flow with weight ``w`` is served ``w`` times as often as
+    a flow with weight 1 when both are backlogged.
+    """
+
+    __slots__ = ("_heap", "_finish", "_counter", "virtual_time")
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, object, object]] = []
+        # flow -> finish tag of its last item
+        self._finish: Dict[object, float] = {}
+        self._counter = count()
+        self.virtual_time = 0.0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, flow, weight: float, item):
+        start = max(self.virtual_time, self._finish.get(flow, 0.0))
+        finish = start + 1 / weight
+        self._finish[flow] = finish
+        heapq.heappush(self._heap, (finish, next(self._counter), flow, item))
+
+    def pop(self):
+        finish, _, flow, item = heapq.heappop(self._heap)
+        self.virtual_time = finish
+        return flow, item
+
+    def remove(self, match) -> list:
+        """remove items of flows matched, return them in serving order"""
+        removed = [i for i in self._heap if match(i[2])]
+        if removed:
+            self._heap = [i for i in self._heap if not match(i[2])]
+            heapq.heapify(self._heap)
+        return [(flow, item) for _, _, flow, item in sorted(removed, key=lambda i: i[:2])]
+
+    def release(self, flow):
+        self._finish.pop(flow, None)
+
+
+class Scheduler:
+    """Order requests of all connections of the worker before they run.
+
+    At most ``worker_concurrency`` requests run at once. Requests of ``interactive`` class
+    always run first, the others share the rest by weighted fair queuing, every connection
+    of a class is a flow with the weight of class. Stream requests are not scheduled.
+    """
+
+    INTERACTIVE, DEFAULT, BATCH = classes = Declare.PRIORITIES
+    weights = {INTERACTIVE: 1, DEFAULT: 4, BATCH: 1}
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.running = 0
+        self._interactive = _FairQueue()
+        self._shared = _FairQueue()
+        # connection -> number of its requests queued
+        self._queued: Dict[object, int] = {}
+        self.depths = dict.fromkeys(self.classes, 0)
+        self.dispatched = dict.fromkeys(self.classes, 0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.configuration.worker_concurrency > 0
+
+    @classmethod
+    def lower(cls, a: str, b: str) -> str:
+        """the lower of two priority classes"""
+        return max(a, b, key=cls.classes.index)
+
+    def queued(self, conn) -> int:
+        return self._queued.get(conn, 0)
+
+    def push(self, conn, msg, priority: str):
+        queue = self._interactive if priority == self.INTERACTIVE else self._shared
+        queue.push((conn, priority), self.weights[priority], msg)
+        self._queued[conn] = self._queued.get(conn, 0) + 1
+        self.depths[priority] += 1
+        self.dispatch()
+
+    def done(self):
+        self.running -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        limit = self.configuration.worker_concurrency
+        while self.running < limit:
+            if self._interactive:
+                (conn, priority), msg = self._interactive.pop()
+            elif self._shared:
+                (conn, priority), msg = self._shared.pop()
+            else:
+                return
+            self.depths[priority] -= 1
+            queued = self._queued.get(conn)
+            if queued is None:
+                # connection is lost
+                continue
+            self._queued[conn] = queued - 1
+            self.dispatched[priority] += 1
+            self.running += 1
+            conn.run_scheduled(msg)
+
+    def flush(self, conn):
+        """run queued requests of connection at once regardless of the limit"""
+        if not self.queued(conn):
+            return
+        self._queued[conn] = 0
+        for queue in (self._interactive, self._shared):
+            for (_, priority), msg in queue.remove(lambda flow: flow[0] is conn):
+                self.depths[priority] -= 1
+                self.dispatched[priority] += 1
+                self.running += 1
+                conn.run_scheduled(msg)
+
+    def release(self, conn):
+        """forget connection, its queued requests are skipped"""
+        if self._queued.pop(conn, None) is None:
+            return
+        for priority in self.classes:
+            queue = self._interactive if priority == self.INTERACTIVE else self._shared
+            queue.release((conn, priority))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            i: {"queued": self.depths[i], "dispatched": self.dispatched[i]} for i in self.classes
+        }
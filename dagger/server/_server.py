@@ -3,9 +3,9 @@ import socket
 import signal
 import os
 from functools import partial
-from typing import Optional
+from typing import List, Optional, Tuple
 
-from dagger.netutils import create_default_listener
+from dagger.netutils import create_default_listener, create_unix_listener
 from dagger.logger import logger
 from dagger.server._protocol import DefaultServerProtocol
 from dagger.server._configuration import ServerConfiguration
@@ -22,6 +22,10 @@ class Server:
         self._configuration = configuration
         self._listener: Optional[socket.socket] = None
         self._server: Optional[asyncio.AbstractServer] = None
+        # listening sockets and whether it is unix socket
+        self._listeners: List[Tuple[socket.socket, bool]] = []
+        self._servers: List[asyncio.AbstractServer] = []
+        self._starting: Optional[asyncio.Task] = None
         if protocol_factory:
             self._protocol_factory = protocol_factory
         else:
@@ -31,35 +35,79 @@ class Server:
     def loop(self):
         return self._configuration.loop
 
+    async def _start_serving(self):
+        """Serve on duplicates of listening sockets, so they are kept open and the backlog is
+        accepted by other workers while serving is paused.
+        """
+        loop = self.loop
+        backlog = self._configuration.backlog
+        for sock, unix in self._listeners:
+            create = loop.create_unix_server if unix else loop.create_server
+            server = await create(self._protocol_factory, sock=sock.dup(), backlog=backlog)
+            self._servers.append(server)
+        self._server = self._servers[0]
+
+    def pause_serving(self):
+        """stop accepting new connections"""
+        if self._starting is not None:
+            self._starting.cancel()
+            self._starting = None
+        servers = self._servers
+        self._servers = []
+        for server in servers:
+            server.close()
+
+    def resume_serving(self):
+        if self._servers or self._starting is not None:
+            return
+        self._starting = self.loop.create_task(self._start_serving())
+        self._starting.add_done_callback(self._started)
+
+    def _started(self, task: asyncio.Task):
+        if self._starting is task:
+            self._starting = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("resume serving failed", exc_info=task.exception())
+
     def server_forever(self):
         configuration = self._configuration
         host = configuration.host
         port = configuration.port
         self._listener = _create_non_block_listener(host, port)
         self._listener.set_inheritable(True)
-        server_coro = self.loop.create_server(
-            self._protocol_factory, sock=self._listener, backlog=configuration.backlog
-        )
-        server = self.loop.run_until_complete(server_coro)
-        self._server = server
+        self._listeners.append((self._listener, False))
+        if configuration.unix_socket:
+            unix_listener = configuration.unix_listener
+            if unix_listener is None:
+                unix_listener = create_unix_listener(configuration.unix_socket_path())
+            self._listeners.append((unix_listener, True))
         loop = self.loop
+        loop.run_until_complete(self._start_serving())
         loop.add_signal_handler(signal.SIGINT, loop.stop)
         loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        state = configuration.server_state
         try:
             logger.info("Starting worker [%d]", os.getpid())
 
             if configuration.max_idle_time != 0:
-                configuration.server_state.start_monitor()
+                state.start_monitor()
+            if state.memory.enabled:
+                state.memory.start(self)
 
             loop.run_forever()
         finally:
             logger.info("Stopping worker [%d]", os.getpid())
-            server.close()
+            state.memory.stop()
+            servers = self._servers
+            self.pause_serving()
             # close server socket
-            loop.run_until_complete(server.wait_closed())
+            for server in servers:
+                loop.run_until_complete(server.wait_closed())
+            for sock, _ in self._listeners:
+                sock.close()
 
             # close all connections
-            connections = configuration.server_state.connections
+            connections = state.connections
             coros = []
             for connection in connections:
                 connection.graceful_close()
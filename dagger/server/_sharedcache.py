@@ -0,0 +1,180 @@
+"""
+Result cache shared by all workers of one supervisor.
+
+The segment is split into stripes, each stripe is guarded by its own lock and laid out as
+
+    head        (64bit)     logical position of next write
+    slots       (37 bytes * slot number)
+    data        ring buffer
+
+A slot is ``key(16 bytes), position(64bit), length(32bit), compress flag(8bit),
+expire time(double)``. Payloads are appended to the ring buffer, old payloads are evicted
+by being overwritten, a slot is valid only if its payload has not been overwritten.
+"""
+import multiprocessing
+import struct
+import time
+from typing import List, Optional
+
+from dagger.cache import CacheState, CacheStats
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    shared_memory_support = False
+else:
+    shared_memory_support = True
+
+__all__ = ("SharedResultCache", "shared_memory_support")
+
+_HEAD = struct.Struct("<Q")
+_SLOT = struct.Struct("<16sQIBd")
+_EMPTY_KEY = bytes(16)
+_PROBE = 8
+
+
+class _Stripe:
+    __slots__ = ("lock", "offset", "slots", "data_offset", "capacity")
+
+    def __init__(self, lock, offset: int, size: int, slots: int):
+        self.lock = lock
+        self.offset = offset
+        self.slots = slots
+        self.data_offset = offset + _HEAD.size + _SLOT.size * slots
+        self.capacity = offset + size - self.data_offset
+
+
+class SharedResultCache:
+    """Create it in master process before workers are forked."""
+
+    def __init__(
+        self, memory: "shared_memory.SharedMemory", locks: List, stripes: int, slots: int
+    ):
+        self._memory = memory
+        self._buf = memory.buf
+        stripe_size = memory.size // stripes
+        self._stripes = [
+            _Stripe(locks[i], i * stripe_size, stripe_size, slots) for i in range(stripes)
+        ]
+        self.stats = CacheStats()
+        self.refreshing = set()
+
+    @classmethod
+    def create(cls, size: int, stripes: int = 16, entry_size_hint: int = 1024):
+        if not shared_memory_support:
+            raise RuntimeError("shared memory requires python 3.8 or later")
+        stripe_size = size // stripes
+        slots = max(stripe_size // (entry_size_hint + _SLOT.size), _PROBE)
+        if _HEAD.size + _SLOT.size * slots >= stripe_size:
+            raise ValueError(f"shared cache size {size} is too small")
+
+        # new segment is zero filled, so every slot is empty
+        memory = shared_memory.SharedMemory(create=True, size=stripe_size * stripes)
+        locks = [multiprocessing.Lock() for _ in range(stripes)]
+        return cls(memory, locks, stripes, slots)
+
+    def _locate(self, key: bytes) -> (_Stripe, int):
+        h = int.from_bytes(key[:8], "little")
+        stripe = self._stripes[h % len(self._stripes)]
+        return stripe, (h >> 16) % stripe.slots
+
+    def _slot_offset(self, stripe: _Stripe, index: int) -> int:
+        return stripe.offset + _HEAD.size + _SLOT.size * (index % stripe.slots)
+
+    def _is_alive(self, stripe: _Stripe, head: int, position: int, expire: float, now: float):
+        return expire > now and head <= position + stripe.capacity
+
+    def lookup(self, key: bytes) -> (CacheState, Optional[tuple]):
+        stripe, index = self._locate(key)
+        buf = self._buf
+        now = time.time()
+        with stripe.lock:
+            (head,) = _HEAD.unpack_from(buf, stripe.offset)
+            for i in range(index, index + _PROBE):
+                offset = self._slot_offset(stripe, i)
+                slot_key, position, length, flag, expire = _SLOT.unpack_from(buf, offset)
+                if slot_key != key:
+                    continue
+                if not self._is_alive(stripe, head, position, expire, now):
+                    _SLOT.pack_into(buf, offset, _EMPTY_KEY, 0, 0, 0, 0.0)
+                    break
+                start = stripe.data_offset + position % stripe.capacity
+                data = bytes(buf[start : start + length])
+                self.stats.hits += 1
+                return CacheState.FRESH, (flag, 0, data)
+
+        self.stats.misses += 1
+        return CacheState.MISS, None
+
+    def put(self, key: bytes, value: tuple, ttl: float):
+        flag, errno, data = value
+        length = len(data)
+        stripe, index = self._locate(key)
+        if errno or length > stripe.capacity // 4:
+            return
+
+        buf = self._buf
+        now = time.time()
+        with stripe.lock:
+            (head,) = _HEAD.unpack_from(buf, stripe.offset)
+            physical = head % stripe.capacity
+            if physical + length > stripe.capacity:
+                # payload never wraps around
+                head += stripe.capacity - physical
+                physical = 0
+            start = stripe.data_offset + physical
+            buf[start : start + length] = data
+
+            target = None
+            oldest = None
+            for i in range(index, index + _PROBE):
+                offset = self._slot_offset(stripe, i)
+                slot_key, position, _, _, expire = _SLOT.unpack_from(buf, offset)
+                if slot_key == key or slot_key == _EMPTY_KEY:
+                    target = offset
+                    break
+                if not self._is_alive(stripe, head + length, position, expire, now):
+                    target = offset
+                    break
+                if oldest is None or position < oldest[0]:
+                    oldest = (position, offset)
+            if target is None:
+                target = oldest[1]
+                self.stats.evictions += 1
+
+            _SLOT.pack_into(buf, target, key, head, length, flag, now + ttl)
+            _HEAD.pack_into(buf, stripe.offset, head + length)
+
+    def view(self, options) -> "SharedCacheView":
+        return SharedCacheView(self, options)
+
+    def close(self):
+        self._buf = None
+        self._memory.close()
+
+    def unlink(self):
+        self.close()
+        self._memory.unlink()
+
+
+class SharedCacheView:
+    """Per declare adapter, it has the same interface as ``ResultCache``."""
+
+    __slots__ = ("_cache", "options", "stats", "refreshing")
+
+    def __init__(self, cache: SharedResultCache, options):
+        self._cache = cache
+        self.options = options
+        self.stats = CacheStats()
+        self.refreshing = set()
+
+    def lookup(self, key: bytes):
+        state, value = self._cache.lookup(key)
+        if state == CacheState.MISS:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return state, value
+
+    def put(self, key: bytes, value: tuple, size: int = 0):
+        self._cache.put(key, value, self.options.ttl)
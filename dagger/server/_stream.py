@@ -0,0 +1,134 @@
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Optional, Tuple
+
+from dagger.flowcontrol import FlowControl
+
+__all__ = ("StreamReader",)
+
+
+class StreamReader:
+    """Chunks uploaded by a stream request.
+
+    Iterate it with ``async for`` in asynchronous declares, or with ``for`` in thread declares.
+    Reading of the connection is paused when more than ``limit`` chunks are buffered.
+    ``account`` is called with the change of bytes of buffered chunks.
+    """
+
+    __slots__ = (
+        "_loop",
+        "_flow",
+        "_limit",
+        "_account",
+        "_chunks",
+        "_waiter",
+        "_eof",
+        "_exception",
+        "_paused",
+        "closed",
+    )
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        flow: FlowControl,
+        limit: int,
+        account: Optional[Callable[[int], None]] = None,
+    ):
+        self._loop = loop
+        self._flow = flow
+        self._limit = limit
+        self._account = account
+        # chunk and its size in bytes
+        self._chunks: Deque[Tuple[Any, int]] = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._eof = False
+        self._exception = None
+        # paused by its own buffer, other pauses of the connection are not touched
+        self._paused = False
+        self.closed = False
+
+    def feed_chunk(self, chunk, size: int = 0):
+        if self.closed:
+            return
+        self._chunks.append((chunk, size))
+        if size and self._account is not None:
+            self._account(size)
+        if self._limit and len(self._chunks) > self._limit:
+            self._pause()
+        self._wakeup()
+
+    def feed_eof(self):
+        self._eof = True
+        self._wakeup()
+
+    def set_exception(self, exc):
+        self._exception = exc
+        self._wakeup()
+
+    def close(self):
+        """Drop buffered chunks and ignore the rest of stream."""
+        self.closed = True
+        size = sum(i[1] for i in self._chunks)
+        self._chunks.clear()
+        if size and self._account is not None:
+            self._account(-size)
+        self._resume()
+
+    def _pause(self):
+        if not self._paused:
+            self._paused = True
+            self._flow.pause_stream()
+
+    def _resume(self):
+        if self._paused:
+            self._paused = False
+            self._flow.resume_stream()
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def read(self):
+        while not self._chunks:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        chunk, size = self._chunks.popleft()
+        if size and self._account is not None:
+            self._account(-size)
+        if len(self._chunks) <= self._limit // 2:
+            self._resume()
+        return chunk
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.read()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            # thread without event loop, like threads of executor
+            loop = None
+        if loop is self._loop and loop.is_running():
+            raise RuntimeError("could not iterate stream synchronously in event loop")
+
+        fut = asyncio.run_coroutine_threadsafe(self.read(), self._loop)
+        try:
+            return fut.result()
+        except StopAsyncIteration:
+            raise StopIteration
@@ -0,0 +1,78 @@
+"""Pass large payloads between processes on the same host through shared memory files.
+
+The sender writes a payload into a file of ``SHM_DIR`` (tmpfs) and only sends the file name,
+the receiver maps the file into memory and removes it at once. Files not received in
+``SHM_TTL`` seconds are removed by the sender.
+"""
+import atexit
+import mmap
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Deque, Tuple
+
+__all__ = ("SHM_DIR", "write_shm", "read_shm")
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SHM_TTL = 300
+
+_NAME = re.compile(r"dagger-[0-9a-f]{32}")
+
+_mutex = threading.Lock()
+# names and created time of files sent
+_created: Deque[Tuple[float, str]] = deque()
+
+
+def write_shm(*chunks) -> bytes:
+    """write buffers into a new shared memory file, return its name"""
+    name = f"dagger-{secrets.token_hex(16)}"
+    path = os.path.join(SHM_DIR, name)
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    now = time.monotonic()
+    with _mutex:
+        _created.append((now, name))
+        _sweep(now - SHM_TTL)
+    return name.encode()
+
+
+def read_shm(name: bytes) -> mmap.mmap:
+    """map and remove the shared memory file, memory is released with the returned map"""
+    name = name.decode()
+    if not _NAME.fullmatch(name):
+        raise ValueError(f"invalid shared memory name: {name}")
+    path = os.path.join(SHM_DIR, name)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        st = os.fstat(fd)
+        if st.st_uid != os.getuid():
+            raise PermissionError(f"shared memory {name} is owned by another user")
+        os.unlink(path)
+        return mmap.mmap(fd, st.st_size, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+
+
+def _sweep(before: float):
+    while _created and _created[0][0] <= before:
+        _, name = _created.popleft()
+        try:
+            os.unlink(os.path.join(SHM_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+@atexit.register
+def _sweep_all():
+    with _mutex:
+        _sweep(float("inf"))
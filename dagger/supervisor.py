@@ -25,11 +25,14 @@ class Supervisor:
         self.name = name
         self.should_exit = False
         self.worker_memory_limit = worker_memory_limit
+        # index of the worker in worker processes, a replaced worker keeps it
+        self.worker_index = None
 
     def handle_exit(self, sig, frame):
         self.should_exit = True
 
-    def _run(self, *args, **kwargs):
+    def _run(self, index, *args, **kwargs):
+        self.worker_index = index
         self._set_process_name(False)
         try:
             self.target(*args, **kwargs)
@@ -44,13 +47,17 @@ class Supervisor:
             signal.signal(sig, self.handle_exit)
 
         processes = []
+        indexes = {}
         args = self.args
         kwargs = self.kwargs
         try:
             for idx in range(workers):
-                process = multiprocessing.Process(target=self._run, args=args, kwargs=kwargs)
+                process = multiprocessing.Process(
+                    target=self._run, args=(idx, *args), kwargs=kwargs
+                )
                 process.start()
                 processes.append(process)
+                indexes[process.pid] = idx
 
             max_memory_allowed = self.worker_memory_limit
             while not self.should_exit:
@@ -73,9 +80,13 @@ class Supervisor:
                     if mem.rss > max_memory_allowed:  # bytes
                         os.kill(pid, signal.SIGINT)
                         logger.warning("%s worker killed because memory overflowed", process)
-                        process = multiprocessing.Process(target=self._run, args=args, kwargs=kwargs)
+                        idx = indexes.pop(pid)
+                        process = multiprocessing.Process(
+                            target=self._run, args=(idx, *args), kwargs=kwargs
+                        )
                         process.start()
                         processes.append(process)
+                        indexes[process.pid] = idx
 
                 time.sleep(0.1)
         finally:
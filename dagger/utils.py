@@ -14,7 +14,6 @@ class _IdGenerator:
     def __init__(self):
         self._pid = os.getpid()
         self._max = 0xFFFFFF
-        self._max_flag = self._max - 1
         self._count = SystemRandom().randint(0, self._max)
         self._mutex = threading.Lock()
         self._process_identifier = os.urandom(5)
@@ -37,7 +36,7 @@ class _IdGenerator:
         with self._mutex:
             count = self._count
             id_ += struct.pack(">I", self._count)[1:4]
-            self._count = (count + 1) & self._max_flag
+            self._count = (count + 1) & self._max
         return id_
 
 
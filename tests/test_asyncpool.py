@@ -0,0 +1,239 @@
+import asyncio
+import unittest
+
+from dagger.client import ClientConfiguration
+from dagger.client._asyncpool import AsyncPool
+
+
+class _Connection:
+    def __init__(self, gate: asyncio.Event):
+        self.outstanding = 0
+        self.rtt = 0.0
+        self.is_closed = False
+        self.gate = gate
+
+    def closed(self):
+        return self.is_closed
+
+    async def dispatch_request(self, request):
+        await self.gate.wait()
+        return request
+
+
+class _Request:
+    cursor = False
+    method = "f"
+
+    def __init__(self, n):
+        self.n = n
+
+
+class _Pool(AsyncPool):
+    def __init__(self, configuration):
+        super().__init__(configuration)
+        self.gate = asyncio.Event()
+        self.opened = []
+
+    async def _make_new_connection(self, endpoint):
+        conn = _Connection(self.gate)
+        conn.endpoint = endpoint
+        self.opened.append(conn)
+        return conn
+
+
+class TestAsyncPool(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        configuration = ClientConfiguration()
+        configuration.loop = self.loop
+        configuration.pool_size = 2
+        configuration.connection_concurrency = 2
+        self.pool = _Pool(configuration)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_bounded_and_fair(self):
+        pool = self.pool
+        done = []
+
+        async def call(n):
+            await pool.dispatch_request(_Request(n))
+            done.append(n)
+
+        async def main():
+            await pool.warm_up()
+            tasks = [self.loop.create_task(call(i)) for i in range(10)]
+            await asyncio.sleep(0.01)
+            self.assertEqual([c.outstanding for c in pool.opened], [2, 2])
+            self.assertEqual(len(pool._waiters), 6)
+            pool.gate.set()
+            await asyncio.gather(*tasks)
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(len(pool.opened), 2)
+        self.assertEqual(sorted(done[:4]), [0, 1, 2, 3])
+        self.assertEqual(done[4:], list(range(4, 10)))
+
+    def test_cold_pool(self):
+        pool = self.pool
+
+        async def main():
+            tasks = [self.loop.create_task(pool.dispatch_request(_Request(i))) for i in range(10)]
+            await asyncio.sleep(0.01)
+            self.assertEqual([c.outstanding for c in pool.opened], [2, 2])
+            self.assertEqual(len(pool._waiters), 6)
+            pool.gate.set()
+            await asyncio.gather(*tasks)
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(len(pool.opened), 2)
+        self.assertEqual(pool.inflight, 0)
+
+    def test_replace_closed(self):
+        pool = self.pool
+        pool.gate.set()
+
+        async def main():
+            await pool.warm_up()
+            for conn in pool.opened:
+                conn.is_closed = True
+            self.assertEqual(pool.size, 0)
+            await pool.dispatch_request(_Request(0))
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(len(pool.opened), 3)
+        self.assertEqual(pool.size, 1)
+
+    def test_hedge(self):
+        pool = self.pool
+        pool._configuration.hedges["f"] = 0.01
+        pool._configuration.hedge_budget = 1
+
+        async def main():
+            await pool.warm_up()
+            slow, fast = pool.opened
+            slow.gate = asyncio.Event()
+            fast.outstanding = 1
+            request = _Request(0)
+            self.assertIs(await pool.dispatch_request(request), request)
+            # the slow one is cancelled
+            await asyncio.sleep(0)
+            self.assertEqual((slow.outstanding, fast.outstanding), (0, 1))
+
+        pool.gate.set()
+        self.loop.run_until_complete(main())
+        self.assertEqual((pool.hedging.hedged, pool.hedging.wins), (1, 1))
+        # the cancelled one is not recorded
+        endpoint = pool.balancer.endpoints[0]
+        self.assertEqual((endpoint.requests, endpoint.errors), (1, 0))
+
+    def test_hedge_without_connecting(self):
+        pool = self.pool
+        pool._configuration.hedges["f"] = 0.01
+        pool._configuration.hedge_budget = 1
+
+        async def main():
+            task = self.loop.create_task(pool.dispatch_request(_Request(0)))
+            await asyncio.sleep(0.05)
+            pool.gate.set()
+            await task
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(len(pool.opened), 1)
+        self.assertEqual(pool.hedging.wins, 0)
+        self.assertEqual(pool.inflight, 0)
+
+    def test_hedge_by_p95(self):
+        pool = self.pool
+        pool._configuration.hedges["f"] = None
+        pool._configuration.hedge_budget = 1
+
+        async def main():
+            await pool.warm_up()
+            pool.gate.set()
+            # not hedged until p95 is known
+            for i in range(32):
+                self.assertIsNone(pool.hedging.delay("f"))
+                await pool.dispatch_request(_Request(i))
+            self.assertIsNotNone(pool.hedging.delay("f"))
+            self.assertEqual(pool.hedging.hedged, 0)
+            slow, fast = pool.opened
+            slow.gate = asyncio.Event()
+            fast.outstanding = 1
+            await pool.dispatch_request(_Request(0))
+
+        self.loop.run_until_complete(main())
+        self.assertEqual((pool.hedging.hedged, pool.hedging.wins), (1, 1))
+
+    def test_max_inflight(self):
+        pool = self.pool
+        pool._configuration.max_inflight = 3
+
+        async def main():
+            await pool.warm_up()
+            tasks = [self.loop.create_task(pool.dispatch_request(_Request(i))) for i in range(5)]
+            await asyncio.sleep(0.01)
+            self.assertEqual(pool.inflight, 3)
+            self.assertEqual(len(pool._waiters), 2)
+            pool.gate.set()
+            await asyncio.gather(*tasks)
+            self.assertEqual(pool.inflight, 0)
+
+        self.loop.run_until_complete(main())
+
+    def test_max_inflight_cold(self):
+        pool = self.pool
+        pool._configuration.max_inflight = 3
+
+        async def main():
+            tasks = [self.loop.create_task(pool.dispatch_request(_Request(i))) for i in range(10)]
+            await asyncio.sleep(0.01)
+            self.assertEqual(pool.inflight, 3)
+            self.assertEqual(sum(c.outstanding for c in pool.opened), 3)
+            self.assertEqual(len(pool._waiters), 7)
+            pool.gate.set()
+            await asyncio.gather(*tasks)
+            self.assertEqual(pool.inflight, 0)
+
+        self.loop.run_until_complete(main())
+
+    def test_connect_failure(self):
+        pool = self.pool
+        pool._configuration.max_inflight = 3
+
+        async def fail(endpoint):
+            raise ConnectionRefusedError()
+
+        pool._make_new_connection = fail
+
+        async def main():
+            with self.assertRaises(ConnectionRefusedError):
+                await pool.dispatch_request(_Request(0))
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(pool.inflight, 0)
+
+    def test_reconnect_failure(self):
+        pool = self.pool
+        pool.gate.set()
+
+        async def main():
+            await pool.warm_up()
+            live, closed = pool.opened
+            live.outstanding = 1
+            closed.is_closed = True
+            pool._make_new_connection = fail
+            request = _Request(0)
+            # the live one is used when the empty slot could not be connected
+            self.assertIs(await pool.dispatch_request(request), request)
+            live.outstanding = 2
+            with self.assertRaises(ConnectionRefusedError):
+                await pool.dispatch_request(_Request(1))
+
+        async def fail(endpoint):
+            raise ConnectionRefusedError()
+
+        self.loop.run_until_complete(main())
+        endpoint = pool.balancer.endpoints[0]
+        self.assertEqual(endpoint.errors, 2)
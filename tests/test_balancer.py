@@ -0,0 +1,77 @@
+import time
+import unittest
+
+from dagger.client import ClientConfiguration
+from dagger.client._balancer import Balancer
+from dagger.client._request import Request
+from dagger.exceptions import CircuitOpenError
+
+
+def _configuration(balance):
+    configuration = ClientConfiguration()
+    configuration.endpoints = "a:1,b:2,c:3,d:4"
+    configuration.balance = balance
+    return configuration
+
+
+class TestBalancer(unittest.TestCase):
+    def test_parse_endpoints(self):
+        configuration = ClientConfiguration()
+        self.assertEqual(configuration.endpoint_list(), [("127.0.0.1", 10050)])
+        configuration.endpoints = ["a:1", ("b", "2")]
+        self.assertEqual(configuration.endpoint_list(), [("a", 1), ("b", 2)])
+        configuration.endpoints = "tcp://a:1,unix:///tmp/dagger.sock"
+        self.assertEqual(configuration.endpoint_list(), [("a", 1), ("/tmp/dagger.sock", 0)])
+        with self.assertRaises(ValueError):
+            configuration.endpoints = "a"
+
+    def test_consistent_hash(self):
+        balancer = Balancer(_configuration("hash"))
+        selected = {i: balancer.select(Request("f", [i, 0])) for i in range(100)}
+        self.assertEqual(len(set(selected.values())), 4)
+
+        ejected = selected[0]
+        ejected.healthy = False
+        for i, endpoint in selected.items():
+            rv = balancer.select(Request("f", [i, 1]))
+            if endpoint is not ejected:
+                self.assertIs(rv, endpoint)
+            else:
+                self.assertIsNot(rv, ejected)
+
+    def test_eject_outliers(self):
+        balancer = Balancer(_configuration("least_outstanding"))
+        a, b, c, d = balancer.endpoints
+        for endpoint in balancer.endpoints:
+            endpoint.record(0.01, False)
+        for _ in range(10):
+            a.record(0, True)
+            b.record(0, True)
+        c.record(1.0, False)
+        balancer.check_outliers()
+        # at least half endpoints are kept
+        self.assertEqual(sum(1 for i in balancer.endpoints if i.ejections), 2)
+        self.assertEqual((a.ejections, b.ejections), (1, 1))
+        for _ in range(20):
+            self.assertIn(balancer.select(), (c, d))
+
+    def test_circuit_breaker(self):
+        configuration = ClientConfiguration()
+        configuration.breaker_open_time = 0.05
+        balancer = Balancer(configuration)
+        endpoint = balancer.select()
+        for _ in range(10):
+            endpoint.record(0, True)
+        self.assertEqual(balancer.breaker_states(), {"127.0.0.1:10050": "open"})
+        with self.assertRaises(CircuitOpenError):
+            balancer.select()
+
+        time.sleep(0.06)
+        trials = [balancer.select() for _ in range(endpoint.breaker.trial_calls)]
+        self.assertEqual(endpoint.breaker.state, "half_open")
+        with self.assertRaises(CircuitOpenError):
+            balancer.select()
+        for trial in trials:
+            trial.record(0.01, False)
+        self.assertEqual(endpoint.breaker.state, "closed")
+        self.assertIs(balancer.select(), endpoint)
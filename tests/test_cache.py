@@ -0,0 +1,66 @@
+import unittest
+
+from dagger.cache import CacheOptions, CacheState, ResultCache, make_cache_options
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache(unittest.TestCase):
+    def test_ttl_and_stale(self):
+        clock = _Clock()
+        cache = ResultCache(CacheOptions(ttl=10, stale=5), clock=clock)
+        self.assertEqual(cache.lookup("a"), (CacheState.MISS, None))
+        cache.put("a", 1)
+        self.assertEqual(cache.lookup("a"), (CacheState.FRESH, 1))
+        clock.now = 12
+        self.assertEqual(cache.lookup("a"), (CacheState.STALE, 1))
+        clock.now = 16
+        self.assertEqual(cache.lookup("a"), (CacheState.MISS, None))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats.hits, 1)
+        self.assertEqual(cache.stats.stale_hits, 1)
+        self.assertEqual(cache.stats.misses, 2)
+        self.assertAlmostEqual(cache.stats.hit_ratio, 0.5)
+
+    def test_lru(self):
+        cache = ResultCache(CacheOptions(max_entries=2))
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.lookup("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_lfu(self):
+        cache = ResultCache(CacheOptions(max_entries=2, eviction="lfu"))
+        cache.put("a", 1)
+        cache.put("b", 2)
+        for _ in range(3):
+            cache.lookup("b")
+        cache.lookup("a")
+        cache.put("c", 3)
+        self.assertIn("b", cache)
+        self.assertNotIn("a", cache)
+
+    def test_max_bytes(self):
+        cache = ResultCache(CacheOptions(max_bytes=10))
+        cache.put("a", b"a", 6)
+        cache.put("b", b"b", 6)
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.memory, 6)
+        cache.put("c", b"c", 11)
+        self.assertNotIn("c", cache)
+
+    def test_make_options(self):
+        self.assertIsNone(make_cache_options(None))
+        self.assertEqual(make_cache_options(True), CacheOptions())
+        self.assertEqual(make_cache_options({"ttl": 1}).ttl, 1)
+        with self.assertRaises(ValueError):
+            make_cache_options({"eviction": "fifo"})
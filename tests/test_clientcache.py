@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from dagger.cache import CacheOptions
+from dagger.client._cache import ClientCache
+
+
+class TestClientCache(unittest.TestCase):
+    def test_deduplicate_threads(self):
+        cache = ClientCache(CacheOptions())
+        calls = []
+
+        def dispatch():
+            calls.append(1)
+            time.sleep(0.05)
+            return [1, 2]
+
+        key = cache.make_key([1])
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.call(key, dispatch)))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [[1, 2]] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.call(key, dispatch), [1, 2])
+        self.assertEqual(cache.stats.hits + cache.deduplicated, 8)
+
+    def test_deduplicate_coroutines(self):
+        cache = ClientCache(CacheOptions(ttl=0))
+        calls = []
+
+        async def dispatch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("x")
+
+        async def main():
+            key = cache.make_key([1])
+            return await asyncio.gather(
+                *(cache.async_call(key, dispatch) for _ in range(4)), return_exceptions=True
+            )
+
+        loop = asyncio.new_event_loop()
+        rv = loop.run_until_complete(main())
+        loop.close()
+        self.assertTrue(all(isinstance(i, ValueError) for i in rv))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.deduplicated, 3)
+
+    def test_leader_cancelled(self):
+        cache = ClientCache(CacheOptions())
+        calls = []
+
+        async def dispatch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def main():
+            key = cache.make_key([1])
+            loop = asyncio.get_event_loop()
+            leader = loop.create_task(cache.async_call(key, dispatch))
+            followers = [loop.create_task(cache.async_call(key, dispatch)) for _ in range(2)]
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await asyncio.gather(*followers)
+
+        loop = asyncio.new_event_loop()
+        rv = loop.run_until_complete(main())
+        loop.close()
+        # one of followers dispatches again and the other shares it
+        self.assertEqual(rv, [2, 2])
+        self.assertEqual(len(calls), 2)
@@ -0,0 +1,150 @@
+import asyncio
+import unittest
+
+from dagger.client._request import Request
+from dagger.codec import decode_header, unpack_payload, EventType
+from dagger.declare import declare
+from dagger.server import ServerConfiguration
+from dagger.server._protocol import DefaultServerProtocol
+
+
+class _Transport:
+    def __init__(self):
+        self.written = bytearray()
+
+    def get_extra_info(self, name):
+        return None
+
+    def is_closing(self):
+        return False
+
+    def write(self, data):
+        self.written += data
+
+    def writelines(self, lines):
+        for data in lines:
+            self.written += data
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+
+def _responses(transport):
+    """sequence number -> (errno, body)"""
+    rv = {}
+    data = bytes(transport.written)
+    while data:
+        header = decode_header(data[:8])
+        assert header.event_type == EventType.RESPONSE
+        body = unpack_payload(header.compress_flag, data[8 : 8 + header.payload_size])
+        rv[header.sequence_number] = (header.errno, body)
+        data = data[8 + header.payload_size :]
+    return rv
+
+
+@declare
+def query(x):
+    pass
+
+
+class TestCoalesce(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.configuration = ServerConfiguration()
+        self.configuration.loop = self.loop
+        self.configuration.register_declares(query)
+        self.calls = []
+        self.gate = self.loop.create_future()
+
+        async def impl(x):
+            self.calls.append(x)
+            await self.gate
+            if x < 0:
+                raise ValueError(x)
+            return x * 2
+
+        query.set_server_impl(impl, asynchronous=True, coalesce=True)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _connect(self):
+        conn = DefaultServerProtocol(self.configuration)
+        conn.connection_made(_Transport())
+        return conn
+
+    def _send(self, conn, *args):
+        requests = [Request("query", [x]) for x in args]
+        for request in requests:
+            conn.data_received(request.pack())
+        return [request.sequence_number for request in requests]
+
+    def _run(self):
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+
+    def test_run_once(self):
+        a, b = self._connect(), self._connect()
+        seqs_a = self._send(a, 1, 1)
+        seqs_b = self._send(b, 1, 1, 1)
+        self._run()
+        self.gate.set_result(None)
+        self._run()
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.configuration.server_state.coalesced, 4)
+        self.assertEqual(_responses(a._transport), {i: (0, 2) for i in seqs_a})
+        self.assertEqual(_responses(b._transport), {i: (0, 2) for i in seqs_b})
+        self.assertEqual(self.configuration.server_state.inflight, {})
+
+    def test_different_args(self):
+        conn = self._connect()
+        seqs = self._send(conn, 1, 2)
+        self._run()
+        self.gate.set_result(None)
+        self._run()
+        self.assertEqual(sorted(self.calls), [1, 2])
+        self.assertEqual(_responses(conn._transport), {seqs[0]: (0, 2), seqs[1]: (0, 4)})
+
+    def test_leader_failed(self):
+        a, b = self._connect(), self._connect()
+        seq_a = self._send(a, -1)[0]
+        seq_b = self._send(b, -1)[0]
+        self._run()
+        self.gate.set_result(None)
+        self._run()
+        self.assertEqual(self.calls, [-1])
+        errno, body = _responses(b._transport)[seq_b]
+        self.assertTrue(errno)
+        self.assertEqual(_responses(a._transport)[seq_a], (errno, body))
+
+    def test_leader_cancelled(self):
+        a, b = self._connect(), self._connect()
+        self._send(a, 1)
+        seq_b = self._send(b, 1)[0]
+        self._run()
+        for task in a._running_tasks:
+            task.cancel()
+        self._run()
+        errno, (code, message) = _responses(b._transport)[seq_b]
+        self.assertTrue(errno)
+        self.assertIn("cancelled", message)
+        self.assertEqual(self.configuration.server_state.inflight, {})
+
+
+    def test_options(self):
+        a, b = self._connect(), self._connect()
+        self._send(a, 3)
+        # options are not part of the identity of request
+        request = Request("query", [3])
+        request.priority = "batch"
+        b.data_received(request.pack())
+        self._run()
+        self.gate.set_result(None)
+        self._run()
+        self.assertEqual(self.calls, [3])
+        self.assertEqual(_responses(b._transport), {request.sequence_number: (0, 6)})
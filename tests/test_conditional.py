@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+
+from dagger.client._request import ConditionalRequest, ConditionalStore
+from dagger.codec import decode_header, pack_object, make_etag, EventType
+from dagger.declare import declare
+from dagger.server import ServerConfiguration
+from dagger.server._protocol import DefaultServerProtocol
+
+
+class _Transport:
+    def __init__(self):
+        self.written = bytearray()
+
+    def get_extra_info(self, name):
+        return None
+
+    def is_closing(self):
+        return False
+
+    def write(self, data):
+        self.written += data
+
+    def writelines(self, lines):
+        for data in lines:
+            self.written += data
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+
+@declare(conditional=True)
+def report(day):
+    pass
+
+
+class TestConditional(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        configuration = ServerConfiguration()
+        configuration.loop = self.loop
+        configuration.register_declares(report)
+        self.rows = list(range(1000))
+        report.set_server_impl(lambda day: {"day": day, "rows": self.rows}, thread=False)
+        self.conn = DefaultServerProtocol(configuration)
+        self.transport = _Transport()
+        self.conn.connection_made(self.transport)
+        self.store = ConditionalStore(8)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _call(self, day):
+        request = ConditionalRequest("report", [day], self.store)
+        self.conn.data_received(request.pack())
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        data = bytes(self.transport.written)
+        self.transport.written.clear()
+        header = decode_header(data[:8])
+        return header, request.unpack_response(header, data[8:])
+
+    def test_not_modified(self):
+        header, first = self._call(1)
+        self.assertEqual((header.event_type, header.compress_flag), (EventType.RESPONSE, 1))
+        self.assertEqual(first, {"day": 1, "rows": self.rows})
+        # etag is made on the packed result before compressing
+        key = make_etag(pack_object(["report", [1]]))
+        self.assertEqual(self.store.get(key), (make_etag(pack_object(first)), first))
+
+        header, second = self._call(1)
+        self.assertEqual((header.event_type, header.payload_size), (EventType.NOT_MODIFIED, 0))
+        # the local copy is not unpacked again
+        self.assertIs(second, first)
+
+        self.rows = self.rows[1:]
+        header, third = self._call(1)
+        self.assertEqual(header.event_type, EventType.RESPONSE)
+        self.assertEqual(third, {"day": 1, "rows": self.rows})
+        header, _ = self._call(2)
+        self.assertEqual(header.event_type, EventType.RESPONSE)
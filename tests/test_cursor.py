@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+
+from dagger import builtins
+from dagger.exceptions import CursorNotFound, FunctionNotImplementedError
+from dagger.server import ServerConfiguration
+from dagger.server._cursor import CursorTable
+
+
+class TestCursorTable(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.configuration = ServerConfiguration()
+        self.configuration.loop = self.loop
+        self.configuration.cursor_page_size = 10
+        self.table = CursorTable(self.configuration)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_paging(self):
+        table = self.table
+        handle, page, done = table.open("conn", list(range(25)))
+        self.assertEqual(page, list(range(10)))
+        self.assertFalse(done)
+        self.assertEqual(table.fetch(handle, 5), [list(range(10, 15)), False])
+        self.assertEqual(table.fetch(handle), [list(range(15, 25)), True])
+        # exhausted cursor is released
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.memory, 0)
+        with self.assertRaises(CursorNotFound):
+            table.fetch(handle)
+
+        handle, page, done = table.open("conn", iter(range(12)))
+        self.assertEqual(page, list(range(10)))
+        self.assertEqual(table.fetch(handle), [[10, 11], True])
+        # small result is not kept
+        self.assertEqual(table.open("conn", [1, 2]), [None, [1, 2], True])
+        self.assertEqual(len(table), 0)
+
+    def test_close_and_release(self):
+        table = self.table
+        a = table.open("a", list(range(20)))[0]
+        b = table.open("b", list(range(20)))[0]
+        c = table.open("a", list(range(20)))[0]
+        table.close(b)
+        self.assertEqual(len(table), 2)
+        # cursors of connection lost are released
+        table.release("a")
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.memory, 0)
+        for handle in (a, c):
+            with self.assertRaises(CursorNotFound):
+                table.fetch(handle)
+
+    def test_ttl(self):
+        table = self.table
+        self.configuration.cursor_ttl = 60
+        old = table.open("conn", list(range(20)))[0]
+        new = table.open("conn", list(range(20)))[0]
+        table._cursors[old].last_active -= 61
+        table._check_expired()
+        self.assertEqual(list(table._cursors), [new])
+        self.assertEqual(table.memory, table._cursors[new].size)
+        self.assertIsNotNone(table._handle)
+        table._handle.cancel()
+
+    def test_memory_limit(self):
+        table = self.table
+        result = [b"x" * 1000] * 20
+        first = table.open("conn", result)[0]
+        size = table.memory
+        self.configuration.cursor_memory_limit = size * 2
+        second = table.open("conn", result)[0]
+        # fetching makes it recently used
+        table.fetch(first, 1)
+        third = table.open("conn", result)[0]
+        self.assertEqual(list(table._cursors), [first, third])
+        self.assertEqual(table.memory, size * 2)
+        with self.assertRaises(CursorNotFound):
+            table.fetch(second)
+
+        # the newest one is kept even if it is larger than the limit
+        self.configuration.cursor_memory_limit = 1
+        last = table.open("conn", result)[0]
+        self.assertEqual(list(table._cursors), [last])
+
+
+class TestBuiltins(unittest.TestCase):
+    def test_per_configuration(self):
+        a, b = ServerConfiguration(), ServerConfiguration()
+        state_a, state_b = a.server_state, b.server_state
+        fetch = a.get_declare(builtins.fetch.name)
+        self.assertIsNot(fetch, builtins.fetch)
+        self.assertEqual(fetch._server_impl, state_a.cursors.fetch)
+        self.assertEqual(b.get_declare(builtins.fetch.name)._server_impl, state_b.cursors.fetch)
+        # the module level declare is not bound to any configuration
+        with self.assertRaises(FunctionNotImplementedError):
+            builtins.fetch.server_call(b"handle")
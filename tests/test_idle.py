@@ -0,0 +1,58 @@
+import unittest
+
+from dagger.server import ServerConfiguration
+from dagger.server._idle import IdleTracker
+
+
+class _Connection:
+    def __init__(self):
+        self.active_tick = 0
+        self.closed = False
+        self.busy = False
+
+    def is_busy(self):
+        return self.busy
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class TestIdleTracker(unittest.TestCase):
+    def test_close_idle(self):
+        tracker = IdleTracker(ServerConfiguration())
+        idle, active, lost = _Connection(), _Connection(), _Connection()
+        for conn in (idle, active, lost):
+            tracker.add(conn)
+        tracker.remove(lost)
+        for _ in range(tracker.resolution * 3):
+            tracker.turn()
+            active.active_tick = tracker.current
+            if tracker.current == tracker.resolution - 1:
+                self.assertFalse(idle.closed)
+        self.assertTrue(idle.closed)
+        self.assertFalse(active.closed)
+        self.assertFalse(lost.closed)
+        self.assertEqual(list(tracker.connections), [active])
+        self.assertEqual(tracker.closed, 1)
+
+    def test_keep_busy(self):
+        tracker = IdleTracker(ServerConfiguration())
+        running, subscriber = _Connection(), _Connection()
+        running.busy = subscriber.busy = True
+        for conn in (running, subscriber):
+            tracker.add(conn)
+        for _ in range(tracker.resolution * 3):
+            tracker.turn()
+        self.assertFalse(running.closed or subscriber.closed)
+
+        # closed after it is idle for max_idle_time once the request is finished
+        running.busy = False
+        for _ in range(tracker.resolution - 1):
+            tracker.turn()
+        self.assertFalse(running.closed)
+        tracker.turn()
+        self.assertTrue(running.closed)
+        self.assertFalse(subscriber.closed)
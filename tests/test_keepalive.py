@@ -0,0 +1,102 @@
+import asyncio
+import socket
+import unittest
+
+from dagger.client import ClientConfiguration
+from dagger.client._asyncpool import AsyncPool
+from dagger.client._syncpool import SyncPool, _BufferSocket
+from dagger.codec import decode_header, encode_header, EventType
+from dagger.server import ServerConfiguration
+from dagger.server._protocol import DefaultServerProtocol
+from tests.utils import ServerThread
+
+
+class _Transport:
+    def __init__(self):
+        self.written = []
+
+    def get_extra_info(self, name):
+        return None
+
+    def is_closing(self):
+        return False
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class _Connection:
+    def __init__(self, endpoint, answer: bool):
+        self.endpoint = endpoint
+        self.answer = answer
+        self.outstanding = 0
+        self.last_active = 0.0
+        self.is_closed = False
+
+    def closed(self):
+        return self.is_closed
+
+    def close(self):
+        self.is_closed = True
+
+    async def ping(self):
+        if not self.answer:
+            await asyncio.sleep(10)
+        return 0.001
+
+
+class TestKeepalive(unittest.TestCase):
+    def test_server_pong(self):
+        configuration = ServerConfiguration()
+        configuration.loop = asyncio.new_event_loop()
+        conn = DefaultServerProtocol(configuration)
+        transport = _Transport()
+        conn.connection_made(transport)
+        conn.data_received(encode_header(0, 77, 0, 0, EventType.PING.value))
+        header = decode_header(transport.written[0])
+        self.assertEqual((header.event_type, header.sequence_number), (EventType.PONG, 77))
+        self.assertEqual(header.payload_size, 0)
+        configuration.loop.close()
+
+    def test_async_pool(self):
+        loop = asyncio.new_event_loop()
+        configuration = ClientConfiguration()
+        configuration.loop = loop
+        configuration.pool_size = 2
+        configuration.keepalive_interval = 0.05
+        pool = AsyncPool(configuration)
+        endpoint = pool.balancer.endpoints[0]
+        alive, dead = _Connection(endpoint, True), _Connection(endpoint, False)
+        pool._conns[endpoint] = [alive, dead]
+
+        loop.run_until_complete(pool.keepalive())
+        loop.close()
+        self.assertFalse(alive.is_closed)
+        self.assertTrue(dead.is_closed)
+        self.assertEqual((endpoint.requests, endpoint.errors), (1, 1))
+        self.assertEqual(endpoint.rtt, 0.001)
+
+    def test_sync_pool(self):
+        with ServerThread() as server:
+            configuration = server.client_configuration()
+            configuration.keepalive_interval = 0
+            configuration.pool_size = 2
+            pool = SyncPool(configuration)
+            configuration.keepalive_interval = 0.2
+            endpoint = pool.balancer.endpoints[0]
+            alive = pool._acquire_connection()
+            self.assertGreater(pool._ping(alive, 1), 0)
+            pool.release_connection(alive)
+
+            # the peer never answers
+            a, b = socket.socketpair()
+            dead = _BufferSocket(a.makefile("rwb", 4096), a, endpoint)
+            pool.release_connection(dead)
+            pool.keepalive()
+            b.close()
+
+            self.assertTrue(dead.buffer.closed)
+            self.assertEqual((endpoint.requests, endpoint.errors), (1, 1))
+            self.assertGreater(endpoint.rtt, 0)
+            self.assertIs(pool._acquire_connection(), alive)
+            alive.socket.close()
@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+
+from dagger.client._request import Request
+from dagger.declare import declare
+from dagger.flowcontrol import FlowControl
+from dagger.server import ServerConfiguration
+from dagger.server._protocol import DefaultServerProtocol
+
+
+class _Transport:
+    def __init__(self):
+        self.paused = False
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+
+class _Connection:
+    def __init__(self):
+        self.transport = _Transport()
+        self.flow = FlowControl(self.transport)
+        self.active_tick = 0
+
+
+class _Server:
+    def __init__(self):
+        self.serving = True
+
+    def pause_serving(self):
+        self.serving = False
+
+    def resume_serving(self):
+        self.serving = True
+
+
+class TestMemoryGuard(unittest.TestCase):
+    def test_pause_and_resume(self):
+        configuration = ServerConfiguration()
+        configuration.memory_soft_limit = 1000
+        state = configuration.server_state
+        guard = state.memory
+        guard._server = server = _Server()
+        a, b = _Connection(), _Connection()
+        state.connection_made(a)
+        state.connection_made(b)
+
+        guard.add(600)
+        guard.check()
+        self.assertFalse(guard.paused)
+        guard.add(400)
+        guard.check()
+        self.assertTrue(guard.paused)
+        self.assertFalse(server.serving)
+        self.assertTrue(a.transport.paused and b.transport.paused)
+
+        # connection resumes its own pause, but the hold is kept
+        a.flow.pause_reading()
+        a.flow.resume_reading()
+        self.assertTrue(a.transport.paused)
+        c = _Connection()
+        state.connection_made(c)
+        self.assertTrue(c.transport.paused)
+
+        guard.add(-100)
+        guard.check()
+        self.assertTrue(guard.paused)
+        guard.add(-200)
+        guard.check()
+        self.assertFalse(guard.paused)
+        self.assertTrue(server.serving)
+        self.assertFalse(a.transport.paused or b.transport.paused or c.transport.paused)
+        self.assertEqual(guard.pauses, 1)
+
+
+class _ProtocolTransport(_Transport):
+    def __init__(self):
+        super().__init__()
+        self.written = []
+        self.write_buffer_size = 0
+
+    def get_extra_info(self, name):
+        return None
+
+    def is_closing(self):
+        return False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def writelines(self, lines):
+        self.written.extend(lines)
+
+    def get_write_buffer_size(self):
+        return self.write_buffer_size
+
+
+@declare
+def echo(x):
+    pass
+
+
+class TestAccounting(unittest.TestCase):
+    def test_connection_bytes(self):
+        loop = asyncio.new_event_loop()
+        configuration = ServerConfiguration()
+        configuration.loop = loop
+        echo.set_server_impl(lambda x: x, thread=False)
+        configuration.register_declares(echo)
+        guard = configuration.server_state.memory
+        conn = DefaultServerProtocol(configuration)
+        transport = _ProtocolTransport()
+        conn.connection_made(transport)
+
+        data = Request("echo", ["x" * 100]).pack()
+        conn.data_received(data[:50])
+        # header is parsed
+        self.assertEqual(guard.buffered, 42)
+        conn.data_received(data[50:])
+        # payload of the pending request
+        self.assertEqual(guard.buffered, len(data) - 8)
+
+        transport.write_buffer_size = 30
+        loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(len(transport.written), 2)
+        # below the high water mark, it is drained without notice
+        self.assertEqual(guard.buffered, 0)
+        transport.write_buffer_size = 70000
+        conn.pause_writing()
+        self.assertEqual(guard.buffered, 70000)
+        self.assertEqual(conn.buffered_size(), 70000)
+        transport.write_buffer_size = 100
+        conn.resume_writing()
+        self.assertEqual(guard.buffered, 0)
+
+        conn.data_received(data[:20])
+        self.assertEqual(guard.buffered, 12)
+        conn.connection_lost(None)
+        self.assertEqual(guard.buffered, 0)
+        loop.close()
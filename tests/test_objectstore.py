@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+
+from dagger import builtins
+from dagger.client import ClientConfiguration
+from dagger.client._asyncpool import AsyncPool
+from dagger.client._request import make_put_request
+from dagger.client._syncpool import SyncPool
+from dagger.codec import ObjectRef, pack_object
+from dagger.exceptions import ContentVerifyFailed, ObjectNotFound
+from dagger.server import ServerConfiguration
+from dagger.server._objectstore import ObjectStore
+from tests.utils import ServerThread
+
+
+def _make_ref(ob) -> (ObjectRef, bytes):
+    data = pack_object(ob)
+    return ObjectRef(ObjectRef.digest(data), ob), data
+
+
+class TestObjectStore(unittest.TestCase):
+    def setUp(self):
+        self.configuration = ServerConfiguration()
+        self.store = ObjectStore(self.configuration)
+
+    def test_put_and_resolve(self):
+        store = self.store
+        ref, data = _make_ref([1, 2, 3])
+        store.put(ref.handle, data)
+        self.assertIn(ref.handle, store)
+        self.assertEqual(store.memory, len(data))
+        args = [ObjectRef(ref.handle), "x"]
+        self.assertEqual(store.resolve(args), [[1, 2, 3], "x"])
+        # uploaded again
+        store.put(ref.handle, data)
+        self.assertEqual((len(store), store.memory), (1, len(data)))
+
+        with self.assertRaises(ContentVerifyFailed):
+            store.put(b"0" * 16, data)
+        with self.assertRaises(ObjectNotFound):
+            store.resolve([ObjectRef(b"0" * 16)])
+
+    def test_release(self):
+        store = self.store
+        ref, data = _make_ref("x")
+        store.put(ref.handle, data)
+        store.release(ref.handle)
+        store.release(ref.handle)
+        self.assertEqual((len(store), store.memory), (0, 0))
+        with self.assertRaises(ObjectNotFound):
+            store.get(ref.handle)
+
+    def test_memory_limit(self):
+        store = self.store
+        (a, data), (b, _), (c, _) = (_make_ref(i * 1000) for i in (b"a", b"b", b"c"))
+        self.configuration.object_store_limit = len(data) * 2
+        store.put(a.handle, data)
+        store.put(b.handle, pack_object(b.obj))
+        # using it makes it recently used
+        store.get(a.handle)
+        store.put(c.handle, pack_object(c.obj))
+        self.assertIn(a.handle, store)
+        self.assertNotIn(b.handle, store)
+        self.assertEqual(store.memory, len(data) * 2)
+
+        # the newest one is kept even if it is larger than the limit
+        self.configuration.object_store_limit = 1
+        store.put(b.handle, pack_object(b.obj))
+        self.assertEqual((len(store), store.memory), (1, len(data)))
+
+
+class _Connection:
+    def __init__(self, closed=False):
+        self.is_closed = closed
+        self.requests = []
+
+    def closed(self):
+        return self.is_closed
+
+    async def dispatch_request(self, request):
+        self.requests.append((request.method, request.parameters))
+
+
+class TestRelease(unittest.TestCase):
+    def test_sync_pool(self):
+        with ServerThread() as server:
+            objects = server.state.objects
+            released = []
+
+            def release(conn, handle):
+                released.append(conn)
+                objects.release(handle)
+
+            server.configuration.get_declare(builtins.release.name).set_server_impl(
+                release, thread=False, pass_connection=True
+            )
+            configuration = server.client_configuration()
+            configuration.pool_size = 2
+            pool = SyncPool(configuration)
+            a = pool._acquire_connection()
+            b = pool._acquire_connection()
+            ref, data = _make_ref("x")
+            # uploaded to both connections
+            pool.dispatch_on(a, make_put_request(ref, data))
+            pool.dispatch_on(b, make_put_request(ref, data))
+            pool.release_connection(a)
+            pool.release_connection(b)
+
+            pool.release_object(ref)
+            self.assertEqual(len(set(released)), 2)
+            self.assertNotIn(ref.handle, objects)
+
+            # released through a new connection when all are in use
+            a, b = pool._acquire_connection(), pool._acquire_connection()
+            pool.release_object(ref)
+            self.assertEqual(len(released), 3)
+            for conn in (a, b):
+                conn.buffer.close()
+                conn.socket.close()
+
+    def test_async_pool(self):
+        loop = asyncio.new_event_loop()
+        configuration = ClientConfiguration()
+        configuration.loop = loop
+        pool = AsyncPool(configuration)
+        endpoint = pool.balancer.endpoints[0]
+        conns = [_Connection(), _Connection(closed=True), _Connection()]
+        pool._conns[endpoint] = conns + [None]
+        ref, _ = _make_ref("x")
+
+        loop.run_until_complete(pool.release_object(ref))
+        loop.close()
+        expect = [(builtins.release.name, [ref.handle])]
+        self.assertEqual([i.requests for i in conns], [expect, [], expect])
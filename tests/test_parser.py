@@ -0,0 +1,72 @@
+import mmap
+import os
+import tempfile
+import unittest
+
+from dagger.codec import decode_header, encode_header, EventType, pack_message
+from dagger.parser import Parser, ParserProtocol
+from dagger.server import FileResponse
+
+
+class _Protocol(ParserProtocol):
+    header_size = 8
+
+    def __init__(self):
+        self.messages = []
+
+    def parse_header(self, data: bytes):
+        header = decode_header(data)
+        return header.payload_size, header
+
+    def spill_payload(self, header) -> bool:
+        return header.event_type == EventType.FILE
+
+    def parse_payload(self, header, data: bytes):
+        return data
+
+    def on_message_complete(self, header, body):
+        self.messages.append((header.event_type, body))
+
+
+class TestParser(unittest.TestCase):
+    def test_spill_payload(self):
+        content = os.urandom(10000)
+        data = b"".join(
+            (
+                pack_message(1, EventType.RESPONSE.value, "a"),
+                encode_header(len(content), 2, 0, 0, EventType.FILE.value),
+                content,
+                encode_header(0, 3, 0, 0, EventType.FILE.value),
+                pack_message(4, EventType.RESPONSE.value, "b"),
+            )
+        )
+        for size in (1, 7, 4096, len(data)):
+            protocol = _Protocol()
+            parser = Parser(protocol)
+            for i in range(0, len(data), size):
+                parser.feed_data(data[i : i + size])
+            event_types = [event_type for event_type, _ in protocol.messages]
+            self.assertEqual(event_types, [2, 10, 10, 2])
+            spilled = protocol.messages[1][1]
+            self.assertIsInstance(spilled, mmap.mmap)
+            self.assertEqual(spilled[:], content)
+            self.assertEqual(protocol.messages[2][1], b"")
+
+
+class TestFileResponse(unittest.TestCase):
+    def test_open(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"0123456789")
+            f.flush()
+            file, size = FileResponse(f.name, 3).open()
+            file.close()
+            self.assertEqual(size, 7)
+            file, size = FileResponse(f.name, 3, 4).open()
+            file.close()
+            self.assertEqual(size, 4)
+            file, size = FileResponse(f.name, 20).open()
+            file.close()
+            self.assertEqual(size, 0)
+
+        self.assertEqual(FileResponse(b"0123456789", 8, 5).open(), (None, 2))
+        self.assertRaises(ValueError, FileResponse, b"", -1)
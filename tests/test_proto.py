@@ -1,8 +1,16 @@
+import os
 import random
 import unittest
 import datetime
 
+import msgpack
+
 from dagger.codec import decode_header, encode_header, EventType, pack_message, unpack_payload
+from dagger.codec import ObjectRef, pack_object, pack_payload, make_etag, request_identity
+from dagger.parser import SpillBuffer
+from dagger.shmutils import SHM_DIR
+from dagger.client._request import ConditionalRequest, ConditionalStore
+from dagger.exceptions import FunctionNotImplementedError, PackUnpackError, make_remote_exception
 
 
 class TestProto(unittest.TestCase):
@@ -23,6 +31,16 @@ class TestProto(unittest.TestCase):
         h = decode_header(header)
         return unpack_payload(h.compress_flag, body)
 
+    def test_exception(self):
+        data = pack_message(3, EventType.RESPONSE.value, FunctionNotImplementedError("hello"))
+        header = decode_header(data[:8])
+        self.assertEqual(header.event_type, EventType.RESPONSE)
+        self.assertEqual(header.sequence_number, 3)
+        self.assertTrue(header.errno)
+        exc = make_remote_exception(unpack_payload(header.compress_flag, data[8:]))
+        self.assertIsInstance(exc, FunctionNotImplementedError)
+        self.assertEqual(str(exc), "function not implemented: 'hello'")
+
     def test_datetime(self):
         dt = datetime.datetime.now().replace(microsecond=0)
         un = self._packunpack(dt)
@@ -33,6 +51,42 @@ class TestProto(unittest.TestCase):
         un = self._packunpack(dt)
         self.assertEqual(dt, un)
 
+    def test_object_ref(self):
+        data = pack_object({"a": list(range(100))})
+        self.assertEqual(data, pack_object({"a": list(range(100))}))
+        ref = ObjectRef(ObjectRef.digest(data), {"a": list(range(100))})
+        un = self._packunpack([ref, 1])
+        self.assertEqual(un, [ref, 1])
+        self.assertIsNone(un[0].obj)
+
+    def test_conditional_request(self):
+        store = ConditionalStore(8)
+        request = ConditionalRequest("f", [1], store)
+        self.assertEqual(len(unpack_payload(0, request.pack()[8:])), 2)
+        data = pack_message(0, EventType.RESPONSE.value, [1, 2])
+        self.assertEqual(request.unpack_response(decode_header(data[:8]), data[8:]), [1, 2])
+
+        request = ConditionalRequest("f", [1], store)
+        body = unpack_payload(0, request.pack()[8:])
+        self.assertEqual(body[2], {"etag": make_etag(pack_object([1, 2]))})
+        header = decode_header(encode_header(0, 0, 0, 0, EventType.NOT_MODIFIED.value))
+        self.assertEqual(request.unpack_response(header, b""), [1, 2])
+
+        # options extend the packed key, large arguments are compressed
+        request = ConditionalRequest("f", ["x" * 2000], store)
+        request.priority = "batch"
+        data = request.pack()
+        header = decode_header(data[:8])
+        self.assertEqual(header.compress_flag, 1)
+        body = unpack_payload(1, data[8:])
+        self.assertEqual(body, ["f", ["x" * 2000], {"priority": "batch"}])
+
+    def test_request_identity(self):
+        data = pack_object(["f", [1, "x"]])
+        self.assertEqual(request_identity(data, False), data[1:])
+        data = pack_object(["f", [1, "x"], {"priority": "batch"}])
+        self.assertEqual(request_identity(data, True), pack_object(["f", [1, "x"]])[1:])
+
     def test_nparray(self):
         try:
             import numpy as np
@@ -51,6 +105,44 @@ class TestProto(unittest.TestCase):
         un = self._packunpack(arr)
         np.testing.assert_array_equal(arr, un)
 
+    def test_shm_nparray(self):
+        try:
+            import numpy as np
+        except ImportError:
+            return
+
+        arr = np.arange(1000, dtype=float).reshape(10, 100)[:, ::2]
+        payload = pack_object(arr, shm_threshold=1024)
+        small = pack_object(np.arange(10), shm_threshold=1024)
+        self.assertLess(len(payload), 200)
+        self.assertGreater(len(small), 80)
+        path = os.path.join(SHM_DIR, msgpack.unpackb(payload).data.decode())
+        self.assertTrue(os.path.exists(path))
+
+        un = unpack_payload(0, payload)
+        np.testing.assert_array_equal(arr, un)
+        self.assertFalse(un.flags.writeable)
+        self.assertFalse(os.path.exists(path))
+        self.assertRaises(PackUnpackError, unpack_payload, 0, payload)
+
+    def test_unpack_mapped(self):
+        try:
+            import numpy as np
+        except ImportError:
+            return
+
+        arr = np.arange(100000, dtype=float)
+        body = ["f", [arr, {"a": [arr[:3]]}, "x" * 100], {"etag": b"1"}]
+        for compress_flag, data in (pack_payload(body)[::2], (0, pack_object(body))):
+            spill = SpillBuffer(len(data))
+            spill.write(data)
+            method, (un, kw, s), options = unpack_payload(compress_flag, spill.getvalue())
+            self.assertEqual((method, s, options), ("f", "x" * 100, {"etag": b"1"}))
+            np.testing.assert_array_equal(arr, un)
+            np.testing.assert_array_equal(arr[:3], kw["a"][0])
+        # array of the top levels is made on the map
+        self.assertIsInstance(un.base, memoryview)
+
     def test_dataframe(self):
         try:
             import pandas as pd
@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+
+from dagger.codec import decode_header, unpack_payload, EventType
+from dagger.server import ServerConfiguration
+from dagger.server._protocol import DefaultServerProtocol
+
+
+class _Transport:
+    def __init__(self):
+        self.written = []
+
+    def is_closing(self):
+        return False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def writelines(self, lines):
+        self.written.extend(lines)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def get_extra_info(self, name):
+        return None
+
+
+def _messages(transport):
+    rv = []
+    for data in transport.written:
+        header = decode_header(data[:8])
+        assert header.event_type == EventType.PUBLISH
+        rv.append(unpack_payload(header.compress_flag, data[8:]))
+    return rv
+
+
+class TestPubSub(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.configuration = ServerConfiguration()
+        self.configuration.loop = self.loop
+        self.pubsub = self.configuration.server_state.pubsub
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _connect(self):
+        conn = DefaultServerProtocol(self.configuration)
+        conn.connection_made(_Transport())
+        self.pubsub.subscribe(conn, "t")
+        return conn
+
+    def _publish(self, *obs):
+        for ob in obs:
+            self.pubsub.publish("t", ob)
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+    def test_fan_out(self):
+        a, b = self._connect(), self._connect()
+        self._publish(1)
+        self.assertEqual(_messages(a._transport), [["t", 1]])
+        self.assertIs(a._transport.written[0], b._transport.written[0])
+
+        self.pubsub.release(a)
+        self._publish(2)
+        self.assertEqual(len(a._transport.written), 1)
+        self.assertEqual(self.pubsub.subscribers("t"), 1)
+
+    def test_slow_subscriber(self):
+        conn = self._connect()
+        conn.pause_writing()
+        self._publish(1, 2, 3)
+        self.assertEqual(conn._transport.written, [])
+        conn.resume_writing()
+        self.assertEqual(_messages(conn._transport), [["t", 3]])
+        self.assertEqual(self.pubsub.dropped, 2)
+
+        self.configuration.publish_policy = "drop"
+        conn.pause_writing()
+        self._publish(4)
+        conn.resume_writing()
+        self.assertEqual(len(conn._transport.written), 1)
+        self.assertEqual(self.pubsub.dropped, 3)
+
+    def test_subscribe_request(self):
+        conn = DefaultServerProtocol(self.configuration)
+        conn.connection_made(_Transport())
+        subscribe = self.configuration.get_declare("dagger.subscribe")
+        unsubscribe = self.configuration.get_declare("dagger.unsubscribe")
+        self.assertIs(self.loop.run_until_complete(conn._execute(subscribe, ["t"])), True)
+        self.assertEqual(self.pubsub.subscribers("t"), 1)
+        # a subscriber is never closed by idle tracker
+        self.assertTrue(conn.is_busy())
+        self._publish(1)
+        self.assertEqual(_messages(conn._transport), [["t", 1]])
+        self.assertIs(self.loop.run_until_complete(conn._execute(unsubscribe, ["t"])), True)
+        self.assertEqual(self.pubsub.subscribers("t"), 0)
+        self.assertFalse(conn.is_busy())
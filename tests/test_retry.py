@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from dagger.client import Client, ClientConfiguration
+from dagger.client._retry import Retrying
+from dagger.declare import declare
+
+
+class _Pool:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def dispatch_request(self, request):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return request.method
+
+
+class _AsyncPool(_Pool):
+    async def dispatch_request(self, request):
+        return super().dispatch_request(request)
+
+
+def _client(pool, asynchronous=False):
+    configuration = ClientConfiguration()
+    configuration.asynchronous = asynchronous
+    configuration.retry_backoff = 0
+    client = Client()
+    client._configuration = configuration
+    client._pool = pool
+    client.retrying = Retrying(configuration)
+    return client
+
+
+class TestRetry(unittest.TestCase):
+    def test_retryable(self):
+        pool = _Pool([ConnectionRefusedError(), ConnectionResetError()])
+        client = _client(pool)
+        with self.assertRaises(ConnectionResetError):
+            client.dispatch_request("f")
+        self.assertEqual(pool.calls, 2)
+
+        pool = _Pool([ConnectionRefusedError(), ConnectionResetError()])
+        client = _client(pool)
+        self.assertEqual(client.dispatch_request("f", idempotent=True), "f")
+        self.assertEqual(pool.calls, 3)
+        self.assertEqual(client.retrying.stats["f"].retried, 2)
+
+    def test_max_retry_and_budget(self):
+        pool = _Pool([TimeoutError()] * 100)
+        client = _client(pool)
+        f = declare(lambda: None, name="f")
+        client._configuration.set_retry(f, max_retry=1)
+        with self.assertRaises(TimeoutError):
+            client.dispatch_request("f", idempotent=True)
+        self.assertEqual(pool.calls, 2)
+        self.assertEqual(client.retrying.stats["f"].exhausted, 1)
+
+        client._configuration.retry_budget = 0
+        client._configuration.max_retry = 100
+        with self.assertRaises(TimeoutError):
+            client.dispatch_request("g", idempotent=True)
+        self.assertEqual(client.retrying.stats["g"].retried, int(Retrying.max_tokens) - 1)
+        self.assertEqual(client.retrying.stats["g"].throttled, 1)
+
+    def test_async(self):
+        pool = _AsyncPool([ConnectionRefusedError()])
+        client = _client(pool, asynchronous=True)
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(client.dispatch_request("f")), "f")
+        finally:
+            loop.close()
+        self.assertEqual(pool.calls, 2)
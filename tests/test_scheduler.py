@@ -0,0 +1,71 @@
+import unittest
+
+from dagger.server import ServerConfiguration
+from dagger.server._scheduler import Scheduler
+
+
+class _Connection:
+    def __init__(self, name, runs):
+        self.name = name
+        self.runs = runs
+
+    def run_scheduled(self, msg):
+        self.runs.append((self.name, msg))
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.configuration = ServerConfiguration()
+        self.configuration.worker_concurrency = 1
+        self.scheduler = Scheduler(self.configuration)
+        self.runs = []
+
+    def _drain(self):
+        while self.scheduler.running:
+            self.scheduler.done()
+
+    def test_priority_and_fairness(self):
+        scheduler = self.scheduler
+        flood, other, batch = (_Connection(i, self.runs) for i in ("flood", "other", "batch"))
+        scheduler.push(flood, 0, "default")
+        for i in range(1, 9):
+            scheduler.push(flood, i, "default")
+        for i in range(8):
+            scheduler.push(batch, i, "batch")
+        scheduler.push(other, 0, "default")
+        scheduler.push(other, 1, "default")
+        scheduler.push(other, 2, "interactive")
+        self.assertEqual(scheduler.depths, {"interactive": 1, "default": 10, "batch": 8})
+        self._drain()
+
+        # the first one runs at once, interactive one runs next
+        self.assertEqual(self.runs[:2], [("flood", 0), ("other", 2)])
+        # the other connection is not delayed by the flooding one
+        order = [name for name, _ in self.runs]
+        self.assertLess(order.index("other", 2), 5)
+        # a connection of default class is served 4 times as often as one of batch class
+        self.assertEqual(order[:12].count("batch"), 1)
+        self.assertEqual(order[:12].count("flood"), 8)
+        self.assertEqual(scheduler.dispatched, {"interactive": 1, "default": 11, "batch": 8})
+        self.assertEqual(scheduler.depths, {"interactive": 0, "default": 0, "batch": 0})
+
+    def test_release_and_flush(self):
+        scheduler = self.scheduler
+        lost, closing, other = (_Connection(i, self.runs) for i in ("lost", "closing", "other"))
+        for i in range(3):
+            scheduler.push(lost, i, "default")
+            scheduler.push(closing, i, "batch")
+        scheduler.push(other, 0, "default")
+        scheduler.release(lost)
+        scheduler.flush(closing)
+        self.assertEqual(scheduler.queued(closing), 0)
+        self.assertEqual(scheduler.running, 4)
+        self._drain()
+        self.assertEqual(
+            self.runs,
+            [("lost", 0), ("closing", 0), ("closing", 1), ("closing", 2), ("other", 0)],
+        )
+
+    def test_lower(self):
+        self.assertEqual(Scheduler.lower("interactive", "batch"), "batch")
+        self.assertEqual(Scheduler.lower("default", "interactive"), "default")
@@ -0,0 +1,44 @@
+import multiprocessing
+import os
+import unittest
+
+from dagger.cache import CacheState
+from dagger.server._sharedcache import SharedResultCache, shared_memory_support
+
+
+@unittest.skipUnless(shared_memory_support and os.name == "posix", "shared memory not support")
+class TestSharedResultCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SharedResultCache.create(64 * 1024, stripes=2, entry_size_hint=256)
+
+    def tearDown(self):
+        self.cache.unlink()
+
+    def test_cross_process(self):
+        key = os.urandom(16)
+
+        def worker():
+            self.cache.put(key, (1, 0, b"payload"), 60)
+
+        ctx = multiprocessing.get_context("fork")
+        process = ctx.Process(target=worker)
+        process.start()
+        process.join()
+        self.assertEqual(self.cache.lookup(key), (CacheState.FRESH, (1, 0, b"payload")))
+        self.assertEqual(self.cache.lookup(os.urandom(16)), (CacheState.MISS, None))
+
+    def test_expire_and_overwrite(self):
+        key = os.urandom(16)
+        self.cache.put(key, (0, 0, b"a"), -1)
+        self.assertEqual(self.cache.lookup(key)[0], CacheState.MISS)
+
+        self.cache.put(key, (0, 0, b"a" * 1000), 60)
+        self.assertEqual(self.cache.lookup(key)[0], CacheState.FRESH)
+        for _ in range(200):
+            self.cache.put(os.urandom(16), (0, 0, os.urandom(1000)), 60)
+        self.assertEqual(self.cache.lookup(key)[0], CacheState.MISS)
+
+    def test_skip_error(self):
+        key = os.urandom(16)
+        self.cache.put(key, (0, 1, b"error"), 60)
+        self.assertEqual(self.cache.lookup(key)[0], CacheState.MISS)
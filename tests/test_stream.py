@@ -0,0 +1,163 @@
+import asyncio
+import time
+import unittest
+
+from dagger.client._request import Request, StreamRequest
+from dagger.client._syncpool import SyncPool
+from dagger.declare import declare
+from dagger.flowcontrol import FlowControl
+from dagger.server._stream import StreamReader
+from tests.utils import ServerThread
+
+
+class _Transport:
+    def __init__(self):
+        self.paused = False
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+
+class TestStreamReader(unittest.TestCase):
+    def test_backpressure(self):
+        loop = asyncio.new_event_loop()
+        transport = _Transport()
+        reader = StreamReader(loop, FlowControl(transport), 4)
+
+        async def consume():
+            return [chunk async for chunk in reader]
+
+        for i in range(6):
+            reader.feed_chunk(i)
+        self.assertTrue(transport.paused)
+        reader.feed_eof()
+        rv = loop.run_until_complete(consume())
+        self.assertEqual(rv, list(range(6)))
+        self.assertFalse(transport.paused)
+        loop.close()
+
+    def test_keep_connection_pause(self):
+        loop = asyncio.new_event_loop()
+        transport = _Transport()
+        flow = FlowControl(transport)
+        reader = StreamReader(loop, flow, 2)
+        for i in range(3):
+            reader.feed_chunk(i)
+        self.assertTrue(transport.paused)
+        # paused by concurrency limit meanwhile
+        flow.pause_reading()
+        loop.run_until_complete(reader.read())
+        reader.close()
+        self.assertTrue(transport.paused)
+        flow.resume_reading()
+        self.assertFalse(transport.paused)
+
+        reader = StreamReader(loop, flow, 2)
+        for i in range(3):
+            reader.feed_chunk(i)
+        flow.pause_reading()
+        flow.resume_reading()
+        # the stream buffer is still full
+        self.assertTrue(transport.paused)
+        reader.close()
+        self.assertFalse(transport.paused)
+        loop.close()
+
+    def test_iterate_in_loop(self):
+        loop = asyncio.new_event_loop()
+        reader = StreamReader(loop, FlowControl(_Transport()), 4)
+        reader.feed_chunk(1)
+
+        async def iterate():
+            return next(reader)
+
+        with self.assertRaises(RuntimeError):
+            loop.run_until_complete(iterate())
+        loop.close()
+
+    def test_close_drop_chunks(self):
+        loop = asyncio.new_event_loop()
+        reader = StreamReader(loop, FlowControl(_Transport()), 4)
+        reader.feed_chunk(1)
+        reader.close()
+        reader.feed_chunk(2)
+        reader.feed_eof()
+
+        async def consume():
+            return [chunk async for chunk in reader]
+
+        self.assertEqual(loop.run_until_complete(consume()), [])
+        loop.close()
+
+    def test_account(self):
+        loop = asyncio.new_event_loop()
+        sizes = []
+        reader = StreamReader(loop, FlowControl(_Transport()), 4, sizes.append)
+        for i in range(3):
+            reader.feed_chunk(i, 10)
+        self.assertEqual(loop.run_until_complete(reader.read()), 0)
+        reader.close()
+        self.assertEqual(sizes, [10, 10, 10, -10, -20])
+        loop.close()
+
+
+@declare(stream=True)
+def upload(name, chunks):
+    pass
+
+
+@declare(stream=True)
+def upload_async(limit, chunks):
+    pass
+
+
+@declare
+def echo(x):
+    pass
+
+
+def _upload(name, chunks):
+    size = 0
+    for chunk in chunks:
+        # slower than the client, the stream buffer gets full
+        time.sleep(0.001)
+        size += len(chunk)
+    return [name, size]
+
+
+async def _upload_async(limit, chunks):
+    rv = []
+    async for chunk in chunks:
+        rv.append(chunk)
+        if len(rv) == limit:
+            # the rest of stream is dropped
+            break
+    return rv
+
+
+upload.set_server_impl(_upload, thread=True)
+upload_async.set_server_impl(_upload_async, asynchronous=True)
+echo.set_server_impl(lambda x: x, thread=False)
+
+
+class TestStreamUpload(unittest.TestCase):
+    def test_upload(self):
+        with ServerThread(upload, upload_async, echo) as server:
+            server.configuration.stream_buffer_limit = 2
+            configuration = server.client_configuration()
+            configuration.pool_size = 1
+            configuration.timeout = 5
+            pool = SyncPool(configuration)
+            chunks = (b"x" * 1000 for _ in range(100))
+            rv = pool.dispatch_request(StreamRequest("upload", ["a"], chunks))
+            self.assertEqual(rv, ["a", 100000])
+
+            chunks = (i for i in range(100))
+            rv = pool.dispatch_request(StreamRequest("upload_async", [3], chunks))
+            self.assertEqual(rv, [0, 1, 2])
+            # the connection is read again after the stream
+            self.assertEqual(pool.dispatch_request(Request("echo", [1])), 1)
+            self.assertEqual(pool._conns[pool.balancer.endpoints[0]].qsize(), 1)
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from dagger.client import Client, ClientConfiguration
+from dagger.client._request import Request
+from dagger.client._syncpool import SyncPool
+from dagger.codec import decode_header, encode_header, pack_object
+from dagger.declare import declare
+from tests.utils import ServerThread
+
+
+@declare
+def echo(x):
+    pass
+
+
+@declare
+def wait(seconds):
+    pass
+
+
+async def _wait(seconds):
+    await asyncio.sleep(seconds)
+    return seconds
+
+
+echo.set_server_impl(lambda x: x, thread=False)
+wait.set_server_impl(_wait, asynchronous=True)
+
+
+class TestDispatchMany(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ServerThread(echo, wait).__enter__()
+        configuration = cls.server.client_configuration()
+        configuration.timeout = 5
+        configuration.register_declares(echo, wait)
+        cls.client = Client()
+        cls.client.setup(configuration)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client = None
+        cls.server.__exit__(None, None, None)
+
+    def test_ordered(self):
+        rv = list(self.client.map("echo", ([i] for i in range(100)), window=8))
+        self.assertEqual(rv, list(range(100)))
+        self.assertEqual(list(echo.remote_map([i] for i in range(3))), [0, 1, 2])
+        self.assertEqual(list(wait.remote_map([[0.05], [0]])), [0.05, 0])
+
+    def test_unordered(self):
+        rv = list(wait.remote_map([[0.05], [0]], ordered=False))
+        self.assertEqual(rv, [0, 0.05])
+
+    def test_close_early(self):
+        pool = self.client._pool
+        endpoint = pool.balancer.endpoints[0]
+        conn = pool._conns[endpoint].queue[0]
+        rv = self.client.map("wait", ([0.01 * i] for i in range(10)), window=4)
+        self.assertEqual(next(rv), 0)
+        rv.close()
+        # responses of requests in flight would be read by the next request
+        self.assertTrue(conn.buffer.closed)
+        self.assertEqual(echo.remote_call(1), 1)
+
+
+
+class _LargeResponder(threading.Thread):
+    """Answer every request with a large response, the next request is read only after the
+    response is sent.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.path = os.path.join(tempfile.mkdtemp(), "responder.sock")
+        self.listener = socket.socket(socket.AF_UNIX)
+        self.listener.bind(self.path)
+        self.listener.listen()
+        self.response = b"x" * (1 << 20)
+
+    def run(self):
+        sock, _ = self.listener.accept()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        body = pack_object(self.response)
+        with sock, sock.makefile("rwb") as f:
+            while True:
+                data = f.read(8)
+                if len(data) != 8:
+                    return
+                header = decode_header(data)
+                f.read(header.payload_size)
+                f.write(encode_header(len(body), header.sequence_number, 0, 0, 2) + body)
+                f.flush()
+
+
+class TestPipelineBuffers(unittest.TestCase):
+    def test_large_payloads(self):
+        server = _LargeResponder()
+        server.start()
+        configuration = ClientConfiguration()
+        configuration.host = server.path
+        configuration.port = 0
+        configuration.timeout = 3
+        configuration.keepalive_interval = 0
+        pool = SyncPool(configuration)
+        conn = pool._conns[pool.balancer.endpoints[0]].queue[0]
+        conn.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        conn.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        # uncompressible arguments
+        requests = (Request("echo", [os.urandom(1 << 15)]) for _ in range(8))
+        rv = list(pool.dispatch_many(requests, window=8))
+        self.assertEqual(rv, [server.response] * 8)
+        conn.socket.close()
+        server.listener.close()
+        os.unlink(server.path)
+        os.rmdir(os.path.dirname(server.path))
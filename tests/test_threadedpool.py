@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dagger.client import Client
+from dagger.client._threadedpool import io_loop
+from dagger.declare import declare
+from tests.utils import ServerThread
+
+
+@declare
+def echo(x):
+    pass
+
+
+@declare
+def sleep(seconds):
+    pass
+
+
+@declare(cursor=True)
+def numbers(n):
+    pass
+
+
+async def _sleep(seconds):
+    await asyncio.sleep(seconds)
+    return seconds
+
+
+echo.set_server_impl(lambda x: x, thread=False)
+sleep.set_server_impl(_sleep, asynchronous=True)
+numbers.set_server_impl(lambda n: list(range(n)), thread=False)
+
+
+class TestThreadedPool(unittest.TestCase):
+    def setUp(self):
+        self.server = ServerThread(echo, sleep, numbers).__enter__()
+        self.server.configuration.cursor_page_size = 10
+        configuration = self.server.client_configuration()
+        configuration.io_thread = True
+        configuration.timeout = 1
+        configuration.max_inflight = 1
+        configuration.cursor_page_size = 10
+        self.client = Client()
+        self.client.setup(configuration)
+
+    def tearDown(self):
+        self.client = None
+        self.server.__exit__(None, None, None)
+
+    def test_io_loop(self):
+        loop = io_loop()
+        self.assertIs(io_loop(), loop)
+        self.assertTrue(loop.is_running())
+        self.assertIs(self.client._configuration.loop, loop)
+
+    def test_submit(self):
+        fut = self.client.submit("echo", [1])
+        self.assertEqual(fut.result(1), 1)
+        self.assertEqual(self.client.dispatch_request("echo", [2]), 2)
+
+        rv = []
+        call = self.client.dispatch_request
+        threads = [
+            threading.Thread(target=lambda i=i: rv.append(call("echo", [i]))) for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(rv), list(range(8)))
+
+    def test_timeout_cancel(self):
+        pool = self.client._pool
+        with self.assertRaises(FutureTimeoutError):
+            pool.dispatch_request(self.client._make_request("sleep", [3], False, False))
+        # the slot of max_inflight is released after the coroutine is cancelled
+        deadline = time.monotonic() + 1
+        while pool._pool.inflight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pool._pool.inflight, 0)
+        self.assertEqual(self.client.dispatch_request("echo", [1]), 1)
+
+    def test_cursor(self):
+        with self.client.dispatch_request("numbers", [25], cursor=True) as cursor:
+            self.assertEqual(cursor.fetch(), list(range(10)))
+            self.assertEqual(list(cursor), list(range(10, 25)))
+            self.assertTrue(cursor.done)
@@ -0,0 +1,57 @@
+import asyncio
+import socket
+import threading
+from functools import partial
+
+from dagger.client import ClientConfiguration
+from dagger.server import ServerConfiguration
+from dagger.server._protocol import DefaultServerProtocol
+
+
+class ServerThread:
+    """serve declares on a free local port in a background thread"""
+
+    def __init__(self, *declares):
+        self.loop = asyncio.new_event_loop()
+        self.configuration = ServerConfiguration()
+        self.configuration.loop = self.loop
+        self.configuration.register_declares(*declares)
+        self.state = self.configuration.server_state
+        self._listener = socket.socket()
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        self._server = None
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def client_configuration(self) -> ClientConfiguration:
+        configuration = ClientConfiguration()
+        configuration.port = self.port
+        return configuration
+
+    def __enter__(self):
+        factory = partial(DefaultServerProtocol, self.configuration)
+        self._server = self.loop.run_until_complete(
+            self.loop.create_server(factory, sock=self._listener)
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        tasks = []
+
+        def stop():
+            self._server.close()
+            for conn in list(self.state.connections):
+                tasks.extend(conn._running_tasks)
+                conn.close()
+            for task in tasks:
+                task.cancel()
+            self.loop.call_soon(self.loop.stop)
+
+        self.loop.call_soon_threadsafe(stop)
+        self._thread.join()
+        self.loop.run_until_complete(self._server.wait_closed())
+        if tasks:
+            self.loop.run_until_complete(asyncio.wait(tasks))
+        self.loop.close()
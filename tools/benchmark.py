@@ -111,7 +111,6 @@ def async_benchmark(concurrent, loop):
     configuration.host = "127.0.0.1"
     configuration.port = 10050
     configuration.asynchronous = True
-    configuration.pool_size = 120000
     configuration.register_declares_from_module("hello_world")
     client = Client()
     client.setup(configuration)
@@ -0,0 +1,104 @@
+"""Cost of idle connection tracking with many mostly idle connections.
+
+    python tools/idle_benchmark.py [connections] [active ratio]
+
+Compares the timing wheel of ``IdleTracker`` with scanning a dict of last active time.
+"""
+import os
+import random
+import sys
+import time
+
+if __name__ == "__main__":
+    # Make sure we could import dagger from project root path.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dagger.server import ServerConfiguration
+from dagger.server._idle import IdleTracker
+
+
+class FakeConnection:
+    __slots__ = ("active_tick", "closed")
+
+    def __init__(self):
+        self.active_tick = 0
+        self.closed = False
+
+    def is_busy(self):
+        return False
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+def bench_wheel(batches, active):
+    tracker = IdleTracker(ServerConfiguration())
+    touch = 0.0
+    turns = []
+    for batch in batches:
+        for conn in batch:
+            tracker.add(conn)
+        start = time.perf_counter()
+        for conn in active:
+            conn.active_tick = tracker.current
+        touch += time.perf_counter() - start
+        start = time.perf_counter()
+        tracker.turn()
+        turns.append(time.perf_counter() - start)
+    return touch, turns, tracker.closed
+
+
+def bench_scan(batches, active):
+    """the way before timing wheel, whole dict is walked once per max_idle_time"""
+    last_active = {}
+    touch = 0.0
+    turns = []
+    closed = 0
+    for i, batch in enumerate(batches):
+        now = i
+        for conn in batch:
+            last_active[conn] = now
+        start = time.perf_counter()
+        for conn in active:
+            last_active[conn] = time.time()
+        touch += time.perf_counter() - start
+        # time.time() above is only for the cost
+        for conn in active:
+            last_active[conn] = now
+        start = time.perf_counter()
+        if i % IdleTracker.resolution == IdleTracker.resolution - 1:
+            kept = {}
+            for conn, t in last_active.items():
+                if now - t >= IdleTracker.resolution:
+                    conn.close()
+                    closed += 1
+                else:
+                    kept[conn] = t
+            last_active = kept
+        turns.append(time.perf_counter() - start)
+    return touch, turns, closed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    ticks = IdleTracker.resolution * 4
+    print(f"connections: {n}, active: {ratio:.2%}, ticks: {ticks}")
+    for name, bench in (("timing wheel", bench_wheel), ("dict scan", bench_scan)):
+        # connections arrive evenly during the ticks
+        conns = [FakeConnection() for _ in range(n)]
+        batches = [conns[i::ticks] for i in range(ticks)]
+        active = random.sample(conns, int(n * ratio))
+        touch, turns, closed = bench(batches, active)
+        print(
+            f"{name:>12}: touch {touch / (len(active) * ticks) * 1e9:.0f} ns, "
+            f"max tick {max(turns) * 1e3:.2f} ms, total {sum(turns) * 1e3:.2f} ms, "
+            f"closed {closed}"
+        )
+
+
+if __name__ == "__main__":
+    main()